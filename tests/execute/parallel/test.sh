@@ -0,0 +1,29 @@
+#!/bin/bash
+# vim: dict+=/usr/share/beakerlib/dictionary.vim cpt=.,w,b,u,t,i,k
+. /usr/share/beakerlib/beakerlib.sh || exit 1
+
+rlJournalStart
+    rlPhaseStartSetup
+        rlRun "run=\$(mktemp -d)" 0 "Create run directory"
+        rlRun "pushd data"
+        rlRun "set -o pipefail"
+    rlPhaseEnd
+
+    rlPhaseStartTest "Parallel workers"
+        rlRun -s "tmt run -vvv --scratch -i $run" 0
+        rlAssertGrep "workers: 3" $rlRun_LOG
+        rlAssertGrep "3 tests passed" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartTest "Single worker"
+        rlRun -s "tmt run -a -vvv --scratch -i $run execute -h tmt --workers 1" 1
+        rlAssertGrep "workers: 1" $rlRun_LOG
+        # The last test finds markers left by the previous ones
+        rlAssertGrep "1 test passed and 2 tests failed" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartCleanup
+        rlRun "popd"
+        rlRun "rm -r $run" 0 "Remove run directory"
+    rlPhaseEnd
+rlJournalEnd
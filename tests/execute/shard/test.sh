@@ -0,0 +1,33 @@
+#!/bin/bash
+# vim: dict+=/usr/share/beakerlib/dictionary.vim cpt=.,w,b,u,t,i,k
+. /usr/share/beakerlib/beakerlib.sh || exit 1
+
+rlJournalStart
+    rlPhaseStartSetup
+        rlRun "run=\$(mktemp -d)" 0 "Create run directory"
+        rlRun "pushd data"
+        rlRun "set -o pipefail"
+    rlPhaseEnd
+
+    rlPhaseStartTest "All tests on each guest"
+        rlRun -s "tmt run -v --scratch -i $run plan -n /all"
+        rlAssertGrep "8 tests passed" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartTest "Tests split among guests"
+        rlRun -s "tmt run -v --scratch -i $run plan -n /shard"
+        rlAssertGrep "4 tests passed" $rlRun_LOG
+        rlAssertGrep "(on first)" $rlRun_LOG
+        rlAssertGrep "(on second)" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartTest "Option"
+        rlRun -s "tmt run -av --scratch -i $run plan -n /all execute -h tmt --shard"
+        rlAssertGrep "4 tests passed" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartCleanup
+        rlRun "popd"
+        rlRun "rm -r $run" 0 "Remove run directory"
+    rlPhaseEnd
+rlJournalEnd
@@ -0,0 +1,36 @@
+#!/bin/bash
+# vim: dict+=/usr/share/beakerlib/dictionary.vim cpt=.,w,b,u,t,i,k
+. /usr/share/beakerlib/beakerlib.sh || exit 1
+
+rlJournalStart
+    rlPhaseStartSetup
+        rlRun "run=\$(mktemp -d)" 0 "Create run directory"
+        rlRun "pushd data"
+        rlRun "set -o pipefail"
+    rlPhaseEnd
+
+    rlPhaseStartTest "Prepare during provision"
+        rlRun -s "tmt run -av --scratch -i $run --dag"
+        rlRun "sed -n '/provision$/,/prepare$/p' $rlRun_LOG > provision.log"
+        rlAssertEquals "Early phase run on both guests during provision" \
+            "$(grep -c 'name: early' provision.log)" "2"
+        rlAssertNotGrep "name: late" provision.log
+        rlAssertGrep "name: late" $rlRun_LOG
+        rlAssertGrep "name: multihost" $rlRun_LOG
+        rlAssertGrep "5 preparations applied" $rlRun_LOG
+        rlAssertGrep "2 tests passed" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartTest "Step by step by default"
+        rlRun -s "tmt run -av --scratch -i $run"
+        rlRun "sed -n '/provision$/,/prepare$/p' $rlRun_LOG > provision.log"
+        rlAssertNotGrep "name: early" provision.log
+        rlAssertGrep "5 preparations applied" $rlRun_LOG
+    rlPhaseEnd
+
+    rlPhaseStartCleanup
+        rlRun "rm -f provision.log"
+        rlRun "popd"
+        rlRun "rm -r $run" 0 "Remove run directory"
+    rlPhaseEnd
+rlJournalEnd
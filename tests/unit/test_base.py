@@ -46,6 +46,18 @@ def test_test_defaults(root_logger):
     assert test.tag == list()
 
 
+def test_test_unknown_keys(root_logger):
+    """ Just known keys with a dash are accepted """
+    test = tmt.Test.from_dict(
+        logger=root_logger,
+        mapping={'test': './test.sh', 'parallel-safe': True, 'real-duration': '5m'},
+        name='/smoke',
+        skip_validation=True)
+    assert test.parallel_safe is True
+    assert [message for _, message in test.lint_unknown_keys()] == [
+        'unknown key "real-duration" is used']
+
+
 def test_test_invalid(root_logger):
     """ Test invalid test """
     # Missing name
@@ -1,4 +1,5 @@
 import shutil
+import subprocess
 
 import pytest
 
@@ -104,3 +105,43 @@ def test_dependencies(root_logger):
     assert libraries[1].repo == Path('openssl')
     assert libraries[1].name == '/certgen'
     shutil.rmtree(parent.workdir)
+
+
+def _library_repository(path: Path, name: str, require: list) -> str:
+    """ Create a git repository with a single library requiring given items """
+    (path / name).mkdir(parents=True)
+    (path / '.fmf').mkdir()
+    (path / '.fmf' / 'version').write_text('1\n')
+    (path / name / 'main.fmf').write_text(tmt.utils.dict_to_yaml({'require': require}))
+    for command in [
+            ['git', 'init', '-q'],
+            ['git', 'add', '.'],
+            ['git', '-c', 'user.name=tmt', '-c', 'user.email=tmt@localhost',
+             'commit', '-q', '-m', 'Library']]:
+        subprocess.run(command, cwd=path, check=True)
+    return str(path)
+
+
+def test_dependencies_breadth_first(tmpdir, root_logger):
+    """ Libraries found on the same level are cloned together """
+    root = Path(tmpdir)
+    second = _library_repository(root / 'second', 'lib', ['wget'])
+    third = _library_repository(root / 'third', 'lib', ['curl'])
+    first = _library_repository(
+        root / 'first', 'lib', [{'url': second, 'name': '/lib'}, 'vim'])
+
+    parent = tmt.utils.Common(logger=root_logger, workdir=True)
+    requires, recommends, libraries = tmt.libraries.dependencies(
+        original_require=[
+            tmt.base.RequireFmfId(url=first, name='/lib'),
+            tmt.base.RequireFmfId(url=third, name='/lib'),
+            tmt.base.RequireSimple('tree')],
+        parent=parent,
+        logger=root_logger)
+
+    assert sorted(requires) == ['curl', 'tree', 'vim', 'wget']
+    assert recommends == []
+    # Libraries are reported depth-first
+    assert [str(library.repo) for library in libraries] == ['first', 'second', 'third']
+    assert all(library.ref == library.default_branch for library in libraries)
+    shutil.rmtree(parent.workdir)
@@ -0,0 +1,305 @@
+import concurrent.futures
+import functools
+import os
+import sys
+import threading
+import unittest.mock
+from typing import Iterator, List, Optional, Tuple
+
+import py.path
+import pytest
+
+import tmt
+import tmt.steps.execute
+import tmt.utils
+from tmt.log import Logger
+from tmt.result import Result, ResultGuestData
+from tmt.steps.execute import SCRIPTS_SRC_DIR, TMT_AGENT_SCRIPT
+from tmt.steps.execute.agent import Agent
+from tmt.steps.execute.internal import ExecuteInternal, PendingTests
+from tmt.utils import Command, Path, RunError, ShellScript
+
+
+def _tests(root_logger: Logger, parallel_safe: List[bool]) -> List[tmt.Test]:
+    return [
+        tmt.Test.from_dict(
+            logger=root_logger,
+            mapping={'test': './test.sh', 'parallel-safe': safe},
+            name=f'/test{index}',
+            skip_validation=True)
+        for index, safe in enumerate(parallel_safe)
+        ]
+
+
+def _names(batch: List[Tuple[int, tmt.Test]]) -> List[str]:
+    return [test.name for _, test in batch]
+
+
+def test_pending_tests_single_worker(root_logger: Logger) -> None:
+    pending = PendingTests(_tests(root_logger, [True, True, False]))
+
+    assert _names(pending.next_batch(1)) == ['/test0']
+    assert _names(pending.next_batch(1)) == ['/test1']
+    assert _names(pending.next_batch(1)) == ['/test2']
+    assert pending.next_batch(1) == []
+
+
+def test_pending_tests_parallel_batches(root_logger: Logger) -> None:
+    pending = PendingTests(_tests(root_logger, [True, True, False, True, True, True, True]))
+
+    assert [position for position, _ in pending.next_batch(4)] == [0, 1]
+    assert [position for position, _ in pending.next_batch(4)] == [2]
+    assert [position for position, _ in pending.next_batch(3)] == [3, 4, 5]
+    assert [position for position, _ in pending.next_batch(3)] == [6]
+    assert pending.next_batch(3) == []
+
+
+def test_pending_tests_shared_batches(root_logger: Logger) -> None:
+    """ Guests sharing the queue do not take more tests than their workers """
+    pending = PendingTests(_tests(root_logger, [True] * 5))
+
+    assert [position for position, _ in pending.next_batch(2)] == [0, 1]
+    assert [position for position, _ in pending.next_batch(2)] == [2, 3]
+    assert [position for position, _ in pending.next_batch(2)] == [4]
+
+
+def test_pending_tests_stop(root_logger: Logger) -> None:
+    pending = PendingTests(_tests(root_logger, [False, False]))
+
+    assert _names(pending.next_batch(1)) == ['/test0']
+    pending.stop()
+    assert pending.next_batch(1) == []
+
+
+def test_pull_guest_data_nested_names(root_logger: Logger) -> None:
+    """ Beakerlib backups are excluded for nested test names too """
+    beakerlib, shell = (
+        tmt.Test.from_dict(
+            logger=root_logger,
+            mapping={'test': './test.sh', 'framework': framework},
+            name=name,
+            skip_validation=True)
+        for name, framework in [('/tests/nested/foo', 'beakerlib'), ('/bar', 'shell')])
+    beakerlib.serialnumber, shell.serialnumber = 1, 2
+
+    plugin = unittest.mock.MagicMock()
+    plugin.step.workdir = Path('/run/plan/execute')
+    plugin.data_path = functools.partial(ExecuteInternal.data_path, plugin)
+    guest = unittest.mock.MagicMock()
+    guest.name = 'default-0'
+
+    ExecuteInternal._pull_guest_data(plugin, guest, [beakerlib, shell])
+
+    guest.pull.assert_called_once_with(
+        source=Path('/run/plan/execute/data/guest/default-0'),
+        extend_options=[
+            '--exclude', '/run/plan/execute/data/guest/default-0/tests/nested/foo-1/backup*'])
+
+
+def _journaled_test(name: str, serialnumber: int, url: str = 'https://example.com/tests'):
+    test = unittest.mock.MagicMock()
+    test.name = name
+    test.serialnumber = serialnumber
+    test.fmf_id.to_spec.return_value = {'url': url, 'name': name}
+    return test
+
+
+def test_resume_results() -> None:
+    """ Journaled results are matched by serial number, name and fmf id """
+    step = unittest.mock.MagicMock()
+    step._journal_lock = threading.Lock()
+    step._resumed_results = []
+
+    def entry(name: str, serialnumber: int, guest: str, test_name: Optional[str] = None):
+        return (
+            Result(name=name, serialnumber=serialnumber, guest=ResultGuestData(name=guest)),
+            {'url': 'https://example.com/tests', 'name': test_name or name})
+
+    step._journal = [
+        # Custom results are named after the test
+        entry('/test/custom/first', 1, 'foo', '/test/custom'),
+        entry('/test/custom/second', 1, 'foo', '/test/custom'),
+        entry('/other', 2, 'bar'),
+        # Discover has been run again, serial numbers belong to different tests
+        entry('/renamed', 3, 'foo'),
+        entry('/moved', 4, 'foo'),
+        ]
+
+    tests = [
+        _journaled_test('/test/custom', 1),
+        _journaled_test('/other', 2),
+        _journaled_test('/new', 3),
+        _journaled_test('/moved', 4, url='https://example.com/fork'),
+        ]
+    guest = unittest.mock.MagicMock()
+    guest.name = 'foo'
+
+    resumed = tmt.steps.execute.Execute.resume_results(step, tests, guest=guest)
+    assert [result.name for result in resumed] == ['/test/custom/first', '/test/custom/second']
+
+    # Results of all guests are reported for sharded tests, each just once
+    resumed = tmt.steps.execute.Execute.resume_results(step, tests)
+    assert [result.serialnumber for result in resumed] == [1, 1, 2]
+    assert [result.name for result in step._resumed_results] == [
+        '/test/custom/first', '/test/custom/second', '/other']
+
+
+def test_finished_tests() -> None:
+    """ Serial numbers of resumed tests are reported """
+    plugin = unittest.mock.MagicMock()
+    plugin.get.return_value = False
+    plugin.step = unittest.mock.MagicMock(spec=tmt.steps.execute.Execute)
+    plugin.step.resume_results.return_value = [
+        Result(name='/test/custom/first', serialnumber=1),
+        Result(name='/test/custom/second', serialnumber=1),
+        ]
+    guest = unittest.mock.MagicMock()
+    tests = [_journaled_test('/test/custom', 1)]
+
+    assert ExecuteInternal._finished_tests(plugin, tests, guest) == {1}
+    plugin.step.resume_results.assert_called_once_with(tests, guest=guest)
+
+
+def _pulled_tests(agent: bool) -> List[List[str]]:
+    """ Run two tests, the first one aborts, report pulled test data """
+    tests = [_journaled_test('/first', 1), _journaled_test('/second', 2)]
+    for test in tests:
+        test.framework = 'shell'
+    data = {'pull-batch': 0, 'workers': 1, 'exit-first': False}
+
+    plugin = unittest.mock.MagicMock()
+    plugin.get.side_effect = lambda key, default=None: data.get(key, default)
+    plugin.opt.return_value = 0
+    plugin.step = unittest.mock.MagicMock(spec=tmt.steps.execute.Execute)
+    plugin.step.plan = unittest.mock.MagicMock()
+    plugin._agents = {}
+    plugin._login_after_test = None
+    plugin._results = []
+    plugin._finished_tests.return_value = set()
+    plugin.prepare_tests.return_value = tests
+    plugin._test_queue.return_value = PendingTests(tests)
+    plugin._will_reboot.return_value = False
+    plugin._run_batch.side_effect = lambda batch, **kwargs: [
+        [Result(name=test.name, serialnumber=test.serialnumber)] for test in batch]
+    plugin.check_abort_file.return_value = True
+    if agent:
+        plugin._start_agent.side_effect = lambda guest, logger: plugin._agents.update(
+            {guest.name: unittest.mock.MagicMock()})
+
+    guest = unittest.mock.MagicMock()
+    guest.name = 'foo'
+    ExecuteInternal._run_tests(plugin, guest=guest, logger=unittest.mock.MagicMock())
+
+    return [
+        [test.name for test in call.args[1]]
+        for call in plugin._pull_guest_data.call_args_list]
+
+
+def test_pull_aborted_batch() -> None:
+    """ Data of tests executed before the execution stops are pulled """
+    assert _pulled_tests(agent=False) == [['/first']]
+
+
+def test_pull_agent_streamed() -> None:
+    """ Data streamed by the agent are not pulled again """
+    assert _pulled_tests(agent=True) == []
+
+
+class LocalAgent(Agent):
+    """ Agent running locally instead of on a guest """
+
+    def _command(self) -> Command:
+        return Command(sys.executable, str(SCRIPTS_SRC_DIR / TMT_AGENT_SCRIPT.path.name))
+
+
+@pytest.fixture(name='agent')
+def fixture_agent(root_logger: Logger) -> Iterator[Agent]:
+    guest = unittest.mock.MagicMock()
+    guest._prepare_environment.side_effect = lambda environment: environment or {}
+
+    agent = LocalAgent(guest=guest, logger=root_logger)
+    assert agent.start()
+
+    yield agent
+
+    agent.stop()
+    assert not agent.is_running
+
+
+def test_agent_execute(agent: Agent, tmpdir: py.path.local) -> None:
+    workdir = Path(tmpdir)
+    collect = workdir / 'data'
+    collect.mkdir()
+
+    output = agent.execute(
+        ShellScript('./wrapper.sh'),
+        cwd=workdir,
+        env={'FOO': 'bar'},
+        files={workdir / 'wrapper.sh': 'echo $FOO; echo log > data/log.txt'},
+        collect=collect)
+
+    assert output == 'bar\n'
+    assert (collect / 'log.txt').read_text() == 'log\n'
+
+
+def test_agent_failure(agent: Agent, tmpdir: py.path.local) -> None:
+    with pytest.raises(RunError) as error:
+        agent.execute(ShellScript('echo oops; exit 3'), cwd=Path(tmpdir))
+
+    assert error.value.returncode == 3
+    assert error.value.stdout == 'oops\n'
+
+
+def test_agent_timeout(agent: Agent, tmpdir: py.path.local) -> None:
+    with pytest.raises(RunError) as error:
+        agent.execute(ShellScript('sleep 10'), cwd=Path(tmpdir), timeout=1)
+
+    assert error.value.returncode == tmt.utils.PROCESS_TIMEOUT
+
+
+def test_agent_concurrent_jobs(agent: Agent, tmpdir: py.path.local) -> None:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(
+                agent.execute, ShellScript(f'sleep 1; echo {index}'), cwd=Path(tmpdir))
+            for index in range(4)
+            ]
+
+        assert [future.result() for future in futures] == ['0\n', '1\n', '2\n', '3\n']
+
+
+def test_agent_collect_changed(agent: Agent, tmpdir: py.path.local) -> None:
+    workdir = Path(tmpdir)
+    collect = workdir / 'data'
+    collect.mkdir()
+    (collect / 'old.txt').write_text('old')
+    os.utime(collect / 'old.txt', (0, 0))
+
+    with unittest.mock.patch.object(agent, '_store', wraps=agent._store) as store:
+        agent.execute(
+            ShellScript(
+                'mkdir data/logs; echo new > data/logs/new.txt; '
+                'ln -s logs/new.txt data/inside; ln -s /etc/passwd data/outside'),
+            cwd=workdir,
+            collect=collect)
+
+    # Unchanged files and links pointing outside are not sent
+    assert sorted(
+        call[0][0].get('file') or call[0][0].get('link') or call[0][0].get('directory')
+        for call in store.call_args_list) == ['inside', 'logs', 'logs/new.txt']
+
+
+def test_agent_store(agent: Agent, tmpdir: py.path.local) -> None:
+    destination = Path(tmpdir)
+
+    agent._store({'file': 'log', 'mode': 0o444, 'offset': 0, 'data': 'Zm9v'}, destination)
+    agent._store({'file': 'log', 'mode': 0o444, 'offset': 3, 'data': 'YmFy'}, destination)
+    agent._store({'link': 'link', 'target': 'log'}, destination)
+    agent._store({'link': 'escape', 'target': '../log'}, destination)
+    agent._store({'file': '../escape', 'mode': 0o644, 'offset': 0, 'data': ''}, destination)
+
+    assert (destination / 'log').read_text() == 'foobar'
+    assert (destination / 'log').stat().st_mode & 0o777 == 0o444
+    assert os.readlink(destination / 'link') == 'log'
+    assert not (destination / 'escape').is_symlink()
+    assert not (destination.parent / 'escape').exists()
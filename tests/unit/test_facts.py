@@ -0,0 +1,61 @@
+import subprocess
+from typing import List, Union
+
+from tmt.steps.provision import GuestFacts
+from tmt.utils import Command, CommandOutput, RunError, ShellScript
+
+
+class LocalGuest:
+    """ Run commands locally, remember them """
+
+    name = 'local'
+
+    def __init__(self) -> None:
+        self.commands: List[str] = []
+
+    def debug(self, *args, **kwargs) -> None:
+        pass
+
+    def execute(self, command: Union[Command, ShellScript], silent: bool = False) -> CommandOutput:
+        self.commands.append(str(command))
+
+        script = command.to_element() if isinstance(command, ShellScript) else str(command)
+        process = subprocess.run(
+            ['bash', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.stdout.decode(), process.stderr.decode()
+
+        if process.returncode != 0:
+            raise RunError('failed', Command('bash'), process.returncode, stdout, stderr)
+
+        return CommandOutput(stdout, stderr)
+
+
+def test_sync_single_round_trip():
+    guest = LocalGuest()
+    facts = GuestFacts()
+    facts.sync(guest)
+
+    assert len(guest.commands) == 1
+    assert facts.in_sync
+    assert facts.arch == subprocess.check_output(['arch']).decode().strip()
+    assert facts.kernel_release == subprocess.check_output(['uname', '-r']).decode().strip()
+
+
+def test_sync_fallback():
+    guest = LocalGuest()
+    facts = GuestFacts()
+    facts.sync(guest)
+
+    class BrokenProbeGuest(LocalGuest):
+        def execute(self, command, silent=False):
+            if isinstance(command, ShellScript):
+                raise RunError('failed', Command('bash'), 1, '', '')
+            return super().execute(command, silent=silent)
+
+    # Facts are collected command by command when the probe fails
+    fallback_guest = BrokenProbeGuest()
+    fallback_facts = GuestFacts()
+    fallback_facts.sync(fallback_guest)
+
+    assert len(fallback_guest.commands) > 1
+    assert fallback_facts.to_dict() == facts.to_dict()
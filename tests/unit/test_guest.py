@@ -1,5 +1,15 @@
+import os
+import socket
+import threading
+import types
+from typing import Any, List
+
+import py.path
+
 from tmt.log import Logger
-from tmt.steps.provision import Guest, GuestData
+from tmt.steps.provision import (Guest, GuestData, GuestSsh, GuestSshData,
+                                 manifest_changes, tree_manifest)
+from tmt.utils import Command, CommandOutput, Path
 
 
 def test_multihost_name(root_logger: Logger) -> None:
@@ -12,3 +22,152 @@ def test_multihost_name(root_logger: Logger) -> None:
         logger=root_logger,
         name='foo',
         data=GuestData(guest='bar', role='client')).multihost_name == 'foo (client)'
+
+
+def test_bind_prepare_fingerprint(root_logger: Logger) -> None:
+    def bound(image: str) -> str:
+        guest = Guest(
+            logger=root_logger,
+            name='foo',
+            data=GuestData(guest='bar', prepare_fingerprint='abc'))
+        guest.bind_prepare_fingerprint(image)
+        assert guest.prepare_fingerprint is not None  # narrow type
+        return guest.prepare_fingerprint
+
+    assert bound('one') == bound('one')
+    assert bound('one') != bound('two')
+    assert bound('one') != 'abc'
+
+
+def test_ssh_port_probe(root_logger: Logger) -> None:
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    port = server.getsockname()[1]
+
+    guest = GuestSsh(
+        logger=root_logger,
+        name='foo',
+        data=GuestSshData(guest='127.0.0.1', port=port))
+
+    def greet(banner: bytes) -> None:
+        connection, _ = server.accept()
+        connection.sendall(banner)
+        connection.close()
+
+    # Accepted connection is not enough, sshd has to greet us
+    thread = threading.Thread(target=greet, args=(b'',))
+    thread.start()
+    assert guest.is_reachable() is False
+    thread.join()
+
+    thread = threading.Thread(target=greet, args=(b'SSH-2.0-OpenSSH_9.0\r\n',))
+    thread.start()
+    assert guest.is_reachable() is True
+    thread.join()
+
+    # Nobody listens anymore
+    server.close()
+    assert guest.is_reachable() is False
+
+    # Connections through a proxy are not probed
+    guest.ssh_option = ['ProxyJump=bastion']
+    assert guest.is_reachable() is True
+
+
+def test_ssh_port_probe_reconnect(root_logger: Logger) -> None:
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+
+    guest = GuestSsh(
+        logger=root_logger,
+        name='foo',
+        data=GuestSshData(guest='127.0.0.1', port=port))
+
+    # Nothing answers on the port, but logging in works, e.g. through
+    # a proxy configured in the ssh configuration
+    commands: List[str] = []
+
+    def execute(command: Command, **kwargs: Any) -> CommandOutput:
+        commands.append(str(command))
+        return CommandOutput('root', '')
+
+    guest.execute = execute  # type: ignore[assignment]
+    assert guest.reconnect(timeout=1) is True
+    assert guest._ssh_port_probe is False
+    assert commands == ['whoami', 'whoami']
+    assert guest.is_reachable() is True
+
+
+def test_push_manifest(tmpdir: py.path.local) -> None:
+    root = Path(tmpdir)
+    (root / 'tests').mkdir()
+    (root / 'tests' / 'test.sh').write_text('true')
+    (root / 'data').symlink_to('tests')
+
+    previous = tree_manifest(root)
+    assert manifest_changes(previous, tree_manifest(root)) == []
+
+    # New and modified files are pushed, together with new directories
+    (root / 'tests' / 'test.sh').write_text('false')
+    (root / 'results').mkdir()
+    (root / 'results' / 'output.txt').write_text('output')
+
+    assert manifest_changes(previous, tree_manifest(root)) == [
+        os.path.join(root, 'results'),
+        os.path.join(root, 'results', 'output.txt'),
+        os.path.join(root, 'tests', 'test.sh'),
+        ]
+
+    # Removed paths or paths changing their type need a full sync
+    previous = tree_manifest(root)
+    (root / 'data').unlink()
+    (root / 'data').mkdir()
+    assert manifest_changes(previous, tree_manifest(root)) is None
+
+    previous = tree_manifest(root)
+    (root / 'results' / 'output.txt').unlink()
+    assert manifest_changes(previous, tree_manifest(root)) is None
+
+    # Manifests kept inside the pushed tree do not count as changes
+    (root / 'provision' / '.push').mkdir(parents=True)
+    previous = tree_manifest(root, exclude=root / 'provision' / '.push')
+    (root / 'provision' / '.push' / 'default-0.json').write_text('{}')
+    assert manifest_changes(
+        previous, tree_manifest(root, exclude=root / 'provision' / '.push')) == []
+    assert os.path.join(root, 'provision') in previous
+
+
+def test_testcloud_reset(tmpdir: py.path.local, root_logger: Logger) -> None:
+    from tmt.steps.provision.testcloud import (GuestTestcloud,
+                                               TestcloudGuestData)
+
+    disk = Path(str(tmpdir)) / 'tmt-123-abcdef-local.qcow2'
+    disk.write_text('fresh')
+
+    guest = GuestTestcloud(
+        logger=root_logger,
+        name='foo',
+        data=TestcloudGuestData(guest='127.0.0.1', pool_key='key', image='file:///image'))
+    guest._instance = types.SimpleNamespace(local_disk=str(disk))
+    events: List[str] = []
+    guest._shut_down = lambda: events.append('down')  # type: ignore[assignment]
+    guest._boot_again = lambda: events.append('up')  # type: ignore[assignment]
+
+    # Nothing to revert to before the clean disk is saved
+    assert guest.reset() is False
+
+    guest._save_clean_disk()
+    disk.write_text('dirty')
+
+    assert guest.reset() is True
+    assert disk.read_text() == 'fresh'
+    assert events == ['down', 'up']
+
+    # Guests booted from a prepared snapshot are not clean
+    guest._clean_disk.unlink()  # type: ignore[union-attr]
+    guest.prepared = True
+    guest._save_clean_disk()
+    assert guest.reset() is False
@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import http.server
+import os
+import threading
+from typing import Generator
+
+import py.path
+import pytest
+
+import tmt.utils
+from tmt.log import Logger
+from tmt.steps.provision.images import ImageCache
+from tmt.utils import Path
+
+IMAGE = b'qcow2' * 1000
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """ Serve files, support simple range requests """
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return
+
+        content = path.read_bytes()
+        offset = 0
+        if self.headers.get('Range'):
+            offset = int(self.headers['Range'][len('bytes='):].rstrip('-'))
+            self.send_response(206)
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(content) - offset))
+        self.end_headers()
+        self.wfile.write(content[offset:])
+
+
+@pytest.fixture(name='server')
+def fixture_server(tmpdir: py.path.local) -> Generator[str, None, None]:
+    root = Path(tmpdir) / 'server'
+    root.mkdir()
+    (root / 'fedora.qcow2').write_bytes(IMAGE)
+    (root / 'fedora-copy.qcow2').write_bytes(IMAGE)
+    (root / 'centos.qcow2').write_bytes(b'centos' * 1000)
+
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0),
+        functools.partial(RangeRequestHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+
+    server.shutdown()
+
+
+@pytest.fixture(name='cache')
+def fixture_cache(tmpdir: py.path.local, root_logger: Logger) -> ImageCache:
+    return ImageCache(
+        path=Path(tmpdir) / 'cache',
+        links=Path(tmpdir) / 'images',
+        logger=root_logger)
+
+
+def test_fetch(cache: ImageCache, server: str) -> None:
+    link = cache.fetch(f'{server}/fedora.qcow2', 'fedora.qcow2')
+
+    assert link == cache.links / 'fedora.qcow2'
+    assert link.read_bytes() == IMAGE
+    assert Path(os.readlink(link)).name == hashlib.sha256(IMAGE).hexdigest()
+
+    # Identical content is stored just once
+    cache.fetch(f'{server}/fedora-copy.qcow2', 'fedora-copy.qcow2')
+    assert len(cache.entries()) == 1
+
+
+def test_checksum(cache: ImageCache, server: str) -> None:
+    digest = hashlib.sha256(IMAGE).hexdigest()
+    cache.fetch(f'{server}/fedora.qcow2', 'fedora.qcow2', checksum=f'sha256:{digest}')
+
+    with pytest.raises(tmt.utils.GeneralError, match='does not match'):
+        cache.fetch(f'{server}/centos.qcow2', 'centos.qcow2', checksum=digest)
+
+    assert not (cache.links / 'centos.qcow2').exists()
+    assert not list(cache.partial.iterdir())
+
+
+def test_resume(cache: ImageCache, server: str) -> None:
+    url = f'{server}/fedora.qcow2'
+
+    # Leave a partial download behind
+    cache.partial.mkdir(parents=True)
+    (cache.partial / hashlib.sha256(url.encode('utf-8')).hexdigest()).write_bytes(IMAGE[:1234])
+
+    link = cache.fetch(url, 'fedora.qcow2', checksum=hashlib.sha256(IMAGE).hexdigest())
+    assert link.read_bytes() == IMAGE
+
+
+def test_evict(cache: ImageCache, server: str) -> None:
+    cache.budget = len(IMAGE) + 1
+
+    cache.fetch(f'{server}/fedora.qcow2', 'fedora.qcow2')
+    centos = cache.fetch(f'{server}/centos.qcow2', 'centos.qcow2')
+
+    # The least recently used image is gone, together with its link
+    assert [blob.read_bytes() for blob in cache.entries()] == [centos.read_bytes()]
+    assert not (cache.links / 'fedora.qcow2').is_symlink()
+
+
+def test_evict_pinned(cache: ImageCache, server: str, tmpdir: py.path.local) -> None:
+    # Enough for any of the images, but not for both of them
+    cache.budget = len(IMAGE) * 2
+
+    cache.fetch(f'{server}/fedora.qcow2', 'fedora.qcow2')
+    overlay = Path(tmpdir) / 'overlay.qcow2'
+    overlay.write_text('backed by fedora')
+    cache.pin('fedora.qcow2', overlay)
+
+    # The image backing an existing overlay is kept
+    cache.fetch(f'{server}/centos.qcow2', 'centos.qcow2')
+    assert (cache.links / 'fedora.qcow2').read_bytes() == IMAGE
+
+    # Once the overlay is gone, the pin is dropped
+    overlay.unlink()
+    assert [blob.name for blob in cache.evict()] \
+        == [hashlib.sha256(IMAGE).hexdigest()]
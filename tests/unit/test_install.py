@@ -0,0 +1,245 @@
+import os
+import types
+import unittest.mock
+from typing import Any, Dict, List
+
+import py.path
+import pytest
+
+import tmt.steps.prepare
+from tmt.log import Logger
+from tmt.steps.prepare import Prepare
+from tmt.steps.prepare.install import (DEFAULT_PACKAGE_CACHE_SIZE,
+                                       PACKAGE_CACHE_SIZE_VARIABLE, InstallDnf,
+                                       PackageCache, PrepareInstall, rpm_name)
+from tmt.utils import Command, CommandOutput, Path, RunError
+
+
+def test_package_cache_evict(tmpdir: py.path.local, root_logger: Logger) -> None:
+    guest = types.SimpleNamespace(
+        facts=types.SimpleNamespace(distro='Fedora Linux 38 (Cloud Edition)', arch='x86_64'))
+
+    cache = PackageCache(
+        guest=guest,  # type: ignore[arg-type]
+        path=Path(tmpdir),
+        budget=350,
+        logger=root_logger)
+
+    assert cache.key == 'Fedora-Linux-38-Cloud-Edition-x86_64'
+
+    packages = cache.local / 'fedora-abcdef' / 'packages'
+    packages.mkdir(parents=True)
+    for age, name in enumerate(['new', 'middle', 'old']):
+        package = packages / f'{name}-1.0-1.fc38.noarch.rpm'
+        package.write_bytes(b'x' * 100)
+        os.utime(package, (1000 - age, 1000 - age))
+
+    # Metadata count as well, the oldest packages go first
+    (cache.local / 'fedora-abcdef' / 'repodata').mkdir()
+    (cache.local / 'fedora-abcdef' / 'repodata' / 'primary.xml').write_bytes(b'x' * 100)
+    (cache.local / 'fedora.solv').write_bytes(b'x' * 50)
+
+    assert [package.name for package in cache._evict()] == ['old-1.0-1.fc38.noarch.rpm']
+    assert [package.name for package in cache.packages()] == [
+        'middle-1.0-1.fc38.noarch.rpm', 'new-1.0-1.fc38.noarch.rpm']
+
+    # Metadata go once there are no packages left
+    os.utime(cache.local / 'fedora.solv', (0, 0))
+    cache.budget = 50
+    assert [path.name for path in cache._evict()] == [
+        'middle-1.0-1.fc38.noarch.rpm', 'new-1.0-1.fc38.noarch.rpm', 'fedora.solv',
+        'fedora-abcdef']
+    assert cache.metadata() == []
+
+
+def test_package_cache_budget(
+        tmpdir: py.path.local, root_logger: Logger, monkeypatch: pytest.MonkeyPatch) -> None:
+    guest = types.SimpleNamespace(facts=types.SimpleNamespace(distro=None, arch=None))
+
+    monkeypatch.delenv(PACKAGE_CACHE_SIZE_VARIABLE, raising=False)
+    assert PackageCache(
+        guest=guest,  # type: ignore[arg-type]
+        path=Path(tmpdir),
+        logger=root_logger).budget == DEFAULT_PACKAGE_CACHE_SIZE
+
+    monkeypatch.setenv(PACKAGE_CACHE_SIZE_VARIABLE, '1000')
+    assert PackageCache(
+        guest=guest,  # type: ignore[arg-type]
+        path=Path(tmpdir),
+        logger=root_logger).budget == 1000
+
+
+def test_package_cache_path(
+        tmpdir: py.path.local, root_logger: Logger, monkeypatch: pytest.MonkeyPatch) -> None:
+    guest = types.SimpleNamespace(facts=types.SimpleNamespace(distro=None, arch=None))
+
+    # Workdir root is looked up when the cache is created
+    monkeypatch.setenv('TMT_WORKDIR_ROOT', str(tmpdir))
+    assert PackageCache(
+        guest=guest,  # type: ignore[arg-type]
+        logger=root_logger).path == Path(tmpdir) / 'package-cache'
+
+
+def test_package_cache_push(tmpdir: py.path.local, root_logger: Logger) -> None:
+    pushed: List[List[str]] = []
+
+    def push(source: Path, destination: Path, options: List[str]) -> None:
+        files_from = [option for option in options if option.startswith('--files-from=')]
+        if files_from:
+            pushed.append(Path(files_from[0].split('=', 1)[1]).read_text().split())
+        else:
+            pushed.append(options)
+
+    guest = types.SimpleNamespace(
+        facts=types.SimpleNamespace(distro='Fedora', arch='x86_64'),
+        execute=lambda *args, **kwargs: None,
+        push=push)
+
+    cache = PackageCache(
+        guest=guest,  # type: ignore[arg-type]
+        path=Path(tmpdir),
+        logger=root_logger)
+
+    packages = cache.local / 'fedora-abcdef' / 'packages'
+    packages.mkdir(parents=True)
+    for name in ['httpd-2.4.57-1.fc38.x86_64.rpm', 'httpd-tools-2.4.57-1.fc38.x86_64.rpm']:
+        (packages / name).write_bytes(b'x')
+
+    # Metadata first, then just cached packages to be installed
+    cache.push(['httpd', 'vim'])
+    assert '--exclude=*.rpm' in pushed[0]
+    assert pushed[1] == ['fedora-abcdef/packages/httpd-2.4.57-1.fc38.x86_64.rpm']
+
+    pushed.clear()
+    cache.push(['vim'])
+    assert len(pushed) == 1
+
+
+def test_rpm_name() -> None:
+    assert rpm_name('python3-libs-3.11.4-1.fc38.x86_64.rpm') == 'python3-libs'
+    assert rpm_name('tmt-1.25.0-1.fc38.noarch.rpm') == 'tmt'
+
+
+def test_referenced_files(tmpdir: py.path.local) -> None:
+    root = Path(str(tmpdir)).resolve()
+    (root / 'setup').mkdir()
+    (root / 'setup' / 'playbook.yml').write_text('- hosts: all')
+    (root / 'script.sh').write_text('true')
+
+    data = {
+        'script': ['bash script.sh --verbose'],
+        'playbook': ['setup/playbook.yml', 'https://example.com/playbook.yml'],
+        'package': ['missing', '../outside']
+        }
+
+    digests = Prepare._referenced_files(data, root)
+    assert sorted(digests) == ['script.sh', 'setup/playbook.yml']
+
+    # Content changes show up in digests
+    (root / 'script.sh').write_text('false')
+    assert Prepare._referenced_files(data, root)['script.sh'] != digests['script.sh']
+
+
+def _install_phase(enabled: bool = True, **data: Any) -> unittest.mock.MagicMock:
+    phase = unittest.mock.MagicMock(spec=PrepareInstall)
+    phase.step = unittest.mock.MagicMock()
+    phase.get.side_effect = lambda key, default=None: data.get(key, default)
+    phase.enabled_on_guest.return_value = enabled
+    return phase
+
+
+def _coalesced(*phases: unittest.mock.MagicMock) -> List[str]:
+    phases[0].step.phases.return_value = list(phases)
+    return PrepareInstall.coalesced_packages(phases[0], unittest.mock.MagicMock())
+
+
+def test_coalesced_packages() -> None:
+    # Packages of following phases are collected, disabled phases skipped
+    assert _coalesced(
+        _install_phase(package=['httpd']),
+        _install_phase(package=['httpd', 'vim']),
+        _install_phase(enabled=False, package=['nginx']),
+        _install_phase(package=['/usr/bin/git', 'vim'])) == ['vim', '/usr/bin/git']
+
+    # Different repositories or settings stop the coalescing
+    stops: List[Dict[str, Any]] = [
+        {'copr': 'psss/tmt'},
+        {'directory': ['tmp/RPMS']},
+        {'exclude': ['vim-minimal']},
+        {'package-cache': True},
+        ]
+    for data in stops:
+        assert _coalesced(
+            _install_phase(package=['httpd']),
+            _install_phase(package=['vim']),
+            _install_phase(package=['git'], **data),
+            _install_phase(package=['nginx'])) == ['vim'], data
+
+    # Same settings are fine
+    assert _coalesced(
+        _install_phase(package=['httpd'], exclude=['vim-minimal'], **{'package-cache': True}),
+        _install_phase(package=['vim'], exclude=['vim-minimal'], **{'package-cache': True}),
+        ) == ['vim']
+
+    # Packages not coming from a repository stop the coalescing
+    for package in ['tmt-1.0-1.fc38.noarch.rpm', 'https://example.com/tmt.rpm', 'tmt-debuginfo']:
+        assert _coalesced(
+            _install_phase(package=['httpd']),
+            _install_phase(package=['vim', package]),
+            _install_phase(package=['git'])) == [], package
+
+    # So do other prepare phases
+    other = unittest.mock.MagicMock(spec=tmt.steps.prepare.PreparePlugin)
+    other.enabled_on_guest.return_value = True
+    assert _coalesced(
+        _install_phase(package=['httpd']),
+        other,
+        _install_phase(package=['vim'])) == []
+
+
+def test_install_coalesced_packages() -> None:
+    installer = unittest.mock.MagicMock(spec=InstallDnf)
+    installer.skip_missing = False
+    installer.repository_packages = ['httpd', 'git']
+    installer.coalesced_packages = ['vim', 'nginx']
+    # Everything but git is missing, httpd did not make it in the coalesced transaction
+    installer.missing_packages.side_effect = [['httpd', 'vim', 'nginx'], ['httpd']]
+
+    InstallDnf.install_from_repository(installer)
+
+    # Packages of following phases must not fail the transaction
+    installer.perform_operation.assert_called_once()
+    subcommand, packages = installer.perform_operation.call_args[0]
+    assert subcommand.to_popen() == ['install']
+    assert packages.to_popen() == ['--skip-broken', 'httpd', 'vim', 'nginx']
+    installer.missing_packages.assert_called_with(['httpd'])
+    # Own packages still missing are installed again to report the failure
+    installer.install_packages.assert_called_once_with(['httpd'])
+
+    # A failed coalesced transaction is not fatal either
+    installer.reset_mock()
+    installer.missing_packages.side_effect = [['httpd', 'vim'], []]
+    installer.perform_operation.side_effect = RunError('failed', Command('dnf'), 1)
+
+    InstallDnf.install_from_repository(installer)
+    installer.install_packages.assert_not_called()
+
+
+def test_missing_packages() -> None:
+    installer = unittest.mock.MagicMock(spec=InstallDnf)
+    installer.guest = unittest.mock.MagicMock()
+    installer.guest.execute.return_value = CommandOutput(
+        stdout='installed httpd\nmissing vim\ninstalled /usr/bin/git\nmissing nginx\n',
+        stderr=None)
+
+    packages = ['vim', 'httpd', 'nginx', '/usr/bin/git']
+    assert InstallDnf.missing_packages(installer, packages) == ['vim', 'nginx']
+
+    # All packages are checked by a single command
+    installer.guest.execute.assert_called_once()
+    script = str(installer.guest.execute.call_args[0][0])
+    assert all(package in script for package in packages)
+
+    # Everything is considered missing if the check fails
+    installer.guest.execute.side_effect = RunError('failed', Command('rpm'), 1)
+    assert InstallDnf.missing_packages(installer, packages) == packages
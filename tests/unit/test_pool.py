@@ -0,0 +1,116 @@
+import os
+import subprocess
+
+import py.path
+import pytest
+
+import tmt.utils
+from tmt.log import Logger
+from tmt.steps.provision.pool import (POOL_ENTRY_FILENAME, STATE_BUSY,
+                                      STATE_IDLE, GuestPool)
+from tmt.utils import Path
+
+
+@pytest.fixture(name='pool')
+def fixture_pool(tmpdir: py.path.local, root_logger: Logger) -> GuestPool:
+    return GuestPool(path=Path(tmpdir) / 'pool', logger=root_logger)
+
+
+def test_key():
+    assert GuestPool.key(image='fedora', arch='x86_64') \
+        == GuestPool.key(arch='x86_64', image='fedora')
+    assert GuestPool.key(image='fedora', arch='x86_64') \
+        != GuestPool.key(image='fedora', arch='aarch64')
+
+
+def test_checkout_checkin(pool: GuestPool, tmpdir: py.path.local):
+    key = GuestPool.key(image='fedora')
+
+    # Nothing to check out from an empty pool
+    assert pool.checkout(key) is None
+
+    private_key = Path(tmpdir) / 'id_ecdsa'
+    private_key.write_text('secret')
+
+    entry = pool.checkin(key, {'guest': '10.0.0.1'}, files=[private_key])
+    assert entry.state == STATE_IDLE
+    assert (entry.path / 'id_ecdsa').read_text() == 'secret'
+
+    # Guests of a different kind are not handed out
+    assert pool.checkout(GuestPool.key(image='centos')) is None
+
+    checked_out = pool.checkout(key)
+    assert checked_out is not None
+    assert checked_out.path == entry.path
+    assert checked_out.state == STATE_BUSY
+    assert checked_out.guest == {'guest': '10.0.0.1'}
+
+    # A busy guest is not handed out twice
+    assert pool.checkout(key) is None
+
+    # Returning the guest keeps its entry
+    returned = pool.checkin(key, {'guest': '10.0.0.2'}, path=checked_out.path)
+    assert returned.path == entry.path
+    assert [entry.guest for entry in pool.entries()] == [{'guest': '10.0.0.2'}]
+
+
+def test_checkout_oldest(pool: GuestPool):
+    key = GuestPool.key(image='fedora')
+
+    first = pool.checkin(key, {'guest': 'first'})
+    pool.checkin(key, {'guest': 'second'})
+
+    checked_out = pool.checkout(key)
+    assert checked_out is not None
+    assert checked_out.path == first.path
+
+
+def test_discard(pool: GuestPool):
+    key = GuestPool.key(image='fedora')
+
+    entry = pool.checkin(key, {'guest': '10.0.0.1'})
+    pool.discard(entry.path)
+
+    assert not entry.path.exists()
+    assert pool.entries() == []
+    assert pool.checkout(key) is None
+
+
+def test_checkout_expired(pool: GuestPool):
+    key = GuestPool.key(image='fedora')
+
+    entry = pool.checkin(key, {'guest': '10.0.0.1'})
+
+    # The guest has been waiting in the pool for ages
+    entry_file = entry.path / POOL_ENTRY_FILENAME
+    data = tmt.utils.yaml_to_dict(entry_file.read_text())
+    data['updated'] = '2000-01-01T00:00:00+00:00'
+    entry_file.write_text(tmt.utils.dict_to_yaml(data))
+
+    checked_out = pool.checkout(key)
+    assert checked_out is not None
+    assert checked_out.expired
+    assert checked_out.owner == os.getpid()
+
+
+def test_checkout_abandoned(pool: GuestPool):
+    key = GuestPool.key(image='fedora')
+    pool.checkin(key, {'guest': '10.0.0.1'})
+
+    checked_out = pool.checkout(key)
+    assert checked_out is not None
+    assert not checked_out.expired
+
+    # The guest is still used by a living process
+    assert pool.checkout(key) is None
+
+    # The process which checked the guest out is gone
+    process = subprocess.Popen(['true'])
+    process.wait()
+    checked_out.owner = process.pid
+    checked_out.save()
+
+    reclaimed = pool.checkout(key)
+    assert reclaimed is not None
+    assert reclaimed.path == checked_out.path
+    assert reclaimed.expired
@@ -0,0 +1,174 @@
+import dataclasses
+import threading
+import time
+from typing import List, Tuple
+
+import pytest
+
+from tmt.log import Logger
+from tmt.queue import GuestlessTask, Queue, Task
+
+
+class FakeGuest:
+    def __init__(self, name: str, logger: Logger) -> None:
+        self.name = name
+        self.multihost_name = name
+        self._logger = logger
+
+    def inject_logger(self, logger: Logger) -> None:
+        self._logger = logger
+
+
+# Shared record of (event, task, guest) tuples
+Events = List[Tuple[str, str, str]]
+
+
+@dataclasses.dataclass
+class SleepTask(Task):
+    label: str
+    events: Events
+    durations: dict
+    fail_on: str = ''
+
+    @property
+    def name(self) -> str:
+        return self.label
+
+    def run_on_guest(self, guest, logger) -> None:
+        self.events.append(('start', self.label, guest.name))
+        time.sleep(self.durations.get(guest.name, 0))
+        self.events.append(('end', self.label, guest.name))
+
+        if guest.name == self.fail_on:
+            raise Exception(f'{self.label} failed on {guest.name}')
+
+
+@dataclasses.dataclass
+class BarrierTask(GuestlessTask):
+    label: str
+    events: Events
+
+    @property
+    def name(self) -> str:
+        return self.label
+
+    def run(self, logger) -> None:
+        self.events.append(('start', self.label, ''))
+        self.events.append(('end', self.label, ''))
+
+
+@pytest.fixture(name='guests')
+def fixture_guests(root_logger):
+    return [FakeGuest('fast', root_logger), FakeGuest('slow', root_logger)]
+
+
+def test_pipelined_guests(root_logger, guests):
+    events: Events = []
+    durations = {'fast': 0, 'slow': 0.5}
+
+    queue = Queue('test', root_logger, pipeline=True)
+    for label in ('one', 'two', 'three'):
+        queue.enqueue_task(SleepTask(
+            guests=guests, logger=root_logger, label=label, events=events, durations=durations))
+
+    outcomes = list(queue.run())
+
+    assert len(outcomes) == 6
+    assert all(outcome.exc is None for outcome in outcomes)
+
+    # The fast guest does not wait for the slow one...
+    assert events.index(('end', 'three', 'fast')) < events.index(('end', 'one', 'slow'))
+
+    # ... but each guest runs tasks in their order
+    for guest in ('fast', 'slow'):
+        assert [event for event in events if event[2] == guest] == [
+            (kind, label, guest)
+            for label in ('one', 'two', 'three')
+            for kind in ('start', 'end')
+            ]
+
+
+def test_guests_together(root_logger, guests):
+    events: Events = []
+    durations = {'fast': 0, 'slow': 0.2}
+
+    queue = Queue('test', root_logger)
+    for label in ('one', 'two'):
+        queue.enqueue_task(SleepTask(
+            guests=guests, logger=root_logger, label=label, events=events, durations=durations))
+
+    assert len(list(queue.run())) == 4
+
+    # Without pipelining, the next task waits for all guests
+    assert events.index(('end', 'one', 'slow')) < events.index(('start', 'two', 'fast'))
+
+
+def test_barrier(root_logger, guests):
+    events: Events = []
+    durations = {'fast': 0, 'slow': 0.2}
+
+    queue = Queue('test', root_logger, pipeline=True)
+    queue.enqueue_task(SleepTask(
+        guests=guests, logger=root_logger, label='one', events=events, durations=durations))
+    queue.enqueue_task(BarrierTask(
+        guests=guests, logger=root_logger, label='barrier', events=events))
+    queue.enqueue_task(SleepTask(
+        guests=guests, logger=root_logger, label='two', events=events, durations=durations))
+
+    list(queue.run())
+
+    barrier = events.index(('start', 'barrier', ''))
+    assert events.index(('end', 'one', 'slow')) < barrier
+    assert events.index(('start', 'two', 'fast')) > barrier
+
+
+def test_max_workers(root_logger):
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    @dataclasses.dataclass
+    class CountingTask(Task):
+        @property
+        def name(self) -> str:
+            return 'counting'
+
+        def run_on_guest(self, guest, logger) -> None:
+            nonlocal running, peak
+
+            with lock:
+                running += 1
+                peak = max(peak, running)
+
+            time.sleep(0.1)
+
+            with lock:
+                running -= 1
+
+    guests = [FakeGuest(f'guest-{i}', root_logger) for i in range(6)]
+
+    queue = Queue('test', root_logger, max_workers=2)
+    queue.enqueue_task(CountingTask(guests=guests, logger=root_logger))
+    queue.enqueue_task(CountingTask(guests=guests, logger=root_logger))
+
+    assert len(list(queue.run())) == 12
+    assert peak == 2
+
+
+def test_stop_on_failure(root_logger, guests):
+    events: Events = []
+    durations = {'fast': 0, 'slow': 0.2}
+
+    queue = Queue('test', root_logger)
+    queue.enqueue_task(SleepTask(
+        guests=guests, logger=root_logger, label='one', events=events,
+        durations=durations, fail_on='fast'))
+    queue.enqueue_task(SleepTask(
+        guests=guests, logger=root_logger, label='two', events=events, durations=durations))
+
+    outcomes = list(queue.run())
+
+    # The slow guest finishes the running task, nothing else is started
+    assert [(outcome.guest.name, outcome.exc is not None) for outcome in outcomes] == [
+        ('fast', True), ('slow', False)]
+    assert not [event for event in events if event[1] == 'two']
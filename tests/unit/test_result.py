@@ -0,0 +1,110 @@
+import types
+
+import py.path
+
+from tmt.log import Logger
+from tmt.result import DurationHistory, Result, result_duration_to_seconds
+from tmt.utils import Path
+
+
+def test_result_duration_to_seconds() -> None:
+    assert result_duration_to_seconds('00:00:00') == 0
+    assert result_duration_to_seconds('01:02:03') == 3723
+
+
+def test_duration_history(tmpdir: py.path.local, root_logger: Logger) -> None:
+    path = Path(tmpdir) / 'history' / 'durations.yaml'
+
+    history = DurationHistory(path, root_logger)
+    assert history.estimate('/foo') is None
+
+    history.update([
+        Result(name='/foo', duration='00:00:10'),
+        Result(name='/foo', duration='00:00:20'),
+        Result(name='/bar', duration='00:01:00'),
+        Result(name='/baz')
+        ])
+    history.save()
+
+    history = DurationHistory(path, root_logger)
+    assert history.estimate('/foo') == 15
+    assert history.estimate('/bar') == 60
+    assert history.estimate('/baz') is None
+
+
+def test_duration_history_size(tmpdir: py.path.local, root_logger: Logger) -> None:
+    history = DurationHistory(Path(tmpdir) / 'durations.yaml', root_logger)
+
+    history.update([Result(name='/foo', duration=f'00:00:0{i}') for i in range(10)])
+    assert history.durations['/foo'] == [5, 6, 7, 8, 9]
+
+
+def test_duration_history_invalid(tmpdir: py.path.local, root_logger: Logger) -> None:
+    path = Path(tmpdir) / 'durations.yaml'
+    path.write_text('/foo: [not a number]\n')
+
+    assert DurationHistory(path, root_logger).durations == {}
+
+
+def test_duration_history_invalid_duration(
+        tmpdir: py.path.local, root_logger: Logger) -> None:
+    history = DurationHistory(Path(tmpdir) / 'durations.yaml', root_logger)
+
+    history.update([
+        Result(name='/foo', duration='5 minutes'),
+        Result(name='/foo', duration='00:00:10')
+        ])
+    assert history.durations == {'/foo': [10]}
+
+
+def test_duration_history_save_failure(tmpdir: py.path.local, root_logger: Logger) -> None:
+    blocker = Path(tmpdir) / 'blocker'
+    blocker.write_text('not a directory')
+
+    history = DurationHistory(blocker / 'durations.yaml', root_logger)
+    history.update([Result(name='/foo', duration='00:00:10')])
+    history.save()
+
+    assert not (blocker / 'durations.yaml').exists()
+
+
+def test_duration_history_shared(tmpdir: py.path.local, root_logger: Logger) -> None:
+    path = Path(tmpdir) / 'durations.yaml'
+
+    # Durations saved by another run in the meantime are kept
+    first = DurationHistory(path, root_logger)
+    second = DurationHistory(path, root_logger)
+    first.update([Result(name='/foo', duration='00:00:10')])
+    second.update([
+        Result(name='/foo', duration='00:00:20'),
+        Result(name='/bar', duration='00:00:30')
+        ])
+    first.save()
+    second.save()
+
+    assert DurationHistory(path, root_logger).durations == {'/foo': [10, 20], '/bar': [30]}
+
+
+def test_duration_history_sort(tmpdir: py.path.local, root_logger: Logger) -> None:
+    history = DurationHistory(Path(tmpdir) / 'durations.yaml', root_logger)
+    history.update([
+        Result(name=name, duration=f'00:00:{seconds:02}')
+        for name, seconds in [('/a', 10), ('/b', 20), ('/c', 30), ('/d', 40), ('/e', 50)]
+        ])
+
+    def _test(name: str, parallel_safe: bool, order: int = 50) -> types.SimpleNamespace:
+        return types.SimpleNamespace(name=name, parallel_safe=parallel_safe, order=order)
+
+    tests = [
+        _test('/a', True),
+        _test('/b', True),
+        _test('/serial', False),
+        _test('/c', True),
+        _test('/unknown', True),
+        _test('/d', True, order=60),
+        _test('/e', True, order=60),
+        ]
+
+    # Parallel-safe tests stay together, serial tests keep their position
+    assert [test.name for test in history.sort(tests)] == [  # type: ignore[arg-type]
+        '/b', '/a', '/serial', '/unknown', '/c', '/e', '/d']
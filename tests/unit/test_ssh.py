@@ -0,0 +1,37 @@
+from tmt.log import Logger
+from tmt.steps.provision.ssh import SshMaster
+from tmt.utils import Command, Common
+
+
+def test_master(root_logger: Logger) -> None:
+    master = SshMaster(parent=Common(logger=root_logger))
+
+    # Pretend to be ssh, create the socket and keep running
+    command = Command('sh', '-c', f'touch {master.socket} && exec sleep 60')
+
+    master.connect(command)
+    assert master.is_alive
+    assert master.socket.exists()
+
+    master.connect(command)
+    assert (master.established, master.reused) == (1, 1)
+
+    # The master process is gone, e.g. after a reboot
+    assert master.process is not None
+    master.process.kill()
+    master.process.wait()
+    assert not master.is_alive
+
+    master.connect(command)
+    assert (master.established, master.reused) == (2, 1)
+
+    # The socket has been removed
+    master.socket.unlink()
+    assert not master.is_alive
+
+    master.connect(command)
+    assert (master.established, master.reused) == (3, 1)
+
+    master.close()
+    assert master.process is None
+    assert not master.socket.exists()
@@ -1,5 +1,6 @@
 # coding: utf-8
 
+import concurrent.futures
 import datetime
 import queue
 import re
@@ -618,6 +619,108 @@ def test_run_big(root_logger):
     assert len(stdout) == 200000
 
 
+def test_run_tail(root_logger):
+    # Just the end of a large output is kept, starting with a complete line
+    script = (
+        f"head -c {tmt.utils.OUTPUT_TAIL_SIZE * 3} /dev/zero | tr '\\0' x; echo; "
+        "echo last line")
+
+    stdout, _ = ShellScript(script).to_shell_command().run(
+        shell=False,
+        cwd=Path.cwd(),
+        env={},
+        log=None,
+        logger=root_logger)
+    assert stdout == 'last line\n'
+
+
+def test_stream_reader_output():
+    reader = tmt.utils.StreamReader('out')
+    reader.feed(b'foo\nba')
+    reader.feed(b'r\n')
+    reader.close()
+
+    # Output can be fetched repeatedly
+    assert reader.get_output() == 'foo\nbar\n'
+    assert reader.get_output() == 'foo\nbar\n'
+
+    unused = tmt.utils.UnusedStreamReader('err')
+    assert unused.done.is_set()
+    assert unused.output is None
+    assert unused.get_output() is None
+
+
+def test_run_output_file(root_logger, tmpdir):
+    # Output is streamed into the file, only its tail is returned
+    output_file = Path(tmpdir) / 'output.txt'
+    output_file.write_text('previous\n')
+    script = (
+        f"for i in $(seq {tmt.utils.OUTPUT_TAIL_SIZE // 8}); do echo line$i; done; "
+        "echo last line")
+
+    stdout, _ = ShellScript(script).to_shell_command().run(
+        shell=False,
+        cwd=Path.cwd(),
+        env={},
+        log=None,
+        output_file=output_file,
+        logger=root_logger)
+    content = output_file.read_text()
+    assert content.startswith('previous\nline1\n')
+    assert content.endswith('last line\n')
+    assert len(stdout) <= tmt.utils.OUTPUT_TAIL_SIZE
+    assert stdout.startswith('line')
+    assert stdout.endswith('last line\n')
+    assert content.endswith(stdout)
+
+
+def test_run_logged_lines(root_logger):
+    lines = []
+
+    def _log(key, value=None, color=None, shift=0, level=1, topic=None):
+        lines.append((key, value))
+
+    ShellScript("echo foo; echo bar >&2; printf baz").to_shell_command().run(
+        shell=False,
+        cwd=Path.cwd(),
+        env={},
+        log=_log,
+        join=True,
+        logger=root_logger)
+    assert lines == [('out', 'foo'), ('out', 'bar'), ('out', 'baz')]
+
+
+def test_run_failing_logger(root_logger):
+    """ Logger failing in the pump thread does not break following commands """
+    def _log(key, value=None, color=None, shift=0, level=1, topic=None):
+        raise RuntimeError('logger failed')
+
+    command = ShellScript("echo foo").to_shell_command()
+
+    with pytest.raises(RuntimeError, match='logger failed'):
+        command.run(shell=False, cwd=Path.cwd(), env={}, log=_log, logger=root_logger)
+
+    stdout, _ = command.run(shell=False, cwd=Path.cwd(), env={}, log=None, logger=root_logger)
+    assert stdout == 'foo\n'
+
+
+def test_run_concurrent(root_logger):
+    def _run(index):
+        stdout, stderr = ShellScript(
+            f"sleep 0.5; echo out{index}; echo err{index} >&2").to_shell_command().run(
+                shell=False,
+                cwd=Path.cwd(),
+                env={},
+                log=None,
+                logger=root_logger)
+        return stdout, stderr
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+        outputs = list(executor.map(_run, range(10)))
+
+    assert outputs == [(f'out{index}\n', f'err{index}\n') for index in range(10)]
+
+
 def test_get_distgit_handler():
     for wrong_remotes in [[], ["blah"]]:
         with pytest.raises(tmt.utils.GeneralError):
@@ -866,6 +969,27 @@ def test_wait_timeout(root_logger):
     assert len(check.mock_calls) <= 10
 
 
+def test_wait_tick_max(root_logger):
+    """
+    :py:func:`wait` shall not let ``tick`` grow beyond ``tick_max``.
+    """
+
+    check = unittest.mock.MagicMock(
+        __name__='mock_check',
+        side_effect=[WaitingIncomplete] * 5 + [None])
+
+    with unittest.mock.patch('time.sleep') as sleep:
+        wait(
+            Common(logger=root_logger),
+            check,
+            datetime.timedelta(seconds=3600),
+            tick=1,
+            tick_increase=2,
+            tick_max=5)
+
+    assert [args[0] for args, _ in sleep.call_args_list] == [1, 2, 4, 5, 5]
+
+
 def test_wait_success_but_too_late(root_logger):
     """
     :py:func:`wait` shall report failure even when ``check`` succeeds but runs
@@ -1014,3 +1138,86 @@ def test_filter_paths(source_dir):
 
     paths = filter_paths(source_dir, ['bz[235]', '/tests/bz5'])
     assert len(paths) == 3
+
+
+def test_git_mirror_cache(local_git_repo: Path, root_logger):
+    """ Mirrors are created once, updated and borrowed by clones """
+    common = Common(logger=root_logger)
+    cache = tmt.utils.GitMirrorCache(path=local_git_repo.parent / 'cache', logger=root_logger)
+    url = str(local_git_repo)
+
+    branch = run(Command('git', 'symbolic-ref', 'HEAD'), cwd=local_git_repo).stdout
+    assert branch is not None
+    branch = branch.strip()
+
+    # Shallow clones do not create mirrors
+    with cache.borrow(url, common, create=False) as mirror:
+        assert mirror is None
+    assert cache.entries() == []
+
+    # Just branches and tags are mirrored
+    run(Command('git', 'tag', 'v1'), cwd=local_git_repo)
+    run(Command('git', 'update-ref', 'refs/pull/1/head', 'HEAD'), cwd=local_git_repo)
+
+    with cache.borrow(url, common) as mirror:
+        assert mirror == cache.mirror(url)
+        refs = run(Command('git', 'for-each-ref', '--format=%(refname)'), cwd=mirror).stdout
+        assert refs is not None
+        assert sorted(refs.split()) == sorted([branch, 'refs/tags/v1'])
+
+    # New commits are fetched into the existing mirror
+    local_git_repo.joinpath('NEWS').write_text('news')
+    run(Command('git', 'add', '-A'), cwd=local_git_repo)
+    run(Command('git', 'commit', '-m', 'news'), cwd=local_git_repo)
+    head = run(Command('git', 'rev-parse', 'HEAD'), cwd=local_git_repo).stdout
+
+    with cache.borrow(url, common, create=False) as mirror:
+        assert mirror is not None
+        assert run(Command('git', 'rev-parse', branch), cwd=mirror).stdout == head
+
+    # Missing repositories are not mirrored
+    with cache.borrow(str(local_git_repo.parent / 'missing'), common) as mirror:
+        assert mirror is None
+
+    assert cache.entries() == [cache.mirror(url)]
+
+
+def test_git_mirror_cache_defaults(root_logger, monkeypatch):
+    """ Cache location is resolved when used, the size is limited by default """
+    monkeypatch.delenv(tmt.utils.GIT_CACHE_VARIABLE, raising=False)
+    monkeypatch.delenv(tmt.utils.GIT_CACHE_SIZE_VARIABLE, raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', '/cache')
+
+    cache = tmt.utils.GitMirrorCache(logger=root_logger)
+    assert cache.path == Path('/cache/tmt/git')
+    assert cache.budget == tmt.utils.GIT_CACHE_SIZE
+
+
+def test_git_mirror_cache_evict(local_git_repo: Path, root_logger):
+    """ Old mirrors and mirrors exceeding the budget are removed """
+    common = Common(logger=root_logger)
+    cache = tmt.utils.GitMirrorCache(path=local_git_repo.parent / 'cache', logger=root_logger)
+    fork = local_git_repo.parent / 'fork'
+    run(Command('git', 'clone', str(local_git_repo), str(fork)), cwd=local_git_repo.parent)
+
+    for url in [str(local_git_repo), str(fork)]:
+        with cache.borrow(url, common):
+            pass
+
+    assert len(cache.entries()) == 2
+
+    cache.budget = 1
+    assert cache.evict(keep=cache.mirror(str(fork))) == [cache.mirror(str(local_git_repo))]
+
+    cache.budget, cache.max_age = None, -1
+    assert cache.evict() == [cache.mirror(str(fork))]
+
+
+@pytest.mark.parametrize(('url', 'expected'), [
+    ('https://github.com/teemtee/tmt', True),
+    ('git@github.com:teemtee/tmt.git', True),
+    ('file:///tmp/tmt', False),
+    ('/tmp/tmt', False),
+    ])
+def test_git_mirror_cache_is_remote(url: str, expected: bool):
+    assert tmt.utils.GitMirrorCache.is_remote(url) is expected
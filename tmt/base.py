@@ -787,6 +787,11 @@ class Core(
             elif key == 'path' and isinstance(value, Path):
                 data[key] = str(value)
 
+            # TODO: this belongs to Test.export, and it will be moved when the time
+            # of export() cleanup comes.
+            elif key == 'parallel_safe':
+                data[tmt.utils.key_to_option(key)] = value
+
             else:
                 data[key] = value
 
@@ -930,6 +935,7 @@ class Test(
     environment: tmt.utils.EnvironmentType = {}
     duration: str = DEFAULT_TEST_DURATION_L1
     result: str = 'respect'
+    parallel_safe: bool = False
 
     where: List[str] = []
 
@@ -1182,7 +1188,9 @@ class Test(
         """ T001: all keys are known """
 
         # We don't want adjust in show/export so it is not yet in Test._keys
-        invalid_keys = self._lint_keys(EXTRA_TEST_KEYS + OBSOLETED_TEST_KEYS + ['adjust'])
+        # Keys with a dash are stored as attributes with an underscore
+        invalid_keys = self._lint_keys(
+            EXTRA_TEST_KEYS + OBSOLETED_TEST_KEYS + ['adjust', 'parallel-safe'])
 
         if invalid_keys:
             for key in invalid_keys:
@@ -1904,6 +1912,20 @@ class Plan(
 
         yield LinterOutcome.SKIP, 'no remote fmf ids defined'
 
+    @property
+    def _dag_enabled(self) -> bool:
+        """
+        Whether phases of different steps may overlap
+
+        Only provision and prepare overlap for now: a guest is prepared
+        as soon as it is provisioned, unless the prepare step is not
+        going to run or has been done already.
+        """
+        return bool(self.opt('dag')) \
+            and not self.opt('dry') \
+            and bool(self.prepare.enabled) \
+            and self.prepare.status() != 'done'
+
     def go(self) -> None:
         """ Execute the plan """
         # Show plan name and summary (one blank line to separate plans)
@@ -1964,6 +1986,11 @@ class Plan(
         abort = False
         try:
             for step in self.steps(skip=['finish']):
+                # Prepare each guest as soon as it is provisioned
+                if isinstance(step, tmt.steps.provision.Provision) and self._dag_enabled:
+                    step.go(on_guest_ready=self.prepare.prepare_guest)
+                    continue
+
                 step.go()
                 # Finish plan if no tests found (except dry mode)
                 if (isinstance(step, tmt.steps.discover.Discover) and not step.tests()
@@ -230,6 +230,14 @@ def main(
 @click.option(
     '--follow', is_flag=True,
     help='Output the logfile as it grows.')
+@click.option(
+    '--max-workers', type=click.IntRange(min=1), metavar='N',
+    help='Maximum number of phases running on guests at the same time.')
+@click.option(
+    '--dag', is_flag=True,
+    help='Schedule phases by their dependencies rather than step by step, '
+         'let each guest start preparation as soon as it is provisioned and '
+         'move on without waiting for other guests.')
 @click.option(
     '-a', '--all', help='Run all steps, customize some.', is_flag=True)
 @click.option(
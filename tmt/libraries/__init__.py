@@ -1,6 +1,8 @@
 """ Handle libraries """
 
-from typing import List, Optional, Tuple, Union
+import concurrent.futures
+import dataclasses
+from typing import Dict, List, Optional, Tuple, Union
 
 import fmf
 
@@ -25,6 +27,9 @@ LibraryDependenciesType = Tuple[
     List[tmt.base.Require], List[tmt.base.Require], List['LibraryType']
     ]
 
+# Maximum number of library repositories cloned at the same time
+LIBRARY_FETCH_WORKERS = 8
+
 
 class LibraryError(Exception):
     """ Used when library cannot be parsed from the identifier """
@@ -67,14 +72,14 @@ class Library:
         return f"{self.repo}{self.name}"
 
 
-def library_factory(
+def _create_library(
         *,
         identifier: LibraryIdentifierType,
         parent: Optional[tmt.utils.Common] = None,
         logger: tmt.log.Logger,
         source_location: Optional[Path] = None,
         target_location: Optional[Path] = None) -> LibraryType:
-    """ Factory function to get correct library instance """
+    """ Create the correct library instance, do not fetch it yet """
     if (isinstance(identifier, tmt.base.RequireSimple) or
             isinstance(identifier, tmt.base.RequireFmfId)):
         from .beakerlib import BeakerLib
@@ -93,7 +98,11 @@ def library_factory(
     else:
         raise LibraryError
 
-    # Fetch the library
+    return library
+
+
+def _fetch_library(library: LibraryType) -> None:
+    """ Fetch the library, report repositories without fmf metadata """
     try:
         library.fetch()
     except fmf.utils.RootError as exc:
@@ -102,9 +111,42 @@ def library_factory(
                 f"Repository '{library.url}' does not contain fmf metadata.") from exc
         raise exc
 
+
+def library_factory(
+        *,
+        identifier: LibraryIdentifierType,
+        parent: Optional[tmt.utils.Common] = None,
+        logger: tmt.log.Logger,
+        source_location: Optional[Path] = None,
+        target_location: Optional[Path] = None) -> LibraryType:
+    """ Factory function to get correct library instance """
+    library = _create_library(
+        identifier=identifier, parent=parent, logger=logger,
+        source_location=source_location, target_location=target_location)
+    _fetch_library(library)
     return library
 
 
+@dataclasses.dataclass
+class _Dependency:
+    """ Dependency waiting to be processed by :py:func:`dependencies` """
+
+    identifier: LibraryIdentifierType
+
+    #: Indices of the dependency and its ancestors in their require and
+    #: recommend lists, used to report libraries in depth-first order.
+    position: Tuple[int, ...]
+
+    #: The dependency is required by the test or library it comes from.
+    required: bool
+
+    #: The dependency is recommended by the test or library it comes from.
+    recommended: bool
+
+    source_location: Optional[Path] = None
+    target_location: Optional[Path] = None
+
+
 def dependencies(
         *,
         original_require: List[tmt.base.Require],
@@ -123,14 +165,23 @@ def dependencies(
     libraries, list of aggregated recommended packages and a list of
     gathered libraries (instances of the Library class).
 
+    Dependencies are resolved breadth-first. Repositories of all
+    libraries found on the same level are cloned in parallel, libraries
+    are then fetched one by one in the order they were found, so that
+    conflicts of library urls and refs are detected deterministically.
+    Gathered libraries are reported depth-first, each library followed
+    by libraries it depends on.
+
     Avoid infinite recursion by keeping track of imported library identifiers
     and not trying to fetch those again.
     """
+    from .beakerlib import BeakerLib
+
     # Initialize lists, use set for require & recommend
     processed_require = set()
     processed_recommend = set()
     imported_lib_ids = imported_lib_ids or []
-    gathered_libraries: List[LibraryType] = []
+    gathered_libraries: List[Tuple[Tuple[int, ...], LibraryType]] = []
     original_require = original_require or []
     original_recommend = original_recommend or []
 
@@ -140,42 +191,81 @@ def dependencies(
             return True
         return lib not in imported_lib_ids
 
-    to_fetch = original_require + original_recommend
-    for dependency in filter(already_fetched, to_fetch):
-        # Library require/recommend
-        try:
-            library = library_factory(
-                logger=logger, identifier=dependency, parent=parent,
-                source_location=source_location, target_location=target_location)
-            gathered_libraries.append(library)
-            imported_lib_ids.append(library.identifier)
-            assert parent is not None  # narrow type
-            if library.hostname == 'local':
-                library_path = library.fmf_node_path
-            else:  # TODO: Change with pruning for libraries
-                library_path = parent.workdir / library.dest / library.repo
-
-            from .beakerlib import BeakerLib
-            if isinstance(library, BeakerLib):
-                # Recursively check for possible dependent libraries
-                assert parent.workdir is not None  # narrow type
-                requires, recommends, libraries = dependencies(
-                    original_require=library.require,
-                    original_recommend=library.recommend,
-                    parent=parent,
-                    imported_lib_ids=imported_lib_ids,
-                    logger=logger,
-                    source_location=library_path,
-                    target_location=parent.workdir / library.dest / library.repo)
-                processed_require.update(set(requires))
-                processed_recommend.update(set(recommends))
-                gathered_libraries.extend(libraries)
-        # Regular package require/recommend
-        except LibraryError:
-            if dependency in original_require:
-                processed_require.add(dependency)
-            if dependency in original_recommend:
-                processed_recommend.add(dependency)
+    level = [
+        _Dependency(
+            identifier=dependency,
+            position=(index,),
+            required=dependency in original_require,
+            recommended=dependency in original_recommend,
+            source_location=source_location,
+            target_location=target_location)
+        for index, dependency in enumerate(original_require + original_recommend)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=LIBRARY_FETCH_WORKERS) as executor:
+        while level:
+            # Identify libraries, errors are kept for the sequential pass
+            # below to be raised in the original order
+            libraries: Dict[int, Union[LibraryType, Exception]] = {}
+            for index, dependency in enumerate(level):
+                if not already_fetched(dependency.identifier):
+                    continue
+                try:
+                    libraries[index] = _create_library(
+                        logger=logger, identifier=dependency.identifier, parent=parent,
+                        source_location=dependency.source_location,
+                        target_location=dependency.target_location)
+                except Exception as error:
+                    libraries[index] = error
+
+            # Start cloning each new repository, the first library wins
+            prefetched = set()
+            for library in libraries.values():
+                if isinstance(library, BeakerLib) and str(library.repo) not in prefetched:
+                    prefetched.add(str(library.repo))
+                    library.prefetch(executor)
+
+            next_level: List[_Dependency] = []
+            for index, dependency in enumerate(level):
+                if index not in libraries or not already_fetched(dependency.identifier):
+                    continue
+                # Library require/recommend
+                try:
+                    library = libraries[index]
+                    if isinstance(library, Exception):
+                        raise library
+                    _fetch_library(library)
+                    gathered_libraries.append((dependency.position, library))
+                    imported_lib_ids.append(library.identifier)
+                    assert parent is not None  # narrow type
+                    if library.hostname == 'local':
+                        library_path = library.fmf_node_path
+                    else:  # TODO: Change with pruning for libraries
+                        library_path = parent.workdir / library.dest / library.repo
+
+                    if isinstance(library, BeakerLib):
+                        # Check for possible dependent libraries on the next level
+                        assert parent.workdir is not None  # narrow type
+                        next_level.extend(
+                            _Dependency(
+                                identifier=nested,
+                                position=(*dependency.position, nested_index),
+                                required=nested in library.require,
+                                recommended=nested in library.recommend,
+                                source_location=library_path,
+                                target_location=parent.workdir / library.dest / library.repo)
+                            for nested_index, nested in enumerate(
+                                library.require + library.recommend))
+                # Regular package require/recommend
+                except LibraryError:
+                    if dependency.required:
+                        processed_require.add(dependency.identifier)
+                    if dependency.recommended:
+                        processed_recommend.add(dependency.identifier)
+
+            level = next_level
 
     # Convert to list and return the results
-    return list(processed_require), list(processed_recommend), gathered_libraries
+    return (
+        list(processed_require),
+        list(processed_recommend),
+        [library for _, library in sorted(gathered_libraries, key=lambda item: item[0])])
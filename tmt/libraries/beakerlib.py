@@ -1,3 +1,4 @@
+import concurrent.futures
 import os
 import re
 import shutil
@@ -70,6 +71,9 @@ class BeakerLib(Library):
         # Default branch is detected from the origin after cloning
         self.default_branch: Optional[str] = None
 
+        # Clone of the repository started in advance, see prefetch()
+        self._clone_future: Optional['concurrent.futures.Future[None]'] = None
+
         # The 'library(repo/lib)' format
         if isinstance(identifier, tmt.base.RequireSimple):
             identifier = tmt.base.RequireSimple(identifier.strip())
@@ -164,6 +168,76 @@ class BeakerLib(Library):
 
         return cast(CommonWithLibraryCache, self.parent)._library_cache
 
+    @property
+    def _directory(self) -> Path:
+        """ Directory into which the library repository is cloned """
+        assert self.parent.workdir
+        return self.parent.workdir / self.dest / self.repo
+
+    def _clone(self) -> None:
+        """ Clone the repository, detect the default branch, checkout ref """
+        directory = self._directory
+        # Clone repo with disabled prompt to ignore missing/private repos
+        try:
+            if self.url:
+                # Shallow clone to speed up testing and
+                # minimize data transfers if ref is not provided
+                tmt.utils.git_clone(self.url, directory, self.parent,
+                                    env={"GIT_ASKPASS": "echo"}, shallow=self.ref is None)
+            else:
+                # Either url or path must be defined
+                assert self.path is not None
+                self.parent.debug(
+                    f"Copy local library '{self.path}' to '{directory}'.",
+                    level=3)
+                shutil.copytree(self.path, directory, symlinks=True)
+            # Detect the default branch from the origin
+            try:
+                self.default_branch = tmt.utils.default_branch(
+                    repository=directory, logger=self._logger)
+            except OSError:
+                raise tmt.utils.GeneralError(
+                    f"Unable to detect default branch for '{directory}'. "
+                    f"Is the git repository '{self.url}' empty?")
+            # Use the default branch if no ref provided
+            if self.ref is None:
+                self.ref = self.default_branch
+        except tmt.utils.RunError:
+            # Fallback to install during the prepare step if in rpm format
+            if self.format == 'rpm':
+                self.parent.debug(f"Repository '{self.url}' not found.")
+                raise LibraryError
+            self.parent.fail(
+                f"Failed to fetch library '{self}' from '{self.url}'.")
+            raise
+        # Check out the requested branch
+        try:
+            if self.ref is not None:
+                self.parent.run(Command('git', 'checkout', self.ref), cwd=directory)
+        except tmt.utils.RunError:
+            # Fallback to install during the prepare step if in rpm format
+            if self.format == 'rpm':
+                self.parent.debug(f"Invalid reference '{self.ref}'.")
+                raise LibraryError
+            self.parent.fail(
+                f"Reference '{self.ref}' for library '{self}' not found.")
+            raise
+
+    def prefetch(self, executor: concurrent.futures.Executor) -> None:
+        """
+        Start cloning the library repository in advance
+
+        The clone runs in the given executor, :py:meth:`fetch` then just
+        waits for it. Errors are reported by :py:meth:`fetch`, so they
+        are raised in the same order as if libraries were fetched one
+        by one. Libraries which are cached already are not cloned.
+        """
+        if str(self.repo) in self._library_cache or self._clone_future is not None:
+            return
+
+        self.parent.debug(f"Prefetch library '{self}'.", level=3)
+        self._clone_future = executor.submit(self._clone)
+
     def fetch(self) -> None:
         """ Fetch the library (unless already fetched) """
         # Check if the library was already fetched
@@ -199,54 +273,14 @@ class BeakerLib(Library):
         # Fetch the library and add it to the index
         except KeyError:
             self.parent.debug(f"Fetch library '{self}'.", level=3)
-            # Prepare path, clone the repository, checkout ref
-            assert self.parent.workdir
-            directory = self.parent.workdir / self.dest / self.repo
-            # Clone repo with disabled prompt to ignore missing/private repos
-            try:
-                if self.url:
-                    # Shallow clone to speed up testing and
-                    # minimize data transfers if ref is not provided
-                    tmt.utils.git_clone(self.url, directory, self.parent,
-                                        env={"GIT_ASKPASS": "echo"}, shallow=self.ref is None)
-                else:
-                    # Either url or path must be defined
-                    assert self.path is not None
-                    self.parent.debug(
-                        f"Copy local library '{self.path}' to '{directory}'.",
-                        level=3)
-                    shutil.copytree(self.path, directory, symlinks=True)
-                # Detect the default branch from the origin
-                try:
-                    self.default_branch = tmt.utils.default_branch(
-                        repository=directory, logger=self._logger)
-                except OSError:
-                    raise tmt.utils.GeneralError(
-                        f"Unable to detect default branch for '{directory}'. "
-                        f"Is the git repository '{self.url}' empty?")
-                # Use the default branch if no ref provided
-                if self.ref is None:
-                    self.ref = self.default_branch
-            except tmt.utils.RunError:
-                # Fallback to install during the prepare step if in rpm format
-                if self.format == 'rpm':
-                    self.parent.debug(f"Repository '{self.url}' not found.")
-                    raise LibraryError
-                self.parent.fail(
-                    f"Failed to fetch library '{self}' from '{self.url}'.")
-                raise
-            # Check out the requested branch
-            try:
-                if self.ref is not None:
-                    self.parent.run(Command('git', 'checkout', self.ref), cwd=directory)
-            except tmt.utils.RunError:
-                # Fallback to install during the prepare step if in rpm format
-                if self.format == 'rpm':
-                    self.parent.debug(f"Invalid reference '{self.ref}'.")
-                    raise LibraryError
-                self.parent.fail(
-                    f"Reference '{self.ref}' for library '{self}' not found.")
-                raise
+            directory = self._directory
+
+            # Wait for the clone started in advance, or clone right now
+            if self._clone_future is not None:
+                self._clone_future.result()
+            else:
+                self._clone()
+
             # Initialize metadata tree, add self into the library index
             self.tree = fmf.Tree(str(directory))
             self._library_cache[str(self.repo)] = self
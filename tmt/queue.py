@@ -1,7 +1,8 @@
 import dataclasses
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
 from typing import (TYPE_CHECKING, Dict, Generator, Generic, List, Optional,
-                    TypeVar)
+                    Set, Tuple, TypeVar)
 
 import fmf.utils
 
@@ -66,8 +67,36 @@ class _Task:
     def guest_ids(self) -> List[str]:
         return [guest.multihost_name for guest in self.guests]
 
-    def go(self) -> Generator[TaskOutcome['Self'], None, None]:
-        """ Perform the task """
+    def units(self) -> List[Optional[str]]:
+        """
+        Split the task into units the queue can schedule independently.
+
+        Each unit is represented by a name of the guest it runs on, or
+        ``None`` for a unit not bound to any particular guest.
+        """
+
+        raise NotImplementedError
+
+    def prepare_loggers(
+            self,
+            logger: Logger) -> Dict[str, Logger]:
+        """ Create loggers for units of the task, indexed by guest names """
+
+        raise NotImplementedError
+
+    def run_unit(
+            self,
+            name: Optional[str],
+            loggers: Dict[str, Logger]) -> TaskOutcome['Self']:
+        """
+        Perform a single unit of the task.
+
+        :param name: name of the guest to run the unit on, ``None`` for
+            units not bound to a guest.
+        :param loggers: loggers prepared by :py:meth:`prepare_loggers`.
+        :returns: outcome of the unit. Exceptions raised by the unit are
+            not propagated, they are saved in the outcome instead.
+        """
 
         raise NotImplementedError
 
@@ -88,27 +117,33 @@ class GuestlessTask(_Task):
     def run(self, logger: Logger) -> None:
         raise NotImplementedError
 
-    def go(self) -> Generator[TaskOutcome['Self'], None, None]:
+    def units(self) -> List[Optional[str]]:
+        return [None]
+
+    def prepare_loggers(
+            self,
+            logger: Logger) -> Dict[str, Logger]:
+        return {}
+
+    def run_unit(
+            self,
+            name: Optional[str],
+            loggers: Dict[str, Logger]) -> TaskOutcome['Self']:
         try:
             self.run(self.logger)
 
         except Exception as exc:
-            # logger.info('finished', color='cyan')
-
-            yield TaskOutcome(
+            return TaskOutcome(
                 task=self,
                 logger=self.logger,
                 guest=None,
                 exc=exc)
 
-        else:
-            # logger.info('finished', color='cyan')
-
-            yield TaskOutcome(
-                task=self,
-                logger=self.logger,
-                guest=None,
-                exc=None)
+        return TaskOutcome(
+            task=self,
+            logger=self.logger,
+            guest=None,
+            exc=None)
 
 
 @dataclasses.dataclass
@@ -118,6 +153,11 @@ class Task(_Task):
     def run_on_guest(self, guest: 'Guest', logger: Logger) -> None:
         raise NotImplementedError
 
+    def unit_logger(self, name: str, logger: Logger) -> Logger:
+        """ Create a new logger for the given unit, based on the task logger """
+
+        return logger.clone()
+
     def prepare_loggers(
             self,
             logger: Logger) -> Dict[str, Logger]:
@@ -130,16 +170,19 @@ class Task(_Task):
         """
 
         loggers: Dict[str, Logger] = {}
+        names = self.units()
 
         # First, spawn all loggers, and set their labels if needed. Don't bother
         # with labels if there's just a single guest.
-        for guest in self.guests:
-            new_logger = logger.clone()
+        for name, label in zip(names, self.guest_ids):
+            assert name is not None  # narrow type
+
+            new_logger = self.unit_logger(name, logger)
 
-            if len(self.guests) > 1:
-                new_logger.labels.append(guest.multihost_name)
+            if len(names) > 1:
+                new_logger.labels.append(label)
 
-            loggers[guest.name] = new_logger
+            loggers[name] = new_logger
 
         # Second, find the longest labels, and instruct all loggers to pad their
         # labels to match this length. This should create well-indented messages.
@@ -150,86 +193,110 @@ class Task(_Task):
 
         return loggers
 
-    def go(self) -> Generator[TaskOutcome['Self'], None, None]:
+    def units(self) -> List[Optional[str]]:
+        return [guest.name for guest in self.guests]
+
+    def run_unit(
+            self,
+            name: Optional[str],
+            loggers: Dict[str, Logger]) -> TaskOutcome['Self']:
+        guest = next(guest for guest in self.guests if guest.name == name)
+
         multiple_guests = len(self.guests) > 1
 
-        new_loggers = self.prepare_loggers(self.logger)
-        old_loggers: Dict[str, Logger] = {}
-
-        with ThreadPoolExecutor(max_workers=len(self.guests)) as executor:
-            futures: Dict[Future[None], Guest] = {}
-
-            for guest in self.guests:
-                # Swap guest's logger for the one we prepared, with labels
-                # and stuff.
-                #
-                # We can't do the same for phases - phase is shared among
-                # guests, its `self.$loggingmethod()` calls need to be
-                # fixed to use a logger we pass to it through the executor.
-                #
-                # Possibly, the same thing should happen to guest methods as
-                # well, then the phase would pass the given logger to guest
-                # methods when it calls them, propagating the single logger we
-                # prepared...
-                old_loggers[guest.name] = guest._logger
-                new_logger = new_loggers[guest.name]
-
-                guest.inject_logger(new_logger)
-
-                if multiple_guests:
-                    new_logger.info('started', color='cyan')
-
-                # Submit each task/guest combination (save the guest & logger
-                # for later)...
-                futures[
-                    executor.submit(self.run_on_guest, guest, new_logger)
-                    ] = guest
-
-            # ... and then sit and wait as they get delivered to us as they
-            # finish. Unpack the guest and logger, so we could preserve logging
-            # and prepare the right outcome package.
-            for future in as_completed(futures):
-                guest = futures[future]
-
-                old_logger = old_loggers[guest.name]
-                new_logger = new_loggers[guest.name]
-
-                if multiple_guests:
-                    new_logger.info('finished', color='cyan')
-
-                # `Future.result()` will either 1. reraise an exception the
-                # callable raised, if any, or 2. return whatever the callable
-                # returned - which is `None` in our case, therefore we can
-                # ignore the return value.
-                try:
-                    future.result()
-
-                except Exception as exc:
-                    yield TaskOutcome(
-                        task=self,
-                        logger=new_logger,
-                        guest=guest,
-                        exc=exc)
+        # Swap guest's logger for the one we prepared, with labels and stuff.
+        #
+        # We can't do the same for phases - phase is shared among guests, its
+        # `self.$loggingmethod()` calls need to be fixed to use a logger we
+        # pass to it through the executor.
+        #
+        # Possibly, the same thing should happen to guest methods as well,
+        # then the phase would pass the given logger to guest methods when it
+        # calls them, propagating the single logger we prepared...
+        old_logger = guest._logger
+        new_logger = loggers[guest.name]
 
-                else:
-                    yield TaskOutcome(
-                        task=self,
-                        logger=new_logger,
-                        guest=guest,
-                        exc=None)
+        guest.inject_logger(new_logger)
+
+        if multiple_guests:
+            new_logger.info('started', color='cyan')
 
-                # Don't forget to restore the original logger.
-                guest.inject_logger(old_logger)
+        try:
+            self.run_on_guest(guest, new_logger)
+
+        except Exception as exc:
+            outcome = TaskOutcome(
+                task=self,
+                logger=new_logger,
+                guest=guest,
+                exc=exc)
+
+        else:
+            outcome = TaskOutcome(
+                task=self,
+                logger=new_logger,
+                guest=guest,
+                exc=None)
+
+        finally:
+            if multiple_guests:
+                new_logger.info('finished', color='cyan')
+
+            # Don't forget to restore the original logger.
+            guest.inject_logger(old_logger)
+
+        return outcome
+
+
+#: A unit of a queued task, identified by the task index and the guest name.
+#: Units not bound to any guest use ``None`` instead of the name.
+_UnitId = Tuple[int, Optional[str]]
 
 
 class Queue(List[TaskT]):
-    """ Queue class for running phases on guests """
+    """
+    Queue class for running phases on guests
+
+    Tasks are split into units, one unit per guest the task should run
+    on. By default, tasks run one after another, units of a task start
+    once all units of the preceding task have finished, so guests are
+    processed together.
+
+    When pipelining is enabled, units running on the same guest are
+    started in the order their tasks were queued, but every guest
+    advances through the queue at its own pace: a guest which has
+    finished its part of a task may start the next task while other
+    guests are still busy with the previous one. Tasks not bound to
+    any guest, e.g. login or reboot, act as barriers: they start once
+    all preceding units have finished, and no later unit starts before
+    they finish.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            logger: Logger,
+            max_workers: Optional[int] = None,
+            pipeline: bool = False) -> None:
+        """
+        Create a new queue.
+
+        :param name: queue name, used for logging.
+        :param logger: logger to use for logging queue events.
+        :param max_workers: if set, no more than this many units would
+            run at the same time, no matter how many guests are there.
+            Must not be used when units of a task depend on each other,
+            e.g. synchronized tests of several guests.
+        :param pipeline: if set, guests do not wait for each other
+            between tasks.
+        """
 
-    def __init__(self, name: str, logger: Logger) -> None:
         super().__init__()
 
         self.name = name
         self._logger = logger
+        self.max_workers = max_workers
+        self.pipeline = pipeline
 
     def enqueue_task(self, task: TaskT) -> None:
         """ Put new task into a queue """
@@ -241,30 +308,122 @@ class Queue(List[TaskT]):
             f'{task.name} on {fmf.utils.listed(task.guest_ids)}',
             color='cyan')
 
+    def _dependencies(self) -> Dict[_UnitId, Set[_UnitId]]:
+        """ Find out which units must finish before each unit may start """
+
+        dependencies: Dict[_UnitId, Set[_UnitId]] = {}
+
+        # Without pipelining, each task waits for the whole preceding task
+        if not self.pipeline:
+            previous: Set[_UnitId] = set()
+
+            for index, task in enumerate(self):
+                units = {(index, name) for name in task.units()}
+                dependencies.update({unit: set(previous) for unit in units})
+                previous = units
+
+            return dependencies
+
+        # The most recent unit on each guest, and the most recent barrier
+        # together with all units queued after it.
+        last_on_guest: Dict[str, _UnitId] = {}
+        last_barrier: Optional[_UnitId] = None
+        since_barrier: Set[_UnitId] = set()
+
+        for index, task in enumerate(self):
+            for name in task.units():
+                unit: _UnitId = (index, name)
+                dependencies[unit] = set()
+
+                if last_barrier is not None:
+                    dependencies[unit].add(last_barrier)
+
+                if name is None:
+                    dependencies[unit] |= since_barrier
+
+                elif name in last_on_guest:
+                    dependencies[unit].add(last_on_guest[name])
+
+            for name in task.units():
+                if name is None:
+                    last_barrier = (index, None)
+                    since_barrier = set()
+                    last_on_guest = {}
+
+                else:
+                    last_on_guest[name] = (index, name)
+                    since_barrier.add((index, name))
+
+        return dependencies
+
     def run(self) -> Generator[TaskOutcome[TaskT], None, None]:
         """
         Start crunching the queued phases.
 
-        Queued tasks are executed in the order, for each task/guest
-        combination a :py:class:`TaskOutcome` instance is yielded.
+        For each task/guest combination a :py:class:`TaskOutcome` instance
+        is yielded as soon as the unit finishes. Once a unit fails, no new
+        units are started, and the queue stops after those already running
+        finish.
         """
 
-        for i, task in enumerate(self):
-            self._logger.info('')
+        dependencies = self._dependencies()
+
+        # Units waiting to be started, in the order of their tasks
+        pending: List[_UnitId] = [
+            (index, name)
+            for index, task in enumerate(self)
+            for name in task.units()
+            ]
+
+        finished: Set[_UnitId] = set()
+        started_tasks: Dict[int, Dict[str, Logger]] = {}
+        failed = False
+
+        max_workers = self.max_workers or max(len(pending), 1)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures: Dict[Future[TaskOutcome[TaskT]], _UnitId] = {}
+
+            while True:
+                # Start every unit which does not wait for anything, as long
+                # as there is a free worker.
+                if not failed:
+                    for unit_id in pending[:]:
+                        if len(futures) >= max_workers:
+                            break
+
+                        if not dependencies[unit_id] <= finished:
+                            continue
+
+                        index, name = unit_id
+                        task = self[index]
+
+                        if index not in started_tasks:
+                            self._logger.info('')
+
+                            self._logger.info(
+                                f'{self.name} task #{index + 1}',
+                                f'{task.name} on {fmf.utils.listed(task.guest_ids)}',
+                                color='cyan')
+
+                            started_tasks[index] = task.prepare_loggers(task.logger)
+
+                        pending.remove(unit_id)
+                        futures[executor.submit(
+                            task.run_unit, name, started_tasks[index])] = unit_id
+
+                if not futures:
+                    return
 
-            self._logger.info(
-                f'{self.name} task #{i + 1}',
-                f'{task.name} on {fmf.utils.listed(task.guest_ids)}',
-                color='cyan')
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
 
-            failed_outcomes: List[TaskOutcome[TaskT]] = []
+                for future in done:
+                    finished.add(futures.pop(future))
 
-            for outcome in task.go():
-                if outcome.exc:
-                    failed_outcomes.append(outcome)
+                    outcome = future.result()
 
-                yield outcome
+                    # TODO: make this optional
+                    if outcome.exc:
+                        failed = True
 
-            # TODO: make this optional
-            if failed_outcomes:
-                return
+                    yield outcome
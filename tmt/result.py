@@ -1,21 +1,31 @@
+import contextlib
 import dataclasses
 import enum
+import fcntl
+import itertools
+import math
+import os
 import re
-from typing import TYPE_CHECKING, Dict, List, Optional, cast
+from typing import TYPE_CHECKING, Dict, Generator, List, Optional, cast
 
 import click
 import fmf
+from ruamel.yaml.error import MarkedYAMLError
 
 import tmt.utils
 from tmt.utils import Path, field
 
 if TYPE_CHECKING:
     import tmt.base
+    import tmt.log
     import tmt.steps.provision
 
 # Extra keys used for identification in Result class
 EXTRA_RESULT_IDENTIFICATION_KEYS = ['extra-nitrate', 'extra-task']
 
+# Number of durations remembered for each test in the duration history
+DURATION_HISTORY_SIZE = 5
+
 
 class ResultOutcome(enum.Enum):
     PASS = 'pass'
@@ -276,3 +286,155 @@ class Result(tmt.utils.SerializableContainer):
             filtered += m + '\n'
 
         return filtered or log
+
+
+def result_duration_to_seconds(duration: str) -> int:
+    """
+    Convert result duration in the ``hh:mm:ss`` format into seconds
+
+    Not to be confused with :py:func:`tmt.utils.duration_to_seconds`
+    which converts test durations like ``5m`` or ``1h``.
+
+    :raises ValueError: when the duration is not in the expected format.
+    """
+    hours, minutes, seconds = (int(value) for value in duration.split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class DurationHistory:
+    """
+    Durations of tests executed in previous runs
+
+    History is stored in a local YAML file, mapping test names to
+    durations of their most recent executions, in seconds. It is used
+    to estimate how long a test is going to take, so that the longest
+    tests can be started first. The file may be shared by several runs,
+    it is locked while being read or written, and durations recorded by
+    other runs in the meantime are kept when saving.
+    """
+
+    def __init__(self, path: Path, logger: 'tmt.log.Logger') -> None:
+        self.path = path
+        self._logger = logger
+        self.durations: Dict[str, List[int]] = {}
+        # Durations recorded by this run, not saved yet
+        self._recorded: Dict[str, List[int]] = {}
+
+        if not self.path.exists():
+            return
+
+        # The history is just a hint, an unusable file must not break the run
+        try:
+            with self._locked(exclusive=False):
+                self.durations = self._load()
+
+        except (OSError, MarkedYAMLError, tmt.utils.GeneralError, TypeError, ValueError) as error:
+            logger.warn(f"Ignoring invalid duration history '{self.path}': {error}")
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive: bool) -> Generator[None, None, None]:
+        """ Hold the history lock, exclusively when changing the history """
+        with open(self.path.with_name(f'.{self.path.name}.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> Dict[str, List[int]]:
+        """ Read durations from the file, the lock must be held """
+        if not self.path.exists():
+            return {}
+
+        return {
+            str(name): [int(value) for value in values]
+            for name, values in tmt.utils.yaml_to_dict(self.path.read_text()).items()
+            }
+
+    def _record(self, durations: Dict[str, List[int]], name: str, seconds: int) -> None:
+        """ Add a duration of a test, keep just the most recent ones """
+        recent = durations.setdefault(name, [])
+        recent.append(seconds)
+        del recent[:-DURATION_HISTORY_SIZE]
+
+    def update(self, results: List[Result]) -> None:
+        """ Record durations of given results """
+        for result in results:
+            if not result.duration:
+                continue
+
+            # Custom results are not validated, skip durations we do not understand
+            try:
+                seconds = result_duration_to_seconds(result.duration)
+
+            except ValueError:
+                self._logger.warn(
+                    f"Ignoring invalid duration '{result.duration}' of '{result.name}'.")
+                continue
+
+            self._record(self.durations, result.name, seconds)
+            self._recorded.setdefault(result.name, []).append(seconds)
+
+    def save(self) -> None:
+        """ Write the history into its file, just warn if not possible """
+        self._logger.debug(f"Save duration history to '{self.path}'.", level=3)
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            with self._locked(exclusive=True):
+                # Another run may have saved its durations in the meantime
+                try:
+                    durations = self._load()
+
+                except (MarkedYAMLError, tmt.utils.GeneralError, TypeError, ValueError):
+                    durations = {}
+
+                for name, recorded in self._recorded.items():
+                    for seconds in recorded:
+                        self._record(durations, name, seconds)
+
+                # Replace the file at once, readers do not need to wait
+                temporary = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+                temporary.write_text(tmt.utils.dict_to_yaml(durations, sort=True))
+                temporary.replace(self.path)
+
+            self.durations = durations
+            self._recorded = {}
+
+        # The history is just a hint, failing to save it must not break the run
+        except OSError as error:
+            self._logger.warn(f"Failed to save duration history '{self.path}': {error}")
+
+    def estimate(self, name: str) -> Optional[float]:
+        """ Expected duration of a test, ``None`` if not known """
+        durations = self.durations.get(name)
+
+        if not durations:
+            return None
+
+        return sum(durations) / len(durations)
+
+    def sort(self, tests: List['tmt.base.Test']) -> List['tmt.base.Test']:
+        """
+        Sort tests by their expected duration, the longest first
+
+        Tests with unknown duration are treated as the longest ones.
+        Only consecutive parallel-safe tests with the same ``order`` are
+        reordered, so that they are still executed together, other
+        tests keep their position.
+        """
+
+        def _key(test: 'tmt.base.Test') -> float:
+            estimate = self.estimate(test.name)
+
+            return -estimate if estimate is not None else -math.inf
+
+        sorted_tests: List[tmt.base.Test] = []
+
+        for (parallel_safe, _), group in itertools.groupby(
+                tests, key=lambda test: (test.parallel_safe, test.order)):
+            group_tests = list(group)
+            sorted_tests += sorted(group_tests, key=_key) if parallel_safe else group_tests
+
+        return sorted_tests
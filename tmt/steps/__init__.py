@@ -6,8 +6,8 @@ import re
 import shutil
 import sys
 import textwrap
-from typing import (TYPE_CHECKING, Any, Callable, Dict, Generator, List,
-                    Optional, Tuple, Type, TypeVar, Union, cast, overload)
+from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple,
+                    Type, TypeVar, Union, cast, overload)
 
 if sys.version_info >= (3, 8):
     from typing import TypedDict
@@ -212,6 +212,11 @@ class Step(tmt.utils.Common):
     # in the list below to avoid deletion during pruning.
     _preserved_workdir_members: List[str] = ['step.yaml']
 
+    # Workdir members which survive when a step, interrupted in the middle,
+    # is woken up again, allowing the step to continue where it stopped.
+    # Unless specified, the whole workdir is removed to start from scratch.
+    _resumable_workdir_members: List[str] = []
+
     def __init__(
             self,
             *,
@@ -401,7 +406,10 @@ class Step(tmt.utils.Common):
         # directory to give it another chance with a fresh start.
         if self.status() == 'todo':
             self.debug("Step has not finished. Let's try once more!", level=2)
-            self._workdir_cleanup()
+            if self._resumable_workdir_members:
+                self._workdir_resume_cleanup()
+            else:
+                self._workdir_cleanup()
 
         # Importing here to avoid circular imports
         import tmt.steps.report
@@ -529,6 +537,21 @@ class Step(tmt.utils.Common):
         if self.workdir:
             self.debug('workdir', str(self.workdir), 'magenta')
 
+    def _workdir_resume_cleanup(self) -> None:
+        """ Clean up the workdir, keep only members needed to resume """
+        if self.workdir is None:
+            return
+
+        for member in self.workdir.iterdir():
+            if member.name in self._resumable_workdir_members:
+                self.debug(f"Keep '{member.relative_to(self.workdir)}' to resume.", level=3)
+                continue
+            self.debug(f"Remove '{member}'.", level=3)
+            if member.is_file() or member.is_symlink():
+                member.unlink()
+            else:
+                shutil.rmtree(member)
+
     def prune(self, logger: tmt.log.Logger) -> None:
         """ Remove all uninteresting files from the step workdir """
         if self.workdir is None:
@@ -1405,13 +1428,29 @@ class QueuedPhase(GuestlessTask, Task):
             environment=self.prepare_guest_environment(guest),
             logger=logger)
 
-    def go(self) -> Generator[TaskOutcome['Self'], None, None]:
-        # Based on the phase, pick the proper parent class' go()
+    # Based on the phase, pick the proper parent class' implementation
+    def units(self) -> List[Optional[str]]:
         if isinstance(self.phase, Action):
-            yield from GuestlessTask.go(self)
+            return GuestlessTask.units(self)
 
-        else:
-            yield from Task.go(self)
+        return Task.units(self)
+
+    def prepare_loggers(
+            self,
+            logger: tmt.log.Logger) -> Dict[str, tmt.log.Logger]:
+        if isinstance(self.phase, Action):
+            return GuestlessTask.prepare_loggers(self, logger)
+
+        return Task.prepare_loggers(self, logger)
+
+    def run_unit(
+            self,
+            name: Optional[str],
+            loggers: Dict[str, tmt.log.Logger]) -> TaskOutcome['Self']:
+        if isinstance(self.phase, Action):
+            return GuestlessTask.run_unit(self, name, loggers)
+
+        return Task.run_unit(self, name, loggers)
 
 
 class PhaseQueue(Queue[QueuedPhase]):
@@ -1421,14 +1460,19 @@ class PhaseQueue(Queue[QueuedPhase]):
             self,
             *,
             phase: Union[Action, Plugin],
-            guests: List['Guest']) -> None:
+            guests: List['Guest'],
+            logger: Optional[tmt.log.Logger] = None) -> None:
         """
         Add a phase to queue.
 
-        Phase will be executed on given guests, starting at the same time.
+        Phase will be executed on given guests, starting at the same time,
+        unless the queue is pipelined: then each guest starts the phase
+        once it is done with phases queued before.
 
         :param phase: phase to run.
         :param guests: one or more guests to run the phase on.
+        :param logger: if set, phase would log using this logger instead
+            of its own.
         """
 
         if not guests:
@@ -1438,7 +1482,7 @@ class PhaseQueue(Queue[QueuedPhase]):
         self.enqueue_task(QueuedPhase(
             phase=phase,
             guests=guests,
-            logger=phase._logger
+            logger=logger or phase._logger
             ))
 
 
@@ -118,6 +118,7 @@ class TestDescription(
     environment: tmt.utils.EnvironmentType = field(default_factory=dict)
     duration: str = '1h'
     result: str = 'respect'
+    parallel_safe: bool = False
 
     # ignore[override]: expected, we do want to accept more specific
     # type than the one declared in superclass.
@@ -141,6 +142,7 @@ class TestDescription(
         data['require'] = [require.to_spec() for require in self.require]
         data['recommend'] = [recommend.to_spec() for recommend in self.recommend]
         data['test'] = str(self.test)
+        data[tmt.utils.key_to_option('parallel_safe')] = data.pop('parallel_safe')
 
         return data
 
@@ -325,7 +327,8 @@ class DiscoverShell(tmt.steps.discover.DiscoverPlugin):
             test_fmf_keys: Dict[str, Any] = {
                 key: value
                 for key, value in data.to_spec().items()
-                if key != 'name' and (key == 'duration' or value != data.default(key))
+                if key != 'name' and (
+                    key == 'duration' or value != data.default(tmt.utils.option_to_key(key)))
                 }
             tests.child(data.name, test_fmf_keys)
 
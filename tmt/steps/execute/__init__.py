@@ -1,9 +1,12 @@
 import copy
 import dataclasses
 import datetime
+import json
+import os
 import re
+import threading
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Type, cast
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type, cast
 
 import click
 import fmf
@@ -14,7 +17,7 @@ import tmt.base
 import tmt.steps
 import tmt.utils
 from tmt.queue import TaskOutcome
-from tmt.result import Result, ResultGuestData, ResultOutcome
+from tmt.result import DurationHistory, Result, ResultGuestData, ResultOutcome
 from tmt.steps import Action, PhaseQueue, QueuedPhase, Step, StepData
 from tmt.steps.provision import Guest
 from tmt.utils import Path
@@ -37,6 +40,9 @@ TEST_OUTPUT_FILENAME = 'output.txt'
 # Metadata file with details about the current test
 TEST_METADATA_FILENAME = 'metadata.yaml'
 
+# Journal of results, appended as soon as each test finishes
+RESULTS_JOURNAL_FILENAME = 'results.jsonl'
+
 # Scripts source directory
 SCRIPTS_SRC_DIR = Path(pkg_resources.resource_filename(
     'tmt', 'steps/execute/scripts'))
@@ -99,6 +105,13 @@ TMT_ABORT_SCRIPT = ScriptCreatingFile(
     created_file="abort"
     )
 
+# Agent executing tests, installed only when requested
+TMT_AGENT_SCRIPT = Script(
+    path=Path("/usr/local/bin/tmt-agent"),
+    aliases=[],
+    related_variables=[]
+    )
+
 # List of all available scripts
 SCRIPTS = (
     TMT_ABORT_SCRIPT,
@@ -113,6 +126,7 @@ class ExecuteStepData(tmt.steps.WhereableStepData, tmt.steps.StepData):
     # TODO: ugly circular dependency (see tmt.base.DEFAULT_TEST_DURATION_L2)
     duration: str = '1h'
     exit_first: bool = False
+    duration_history: Optional[str] = None
 
 
 class ExecutePlugin(tmt.steps.Plugin):
@@ -175,6 +189,12 @@ class ExecutePlugin(tmt.steps.Plugin):
             click.option(
                 '-x', '--exit-first', is_flag=True,
                 help='Stop execution after the first test failure.'),
+            # Start the longest tests first
+            click.option(
+                '--duration-history', metavar='PATH',
+                help='File with durations of previously executed tests. '
+                     'The longest tests are started first, the file is updated '
+                     'with durations of executed tests.'),
             ] + super().options(how)
 
     def go(
@@ -188,6 +208,16 @@ class ExecutePlugin(tmt.steps.Plugin):
             'exit-first', self.get('exit-first', default=False),
             'green', level=2)
 
+    @property
+    def duration_history(self) -> Optional[DurationHistory]:
+        """ Duration history of tests, if enabled """
+        path = self.get('duration-history')
+
+        if not path:
+            return None
+
+        return DurationHistory(Path(path).expanduser(), self._logger)
+
     @property
     def discover(self) -> tmt.steps.discover.Discover:
         """ Return discover plugin instance """
@@ -236,6 +266,13 @@ class ExecutePlugin(tmt.steps.Plugin):
         and finally return a list of discovered tests.
         """
         tests: List[tmt.Test] = self.discover.tests(phase_name=self.discover_phase, enabled=True)
+
+        # Start the longest tests first to shorten the total time
+        history = self.duration_history
+        if history is not None:
+            self.debug(f"Sort tests by durations from '{history.path}'.", level=2)
+            tests = history.sort(tests)
+
         for test in tests:
             metadata_filename = self.data_path(
                 test, guest, filename=TEST_METADATA_FILENAME, full=True, create=True)
@@ -531,6 +568,10 @@ class Execute(tmt.steps.Step):
 
     _preserved_workdir_members = ['step.yaml', 'results.yaml', 'data']
 
+    # Results of finished tests and their data are kept, tests are not
+    # executed again when an interrupted run is resumed
+    _resumable_workdir_members = [RESULTS_JOURNAL_FILENAME, 'data']
+
     def __init__(
             self,
             *,
@@ -541,6 +582,12 @@ class Execute(tmt.steps.Step):
         super().__init__(plan=plan, data=data, logger=logger)
         # List of Result() objects representing test results
         self._results: List[tmt.Result] = []
+        # Results recorded in the journal by a previous, interrupted attempt,
+        # together with fmf ids of their tests
+        self._journal: List[Tuple[tmt.Result, Dict[str, Any]]] = []
+        # Journaled results of tests which have not been executed again
+        self._resumed_results: List[tmt.Result] = []
+        self._journal_lock = threading.Lock()
 
     def load(self) -> None:
         """ Load test results """
@@ -578,9 +625,92 @@ class Execute(tmt.steps.Step):
                 'Execute wake up complete (already done before).', level=2)
         # Save status and step data (now we know what to do)
         else:
+            self._journal = self._load_journal()
             self.status('todo')
             self.save()
 
+    @property
+    def _journal_path(self) -> Path:
+        assert self.workdir is not None  # narrow type
+        return self.workdir / RESULTS_JOURNAL_FILENAME
+
+    def _load_journal(self) -> List[Tuple["tmt.Result", Dict[str, Any]]]:
+        """ Load results recorded before the step was interrupted """
+        if not self._journal_path.exists():
+            return []
+
+        journal: List[Tuple[tmt.Result, Dict[str, Any]]] = []
+        for line in self._journal_path.read_text().splitlines():
+            try:
+                entry = json.loads(line)
+                journal.append((Result.from_serialized(entry['result']), entry['fmf-id']))
+            # The last line may be incomplete if tmt was killed while writing it
+            except (ValueError, KeyError, TypeError):
+                self.debug(f"Ignore invalid results journal line '{line}'.", level=3)
+
+        if journal:
+            self.info(
+                'resume', f'{fmf.utils.listed(journal, "result")} from the previous run',
+                'green', shift=1)
+
+        return journal
+
+    def record_results(self, test: "tmt.Test", results: List["tmt.Result"]) -> None:
+        """ Append results of a finished test to the journal """
+        fmf_id = test.fmf_id.to_spec()
+
+        with self._journal_lock:
+            with open(self._journal_path, 'a') as journal:
+                for result in results:
+                    journal.write(json.dumps({
+                        'fmf-id': fmf_id,
+                        'result': result.to_serialized()
+                        }) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def resume_results(
+            self,
+            tests: List["tmt.Test"],
+            guest: Optional[Guest] = None) -> List["tmt.Result"]:
+        """
+        Results of given tests finished before the step was interrupted
+
+        Results are matched to tests by the serial number, the name and
+        the fmf id of the test, so results of a different test are not
+        picked up when discover has been run again. Matched results are
+        merged with results of tests executed now.
+
+        :param tests: tests to look for.
+        :param guest: if set, only results from this guest are reported.
+        """
+        by_serial_number = {test.serialnumber: test for test in tests}
+        fmf_ids: Dict[int, Dict[str, Any]] = {}
+        matched: List[tmt.Result] = []
+
+        for result, fmf_id in self._journal:
+            test = by_serial_number.get(result.serialnumber)
+            if test is None or (guest is not None and result.guest.name != guest.name):
+                continue
+
+            # Custom results are named after the test and their partial result
+            if result.name != test.name and not result.name.startswith(f'{test.name}/'):
+                continue
+
+            if test.serialnumber not in fmf_ids:
+                fmf_ids[test.serialnumber] = cast(Dict[str, Any], test.fmf_id.to_spec())
+            if fmf_ids[test.serialnumber] != fmf_id:
+                continue
+
+            matched.append(result)
+
+        with self._journal_lock:
+            self._resumed_results += [
+                result for result in matched
+                if not any(result is resumed for resumed in self._resumed_results)]
+
+        return matched
+
     def summary(self) -> None:
         """ Give a concise summary of the execution """
         tests = fmf.utils.listed(self.results(), 'test')
@@ -604,6 +734,8 @@ class Execute(tmt.steps.Step):
         # Execute the tests, store results
         from tmt.steps.discover import DiscoverPlugin
 
+        # Not limited by the maximum number of workers, tests of all guests
+        # have to run together, they may wait for each other
         queue = PhaseQueue('execute', self._logger.descend(logger_name=f'{self}.queue'))
 
         execute_phases = self.phases(classes=(ExecutePlugin,))
@@ -658,7 +790,18 @@ class Execute(tmt.steps.Step):
         # which would make results appear several times. Instead, we can reach
         # into the original plugin, and use it as a singleton "entry point" to
         # access all collected `_results`.
-        self._results += execute_phases[0].results()
+        #
+        # Results of tests resumed from the journal are merged by the serial
+        # number of their tests, so results follow the order of discovery.
+        self._results += sorted(
+            self._resumed_results + execute_phases[0].results(),
+            key=lambda result: result.serialnumber)
+
+        # Remember how long tests took for the future runs
+        history = execute_phases[0].duration_history
+        if history is not None:
+            history.update(self._results)
+            history.save()
 
         if failed_phases:
             # TODO: needs a better message...
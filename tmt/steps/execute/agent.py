@@ -0,0 +1,290 @@
+import base64
+import json
+import os
+import queue
+import stat
+import subprocess
+import threading
+from typing import IO, Any, Dict, List, Optional, cast
+
+import tmt.log
+import tmt.steps.execute
+import tmt.utils
+from tmt.steps.provision import GuestSsh
+from tmt.utils import BaseLoggerFnType, Command, Path, ShellScript
+
+# Time to wait for the agent to come up, in seconds
+AGENT_START_TIMEOUT = 60
+
+# Agent message, as decoded from its JSON representation
+AgentMessage = Dict[str, Any]
+
+
+class Agent:
+    """
+    Client of the test execution agent running on a guest
+
+    The agent is started once per guest over the shared SSH master
+    connection and executes tests on behalf of tmt. Test wrapper is
+    delivered together with the job and files changed in the test data
+    directory are streamed back before the job result, therefore no
+    additional SSH or rsync processes need to be spawned for each test.
+    """
+
+    def __init__(self, *, guest: GuestSsh, logger: tmt.log.Logger) -> None:
+        self.guest = guest
+        self._logger = logger
+
+        self._process: Optional['subprocess.Popen[bytes]'] = None
+        self._reader: Optional[threading.Thread] = None
+
+        self._lock = threading.Lock()
+        self._job_id = 0
+        self._jobs: Dict[int, 'queue.Queue[Optional[AgentMessage]]'] = {}
+
+    @property
+    def is_running(self) -> bool:
+        """ True if the agent process is alive """
+        return self._process is not None and self._process.poll() is None
+
+    def _new_job(self) -> int:
+        """ Allocate a new job and its message queue """
+        with self._lock:
+            self._job_id += 1
+            self._jobs[self._job_id] = queue.Queue()
+            return self._job_id
+
+    def _send(self, message: AgentMessage) -> None:
+        """ Send a single message to the agent """
+        assert self._process is not None  # narrow type
+        assert self._process.stdin is not None  # narrow type
+
+        with self._lock:
+            self._process.stdin.write(json.dumps(message).encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+
+    def _read(self, stream: IO[bytes]) -> None:
+        """ Dispatch messages from the agent to queues of their jobs """
+        for line in stream:
+            try:
+                message = cast(AgentMessage, json.loads(line))
+
+            except ValueError:
+                self._logger.debug('agent', line.decode('utf-8', errors='replace'), level=3)
+                continue
+
+            with self._lock:
+                job = self._jobs.get(message.get('id', -1))
+
+            if job is not None:
+                job.put(message)
+
+        # The agent is gone, wake up everyone still waiting for it
+        with self._lock:
+            for job in self._jobs.values():
+                job.put(None)
+
+    def _command(self) -> Command:
+        """ Command starting the agent on the guest """
+        return self.guest._ssh_command() + Command(
+            self.guest._ssh_guest(),
+            f'python3 {tmt.steps.execute.TMT_AGENT_SCRIPT.path}')
+
+    def start(self) -> bool:
+        """
+        Start the agent on the guest
+
+        Return ``True`` if the agent is up and responding, ``False``
+        if it could not be started, e.g. when there is no Python
+        interpreter available on the guest.
+        """
+        self.stop()
+
+        command = self._command()
+        self._logger.debug(f"Start the test execution agent: {command}")
+
+        self._process = subprocess.Popen(
+            command.to_popen(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+        assert self._process.stdout is not None  # narrow type
+
+        self._reader = threading.Thread(
+            target=self._read, args=(self._process.stdout,), daemon=True)
+        self._reader.start()
+
+        job_id = self._new_job()
+        try:
+            self._send({'id': job_id, 'ping': True})
+            reply = self._jobs[job_id].get(timeout=AGENT_START_TIMEOUT)
+
+        except (OSError, queue.Empty):
+            reply = None
+
+        finally:
+            with self._lock:
+                del self._jobs[job_id]
+
+        if reply is None or not reply.get('pong'):
+            self.stop()
+            return False
+
+        return True
+
+    def stop(self) -> None:
+        """ Stop the agent, if it is running """
+        if self._process is None:
+            return
+
+        self._logger.debug('Stop the test execution agent.', level=2)
+
+        if self._process.stdin is not None:
+            try:
+                self._process.stdin.close()
+
+            except OSError:
+                pass
+
+        try:
+            self._process.wait(timeout=10)
+
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+        self._process = None
+
+    def execute(
+            self,
+            command: ShellScript,
+            *,
+            cwd: Path,
+            env: Optional[tmt.utils.EnvironmentType] = None,
+            timeout: Optional[int] = None,
+            files: Optional[Dict[Path, str]] = None,
+            collect: Optional[Path] = None,
+            exclude: Optional[List[str]] = None,
+            log: Optional[BaseLoggerFnType] = None,
+            output_file: Optional[Path] = None,
+            friendly_command: Optional[str] = None) -> str:
+        """
+        Execute a command on the guest using the agent
+
+        :param command: shell script to execute.
+        :param cwd: execute command in this directory on the guest.
+        :param env: environment variables to set for the command.
+        :param timeout: kill the command after this many seconds.
+        :param files: files to create on the guest before running the
+            command, mapping paths to their content.
+        :param collect: once the command finishes, fetch files created or
+            changed in this directory on the guest into the same local
+            path.
+        :param exclude: names of files which should not be collected.
+        :param log: logger to use for lines of the command output.
+        :param output_file: append the command output to this file as it
+            arrives, keep only its tail in memory.
+        :param friendly_command: nice, human-friendly representation
+            of the command.
+        :returns: the command output.
+        :raises RunError: when the command fails.
+        """
+        if not self.is_running:
+            raise tmt.utils.GeneralError('The test execution agent is not running.')
+
+        friendly_command = friendly_command or str(command)
+        self._logger.debug(f"Execute command '{command}' using the agent.")
+
+        job_id = self._new_job()
+        try:
+            self._send({
+                'id': job_id,
+                'command': str(command),
+                'cwd': str(cwd),
+                'environment': self.guest._prepare_environment(env),
+                'timeout': timeout,
+                'files': {str(path): content for path, content in (files or {}).items()},
+                'collect': str(collect) if collect else None,
+                'exclude': exclude or []
+                })
+
+            output = tmt.utils.StreamReader('out', logger=log, output_file=output_file)
+            while True:
+                message = self._jobs[job_id].get()
+
+                if message is None:
+                    output.close()
+                    raise tmt.utils.RunError(
+                        f"Connection to the agent lost while running '{friendly_command}'.",
+                        Command('tmt-agent'), 255, stdout=output.get_output())
+
+                if 'error' in message:
+                    output.close()
+                    raise tmt.utils.GeneralError(
+                        f"Agent failed to run '{friendly_command}': {message['error']}")
+
+                if 'output' in message:
+                    output.feed(message['output'].encode('utf-8'))
+                    continue
+
+                if any(key in message for key in ('file', 'link', 'directory')):
+                    if collect:
+                        self._store(message, collect)
+                    continue
+
+                output.close()
+                break
+
+        finally:
+            with self._lock:
+                del self._jobs[job_id]
+
+        stdout = output.get_output() or ''
+        returncode = int(message['returncode'])
+        if returncode != 0:
+            raise tmt.utils.RunError(
+                f"Command '{friendly_command}' returned {returncode}.",
+                Command('tmt-agent'), returncode, stdout=stdout)
+
+        return stdout
+
+    def _store(self, message: AgentMessage, destination: Path) -> None:
+        """ Store a piece of the collected directory sent by the agent """
+        relative = Path(message.get('file') or message.get('link') or message['directory'])
+
+        # Do not let the guest write outside of the directory
+        if relative.is_absolute() or '..' in relative.parts:
+            self._logger.debug(f"Ignoring unsafe path '{relative}' sent by the agent.")
+            return
+
+        path = destination / relative
+
+        if 'directory' in message:
+            path.mkdir(parents=True, exist_ok=True)
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Replace existing files, never write through links
+        if path.is_symlink() or ('link' in message and path.exists()):
+            path.unlink()
+
+        # Keep only links pointing inside the directory, like rsync --safe-links
+        if 'link' in message:
+            target = os.path.normpath(relative.parent / message['target'])
+            if Path(message['target']).is_absolute() or target.split(os.sep)[0] == '..':
+                self._logger.debug(f"Ignoring unsafe link '{relative}' sent by the agent.")
+                return
+
+            path.symlink_to(message['target'])
+            return
+
+        # Read-only files get their final mode once the first chunk is written
+        offset = int(message['offset'])
+        if offset and not os.access(path, os.W_OK):
+            path.chmod(path.stat().st_mode | stat.S_IWUSR)
+
+        with open(path, 'ab' if offset else 'wb') as file:
+            file.write(base64.b64decode(message['data']))
+
+        path.chmod(int(message['mode']))
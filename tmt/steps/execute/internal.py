@@ -1,9 +1,12 @@
+import concurrent.futures
 import dataclasses
 import datetime
 import json
 import os
+import shutil
 import sys
-from typing import Any, Dict, List, Optional, cast
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple, cast
 
 import click
 
@@ -16,12 +19,29 @@ import tmt.steps.execute
 import tmt.utils
 from tmt.base import Test
 from tmt.result import Result, ResultOutcome
-from tmt.steps.execute import (SCRIPTS, TEST_OUTPUT_FILENAME,
-                               TMT_FILE_SUBMIT_SCRIPT, TMT_REBOOT_SCRIPT)
-from tmt.steps.provision import Guest
+from tmt.steps.execute import (SCRIPTS, TEST_DATA, TEST_OUTPUT_FILENAME,
+                               TMT_ABORT_SCRIPT, TMT_AGENT_SCRIPT,
+                               TMT_FILE_SUBMIT_SCRIPT, TMT_REBOOT_SCRIPT,
+                               TMT_REPORT_RESULT_SCRIPT)
+from tmt.steps.execute.agent import Agent
+from tmt.steps.provision import Guest, GuestSsh
 from tmt.utils import EnvironmentType, Path, ShellScript
 
-TEST_WRAPPER_FILENAME = 'tmt-test-wrapper.sh'
+# Each test gets its own wrapper, tests sharing the same directory may
+# run at the same time when executed in parallel.
+TEST_WRAPPER_FILENAME = 'tmt-test-wrapper-{serial_number}.sh'
+
+# Files needed to evaluate test results and to decide what to do next,
+# relative to the test data directory
+TEST_CONTROL_FILES = [
+    'TestResults',
+    'journal.txt',
+    f'{TEST_DATA}/results.yaml',
+    f'{TEST_DATA}/results.json',
+    f'{TEST_DATA}/{TMT_REPORT_RESULT_SCRIPT.created_file}',
+    f'{TEST_DATA}/{TMT_REBOOT_SCRIPT.created_file}',
+    f'{TEST_DATA}/{TMT_ABORT_SCRIPT.created_file}',
+    ]
 
 TEST_WRAPPER_INTERACTIVE = '{remote_command}'
 TEST_WRAPPER_NONINTERACTIVE = 'set -eo pipefail; {remote_command} </dev/null |& cat'
@@ -31,6 +51,10 @@ TEST_WRAPPER_NONINTERACTIVE = 'set -eo pipefail; {remote_command} </dev/null |&
 class ExecuteInternalData(tmt.steps.execute.ExecuteStepData):
     script: List[ShellScript] = dataclasses.field(default_factory=list)
     interactive: bool = False
+    workers: int = 1
+    shard: bool = False
+    agent: bool = False
+    pull_batch: Optional[int] = None
 
     # ignore[override] & cast: two base classes define to_spec(), with conflicting
     # formal types.
@@ -57,6 +81,50 @@ class ExecuteInternalData(tmt.steps.execute.ExecuteStepData):
         return obj
 
 
+class PendingTests:
+    """
+    Tests waiting for their execution
+
+    A queue may be shared by several guests, each guest then pulls the
+    next batch of tests whenever it becomes idle.
+    """
+
+    def __init__(self, tests: List[Test]) -> None:
+        self.tests = tests
+        self._index = 0
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def next_batch(self, workers: int) -> List[Tuple[int, Test]]:
+        """
+        Pick tests to be executed next, together with their positions
+
+        Consecutive tests marked as parallel-safe are grouped together,
+        up to the given number of workers, so that other guests sharing
+        the queue get their share too. All other tests form a batch on
+        their own. An empty list is returned when there are no more
+        tests to execute.
+        """
+        with self._lock:
+            if self._stopped or self._index >= len(self.tests):
+                return []
+
+            batch = [(self._index, self.tests[self._index])]
+            if workers > 1 and self.tests[self._index].parallel_safe:
+                for position in range(self._index + 1, len(self.tests)):
+                    if len(batch) >= workers or not self.tests[position].parallel_safe:
+                        break
+                    batch.append((position, self.tests[position]))
+
+            self._index += len(batch)
+            return batch
+
+    def stop(self) -> None:
+        """ Do not hand out any more tests """
+        with self._lock:
+            self._stopped = True
+
+
 @tmt.steps.provides_method('tmt')
 class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
     """
@@ -74,6 +142,12 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         super().__init__(**kwargs)
         self._previous_progress_message = ""
         self.scripts = SCRIPTS
+        # Queues of tests shared by guests when sharding, one per each
+        # discover phase. Copies of this phase share the same mapping.
+        self._shared_queues: Dict[Optional[str], PendingTests] = {}
+        self._shared_queues_lock = threading.Lock()
+        # Test execution agents, by guest name
+        self._agents: Dict[str, Agent] = {}
 
     @classmethod
     def options(cls, how: Optional[str] = None) -> List[tmt.options.ClickOptionDecoratorType]:
@@ -89,7 +163,26 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
             # Disable interactive progress bar
             click.option(
                 '--no-progress-bar', is_flag=True,
-                help='Disable interactive progress bar showing the current test.')
+                help='Disable interactive progress bar showing the current test.'),
+            # Number of parallel-safe tests to run at the same time
+            click.option(
+                '--workers', metavar='NUMBER', type=int,
+                help='Number of parallel-safe tests to be executed at the same time.'),
+            # Split tests among guests
+            click.option(
+                '--shard', is_flag=True,
+                help='Split tests among all guests instead of running them on each guest.'),
+            # Persistent agent on guests
+            click.option(
+                '--agent', is_flag=True,
+                help='Execute tests using an agent running on the guest, '
+                     'avoids spawning new connections for each test.'),
+            # Pull test artifacts in batches
+            click.option(
+                '--pull-batch', metavar='NUMBER', type=int,
+                help='Pull only files needed to evaluate results after each test, '
+                     'pull the rest after this many tests. Use 0 to pull them '
+                     'once all tests are finished.')
             ] + super().options(how)
 
     # TODO: consider switching to utils.updatable_message() - might need more
@@ -196,7 +289,8 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         # Create data directory, prepare test environment
         environment = self._test_environment(test, guest, extra_environment)
 
-        test_wrapper_filepath = workdir / TEST_WRAPPER_FILENAME
+        test_wrapper_filename = TEST_WRAPPER_FILENAME.format(serial_number=test.serialnumber)
+        test_wrapper_filepath = workdir / test_wrapper_filename
 
         # Prepare the test command (use default options for shell tests)
         if test.framework == "shell":
@@ -205,16 +299,18 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
             test_command = test.test
         logger.debug('Test script', str(test_command), level=3)
 
-        # Prepare the wrapper, push to guest
+        # Prepare the wrapper, push to guest (agent delivers it with the job)
+        agent = self._agents.get(guest.name)
         self.write(test_wrapper_filepath, str(test_command), 'w')
         test_wrapper_filepath.chmod(0o755)
-        guest.push(
-            source=test_wrapper_filepath,
-            destination=test_wrapper_filepath,
-            options=["-s", "-p", "--chmod=755"])
+        if agent is None:
+            guest.push(
+                source=test_wrapper_filepath,
+                destination=test_wrapper_filepath,
+                options=["-s", "-p", "--chmod=755"])
 
         # Prepare the actual remote command
-        remote_command = ShellScript(f'./{TEST_WRAPPER_FILENAME}')
+        remote_command = ShellScript(f'./{test_wrapper_filename}')
         if self.get('interactive'):
             remote_command = ShellScript(
                 TEST_WRAPPER_INTERACTIVE.format(
@@ -239,29 +335,45 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
                 level=level,
                 topic=topic)
 
-        # Execute the test, save the output and return code
+        # Execute the test, stream the output into the log, save return code
+        output_file = self.data_path(test, guest, TEST_OUTPUT_FILENAME, full=True)
         starttime = datetime.datetime.now(datetime.timezone.utc)
         try:
-            stdout, _ = guest.execute(
-                remote_command,
-                cwd=workdir,
-                env=environment,
-                join=True,
-                interactive=self.get('interactive'),
-                log=_test_output_logger,
-                timeout=tmt.utils.duration_to_seconds(test.duration),
-                test_session=True,
-                friendly_command=str(test.test))
+            if agent is not None:
+                # Test data directory is fetched together with the result
+                agent.execute(
+                    remote_command,
+                    cwd=workdir,
+                    env=environment,
+                    timeout=tmt.utils.duration_to_seconds(test.duration),
+                    files={test_wrapper_filepath: str(test_command)},
+                    collect=self.data_path(test, guest, full=True),
+                    exclude=['backup*'] if test.framework == 'beakerlib' else [],
+                    log=_test_output_logger,
+                    output_file=output_file,
+                    friendly_command=str(test.test))
+            else:
+                guest.execute(
+                    remote_command,
+                    cwd=workdir,
+                    env=environment,
+                    join=True,
+                    interactive=self.get('interactive'),
+                    log=_test_output_logger,
+                    timeout=tmt.utils.duration_to_seconds(test.duration),
+                    test_session=True,
+                    output_file=output_file,
+                    friendly_command=str(test.test))
             test.returncode = 0
         except tmt.utils.RunError as error:
-            stdout = error.stdout
             test.returncode = error.returncode
             if test.returncode == tmt.utils.PROCESS_TIMEOUT:
                 logger.debug(f"Test duration '{test.duration}' exceeded.")
         endtime = datetime.datetime.now(datetime.timezone.utc)
-        self.write(
-            self.data_path(test, guest, TEST_OUTPUT_FILENAME, full=True),
-            stdout or '', mode='a', level=3)
+
+        # Nothing is captured in the interactive mode, the log must exist
+        if not self.opt('dry'):
+            output_file.touch()
 
         test.starttime = self.format_timestamp(starttime)
         test.endtime = self.format_timestamp(endtime)
@@ -354,6 +466,170 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
 
         self._run_tests(guest=guest, extra_environment=environment, logger=logger)
 
+    def _run_test(
+            self,
+            *,
+            test: Test,
+            guest: Guest,
+            extra_environment: Optional[EnvironmentType] = None,
+            logger: tmt.log.Logger) -> List[Result]:
+        """ Execute a single test, pull its data and check results """
+        self.execute(
+            test=test,
+            guest=guest,
+            extra_environment=extra_environment,
+            logger=logger)
+
+        # Pull test logs from the guest (with the agent, test logs have
+        # been delivered already). When pulling in batches, fetch just
+        # files needed to process results, the rest comes later.
+        if guest.name not in self._agents:
+            self._pull_test_data(
+                test, guest, control_only=self.get('pull-batch') is not None)
+
+        return self.check(test, guest)  # Produce list of results
+
+    def _pull_test_data(self, test: Test, guest: Guest, control_only: bool = False) -> None:
+        """ Pull test data directory from the guest, exclude beakerlib backups """
+        options: List[str] = []
+        if test.framework == "beakerlib":
+            options += [
+                "--exclude",
+                str(self.data_path(test, guest, "backup*", full=True))]
+        if control_only:
+            options += ["--prune-empty-dirs", "--include", "*/"]
+            for filename in TEST_CONTROL_FILES:
+                options += ["--include", str(self.data_path(test, guest, filename, full=True))]
+            options += ["--exclude", "*"]
+        guest.pull(
+            source=self.data_path(test, guest, full=True),
+            extend_options=options or None)
+
+    def _pull_guest_data(self, guest: Guest, tests: List[Test]) -> None:
+        """
+        Pull data directories of all tests executed on the guest at once
+
+        Beakerlib backups of given tests, i.e. all tests executed on the
+        guest so far, are excluded the same way as when pulling data of
+        a single test.
+        """
+        assert self.step.workdir is not None  # narrow type
+        guest_data = self.step.workdir / tmt.steps.execute.TEST_DATA / 'guest' / guest.name
+        self.debug(f"Pull test data of guest '{guest.name}'.", level=2)
+        options: List[str] = []
+        for test in tests:
+            if test.framework == "beakerlib":
+                options += [
+                    "--exclude",
+                    str(self.data_path(test, guest, "backup*", full=True))]
+        guest.pull(source=guest_data, extend_options=options or None)
+
+    def _run_batch(
+            self,
+            *,
+            batch: List[Test],
+            workers: int,
+            guest: Guest,
+            extra_environment: Optional[EnvironmentType] = None,
+            logger: tmt.log.Logger) -> List[List[Result]]:
+        """ Execute given tests, return their results in the same order """
+        if len(batch) == 1:
+            return [self._run_test(
+                test=batch[0],
+                guest=guest,
+                extra_environment=extra_environment,
+                logger=logger)]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._run_test,
+                    test=test,
+                    guest=guest,
+                    extra_environment=extra_environment,
+                    logger=logger)
+                for test in batch
+                ]
+
+            # Exceptions raised by tests are propagated by `result()`
+            return [future.result() for future in futures]
+
+    def _test_queue(self, tests: List[Test], guest: Guest, logger: tmt.log.Logger) -> PendingTests:
+        """
+        Provide the queue of tests to be executed on the given guest
+
+        Each guest gets its own queue of all tests by default. When tests
+        are sharded, all guests share one queue per discover phase.
+        """
+        if not self.get('shard'):
+            return PendingTests(tests)
+
+        with self._shared_queues_lock:
+            if self.discover_phase not in self._shared_queues:
+                self._shared_queues[self.discover_phase] = PendingTests(tests)
+            else:
+                logger.debug(f"Join the queue of tests shared by guests as '{guest.name}'.")
+            return self._shared_queues[self.discover_phase]
+
+    def _start_agent(self, guest: Guest, logger: tmt.log.Logger) -> None:
+        """ Start the test execution agent on the guest, if requested """
+        if not self.get('agent'):
+            return
+
+        if self.get('interactive') or guest.localhost or not isinstance(guest, GuestSsh):
+            logger.warn('Test execution agent is not supported here, running tests directly.')
+            return
+
+        guest.push(
+            source=tmt.steps.execute.SCRIPTS_SRC_DIR / TMT_AGENT_SCRIPT.path.name,
+            destination=TMT_AGENT_SCRIPT.path,
+            options=["-p", "--chmod=755"],
+            superuser=True)
+
+        agent = Agent(guest=guest, logger=logger)
+        if not agent.start():
+            logger.warn('Failed to start the test execution agent, running tests directly.')
+            return
+
+        self._agents[guest.name] = agent
+
+    def _restart_agent(self, guest: Guest, logger: tmt.log.Logger) -> None:
+        """ Start the agent again, e.g. after the guest reboot """
+        agent = self._agents.get(guest.name)
+        if agent is None:
+            return
+
+        if not agent.start():
+            logger.warn('Failed to restart the test execution agent, running tests directly.')
+            del self._agents[guest.name]
+
+    def _finished_tests(self, tests: List[tmt.Test], guest: Guest) -> Set[int]:
+        """
+        Tests which have been finished before the step was interrupted
+
+        Serial numbers of tests are reported, names cannot be used
+        because custom results are named after partial results. Unless
+        tests are sharded, only tests finished on the given guest are
+        reported.
+        """
+        assert isinstance(self.step, tmt.steps.execute.Execute)  # narrow type
+
+        return {
+            result.serialnumber
+            for result in self.step.resume_results(
+                tests, guest=None if self.get('shard') else guest)
+            }
+
+    def _remove_unfinished_data(self, finished: Set[int], guest: Guest) -> None:
+        """ Remove data left by tests interrupted in the middle """
+        for test in self.discover.tests(phase_name=self.discover_phase, enabled=True):
+            if test.serialnumber in finished:
+                continue
+            data_path = self.data_path(test, guest, full=True)
+            if data_path.exists():
+                self.debug(f"Remove data of unfinished test '{test.name}'.", level=3)
+                shutil.rmtree(data_path)
+
     def _run_tests(
             self,
             *,
@@ -362,97 +638,165 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
             logger: tmt.log.Logger) -> None:
         """ Execute tests on provided guest """
 
-        # Prepare tests and helper scripts, check options
-        tests = self.prepare_tests(guest)
+        # Prepare tests and helper scripts, check options. Tests finished
+        # before the step was interrupted are not executed again.
+        finished = self._finished_tests(
+            self.discover.tests(phase_name=self.discover_phase, enabled=True), guest)
+        if finished:
+            self._remove_unfinished_data(finished, guest)
+        tests = [
+            test for test in self.prepare_tests(guest)
+            if test.serialnumber not in finished
+            ]
         exit_first = self.get('exit-first', default=False)
 
+        # Interactive mode and logging in after each test need tests
+        # to be executed one by one
+        workers = self.get('workers', default=1) or 1
+        if workers > 1 and (self.get('interactive') or self._login_after_test):
+            logger.debug('Parallel execution disabled, running tests one by one.')
+            workers = 1
+        logger.verbose('workers', str(workers), 'green', level=2)
+
         # Prepare scripts, except localhost guest
         if not guest.localhost:
             self.prepare_scripts(guest)
 
         # Push workdir to guest and execute tests
         guest.push()
-        # We cannot use enumerate here due to continue in the code
-        index = 0
-        while index < len(tests):
-            test = tests[index]
-
-            progress = f"{index + 1}/{len(tests)}"
-            self._show_progress(progress, test.name)
-            logger.verbose(
-                'test', test.summary or test.name, color='cyan', shift=1, level=2)
-
-            self.execute(
-                test=test,
-                guest=guest,
-                extra_environment=extra_environment,
-                logger=logger)
-
-            # Pull test logs from the guest, exclude beakerlib backups
-            if test.framework == "beakerlib":
-                exclude = [
-                    "--exclude",
-                    str(self.data_path(test, guest, "backup*", full=True))]
-            else:
-                exclude = None
-            guest.pull(
-                source=self.data_path(test, guest, full=True),
-                extend_options=exclude)
-
-            results = self.check(test, guest)  # Produce list of results
-            assert test.real_duration is not None  # narrow type
-            duration = click.style(test.real_duration, fg='cyan')
-            shift = 1 if self.opt('verbose') < 2 else 2
-
-            # Handle reboot, abort, exit-first
-            if self._will_reboot(test, guest):
-                # Output before the reboot
-                logger.verbose(
-                    f"{duration} {test.name} [{progress}]", shift=shift)
-                try:
-                    if self._handle_reboot(test, guest):
-                        continue
-                except tmt.utils.RebootTimeoutError:
+        queue = self._test_queue(tests, guest, logger)
+        self._start_agent(guest, logger)
+        pull_batch = self.get('pull-batch')
+        pending_pulls = 0
+        executed_tests: List[Test] = []
+        try:
+            while True:
+                positions_and_tests = queue.next_batch(workers)
+                if not positions_and_tests:
+                    break
+                first, last = positions_and_tests[0][0], positions_and_tests[-1][0]
+                batch = [test for _, test in positions_and_tests]
+
+                if len(batch) == 1:
+                    self._show_progress(f"{first + 1}/{len(tests)}", batch[0].name)
+                else:
+                    self._show_progress(
+                        f"{first + 1}-{last + 1}/{len(tests)}", f'{len(batch)} parallel tests')
+                for test in batch:
+                    logger.verbose(
+                        'test', test.summary or test.name, color='cyan', shift=1, level=2)
+
+                batch_results = self._run_batch(
+                    batch=batch,
+                    workers=workers,
+                    guest=guest,
+                    extra_environment=extra_environment,
+                    logger=logger)
+
+                # Process results in the discovery order, no matter in which
+                # order the tests actually finished
+                stop: Optional[Tuple[Test, str]] = None
+                for (position, test), results in zip(positions_and_tests, batch_results):
+                    progress = f"{position + 1}/{len(tests)}"
+                    shift = 1 if self.opt('verbose') < 2 else 2
+
+                    # Handle reboot, run the test again once the guest is back
+                    while self._will_reboot(test, guest):
+                        # Test data are pushed back to the guest, fetch
+                        # them all first
+                        if pull_batch is not None and guest.name not in self._agents:
+                            self._pull_test_data(test, guest)
+                        assert test.real_duration is not None  # narrow type
+                        duration = click.style(test.real_duration, fg='cyan')
+                        # Output before the reboot
+                        logger.verbose(
+                            f"{duration} {test.name} [{progress}]", shift=shift)
+                        try:
+                            self._handle_reboot(test, guest)
+                        except tmt.utils.RebootTimeoutError:
+                            for result in results:
+                                result.result = ResultOutcome.ERROR
+                                result.note = 'reboot timeout'
+                            break
+                        # Agent does not survive the reboot
+                        self._restart_agent(guest, logger)
+                        self._show_progress(progress, test.name)
+                        logger.verbose(
+                            'test', test.summary or test.name, color='cyan', shift=1, level=2)
+                        results = self._run_test(
+                            test=test,
+                            guest=guest,
+                            extra_environment=extra_environment,
+                            logger=logger)
+
+                    # Data of tests run by the agent have been streamed already,
+                    # the rest is fetched below, even if the execution stops
+                    executed_tests.append(test)
+                    if guest.name not in self._agents:
+                        pending_pulls += 1
+
+                    # Handle abort, exit-first
+                    abort = self.check_abort_file(test, guest)
+                    if abort:
+                        for result in results:
+                            # In case of aborted all results in list will be aborted
+                            result.note = 'aborted'
+                    self._results.extend(results)
+                    assert isinstance(self.step, tmt.steps.execute.Execute)  # narrow type
+                    self.step.record_results(test, results)
                     for result in results:
-                        result.result = ResultOutcome.ERROR
-                        result.note = 'reboot timeout'
-            abort = self.check_abort_file(test, guest)
-            if abort:
-                for result in results:
-                    # In case of aborted all results in list will be aborted
-                    result.note = 'aborted'
-            self._results.extend(results)
-            for result in results:
-                # If test duration information is missing, print 8 spaces to keep indention
-                duration = click.style(result.duration, fg='cyan') if result.duration else 8 * ' '
-                logger.verbose(f"{duration} {result.show()} [{progress}]", shift=shift)
-            if (abort or exit_first and
-                    result.result not in (ResultOutcome.PASS, ResultOutcome.INFO)):
-                # Clear the progress bar before outputting
-                self._show_progress('', '', True)
-                what_happened = "aborted" if abort else "failed"
-                self.warn(
-                    f'Test {test.name} {what_happened}, stopping execution.')
-                break
-            index += 1
-
-            # Log into the guest after each executed test if "login
-            # --test" option is provided
-            if self._login_after_test:
-                assert test.path is not None  # narrow type
+                        # If test duration information is missing, print 8 spaces to keep indention
+                        duration = click.style(
+                            result.duration, fg='cyan') if result.duration else 8 * ' '
+                        logger.verbose(f"{duration} {result.show()} [{progress}]", shift=shift)
+                    failed = any(
+                        result.result not in (ResultOutcome.PASS, ResultOutcome.INFO)
+                        for result in results)
+                    if stop is None and (abort or (exit_first and failed)):
+                        stop = (test, "aborted" if abort else "failed")
+
+                    # Log into the guest after each executed test if "login
+                    # --test" option is provided
+                    if self._login_after_test and stop is None:
+                        assert test.path is not None  # narrow type
+
+                        if self.discover.workdir is None:
+                            cwd = test.path.unrooted()
+                        else:
+                            cwd = self.discover.workdir / test.path.unrooted()
+                        self._login_after_test.after_test(
+                            results[-1],
+                            cwd=cwd,
+                            env=self._test_environment(test, guest, extra_environment),
+                            )
+
+                # Tests of the batch have been executed already, their results
+                # are kept, but no other tests will be started
+                if stop is not None:
+                    # Clear the progress bar before outputting
+                    self._show_progress('', '', True)
+                    test, what_happened = stop
+                    self.warn(
+                        f'Test {test.name} {what_happened}, stopping execution.')
+                    queue.stop()
+                    break
+
+                # Fetch test artifacts collected so far
+                if pull_batch and pending_pulls >= pull_batch:
+                    self._pull_guest_data(guest, executed_tests)
+                    pending_pulls = 0
+        finally:
+            agent = self._agents.pop(guest.name, None)
+            if agent is not None:
+                agent.stop()
 
-                if self.discover.workdir is None:
-                    cwd = test.path.unrooted()
-                else:
-                    cwd = self.discover.workdir / test.path.unrooted()
-                self._login_after_test.after_test(
-                    result,
-                    cwd=cwd,
-                    env=self._test_environment(test, guest, extra_environment),
-                    )
         # Overwrite the progress bar, the test data is irrelevant
         self._show_progress('', '', True)
 
+        # Pull the remaining test artifacts
+        if pull_batch is not None and pending_pulls:
+            self._pull_guest_data(guest, executed_tests)
+
         # Pull artifacts created in the plan data directory
         self.debug("Pull the plan data directory.", level=2)
         guest.pull(source=self.step.plan.data_directory)
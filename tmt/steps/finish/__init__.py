@@ -127,8 +127,10 @@ class Finish(tmt.steps.Step):
             if self.phases():
                 guest_copy.pull(self.plan.data_directory)
 
-        # Stop and remove provisioned guests
+        # Stop and remove provisioned guests, pooled ones are kept warm
         for guest in self.plan.provision.guests():
+            if guest.return_to_pool():
+                continue
             guest.stop()
             guest.remove()
 
@@ -1,9 +1,19 @@
 import collections
 import copy
 import dataclasses
+import hashlib
+import json
+import shlex
+import sys
+import threading
 from typing import (TYPE_CHECKING, Any, DefaultDict, Dict, List, Optional,
                     Type, cast)
 
+if sys.version_info >= (3, 8):
+    from typing import TypedDict
+else:
+    from typing_extensions import TypedDict
+
 import click
 import fmf
 import fmf.utils
@@ -17,7 +27,7 @@ from tmt.queue import Queue, TaskOutcome
 from tmt.steps import (Action, GuestSyncTaskT, PhaseQueue, PullTask, PushTask,
                        QueuedPhase)
 from tmt.steps.provision import Guest
-from tmt.utils import uniq
+from tmt.utils import Path, uniq
 
 if TYPE_CHECKING:
     import tmt.base
@@ -30,7 +40,13 @@ class PrepareStepData(tmt.steps.WhereableStepData, tmt.steps.StepData):
     pass
 
 
-class _RawPrepareStepData(tmt.steps._RawStepData, total=False):
+# Keys which are not valid identifiers
+_RawPrepareStepKeys = TypedDict('_RawPrepareStepKeys', {
+    'package-cache': bool
+    }, total=False)
+
+
+class _RawPrepareStepData(tmt.steps._RawStepData, _RawPrepareStepKeys, total=False):
     package: List[str]
     missing: str
     roles: DefaultDict[str, List[str]]
@@ -112,6 +128,15 @@ class Prepare(tmt.steps.Step):
         super().__init__(plan=plan, data=data, logger=logger)
         self.preparations_applied = 0
 
+        # Implicit phases are added just once, either by the first guest
+        # prepared early, or by go()
+        self._implicit_phases_added = False
+        self._lock = threading.Lock()
+
+        # Guests which went through early phases as soon as they have been
+        # provisioned, see prepare_guest()
+        self._prepared_guests: List[str] = []
+
     def wake(self) -> None:
         """ Wake up the step (process workdir and command line) """
         super().wake()
@@ -158,10 +183,17 @@ class Prepare(tmt.steps.Step):
                 host_mapping[guest.name] = guest.guest
         return host_mapping
 
-    def _sync_with_guests(self, action: str, task: GuestSyncTaskT) -> None:
+    def _sync_with_guests(
+            self,
+            action: str,
+            task: GuestSyncTaskT,
+            logger: Optional[tmt.log.Logger] = None) -> None:
+        logger = logger or self._logger
+
         queue: Queue[GuestSyncTaskT] = Queue(
             action,
-            self._logger.descend(logger_name=f'{self}.{action}'))
+            logger.descend(logger_name=f'{self}.{action}'),
+            max_workers=self.opt('max-workers'))
 
         queue.enqueue_task(task)
 
@@ -178,20 +210,10 @@ class Prepare(tmt.steps.Step):
             # TODO: needs a better message...
             raise tmt.utils.GeneralError('prepare step failed') from failed_actions[0].exc
 
-    def go(self) -> None:
-        """ Prepare the guests """
-        super().go()
-
-        # Nothing more to do if already done
-        if self.status() == 'done':
-            self.info('status', 'done', 'green', shift=1)
-            self.summary()
-            self.actions()
-            return
-
+    def required_packages(self) -> List[str]:
+        """ Packages required by tests and by steps of the plan """
         import tmt.base
 
-        # Required packages
         requires = uniq([
             *self.plan.discover.requires(),
             *self.plan.provision.requires(),
@@ -201,42 +223,67 @@ class Prepare(tmt.steps.Step):
             *self.plan.finish.requires()
             ])
 
+        return [
+            require.to_spec()
+            for require in tmt.base.assert_simple_requirements(
+                requires,
+                'After beakerlib processing, tests may have only simple requirements',
+                self._logger)
+            ]
+
+    def recommended_packages(self) -> List[str]:
+        """ Packages recommended by tests """
+        import tmt.base
+
+        return [
+            recommend.to_spec()
+            for recommend in tmt.base.assert_simple_requirements(
+                uniq(self.plan.discover.recommends()),
+                'After beakerlib processing, tests may have only simple requirements',
+                self._logger)
+            ]
+
+    def _add_implicit_phases(self) -> None:
+        """ Add phases installing required and recommended packages """
+        with self._lock:
+            if self._implicit_phases_added:
+                return
+            self._implicit_phases_added = True
+
+        # Share the package cache if enabled by any install phase
+        package_cache = any(
+            phase.get('how') == 'install' and phase.get('package-cache')
+            for phase in self.phases(classes=PreparePlugin))
+
+        # Required packages
+        requires = self.required_packages()
         if requires:
             data: _RawPrepareStepData = dict(
                 how='install',
                 name='requires',
                 summary='Install required packages',
                 order=tmt.utils.DEFAULT_PLUGIN_ORDER_REQUIRES,
-                package=[
-                    require.to_spec()
-                    for require in tmt.base.assert_simple_requirements(
-                        requires,
-                        'After beakerlib processing, tests may have only simple requirements',
-                        self._logger)
-                    ])
+                package=requires)
+            data['package-cache'] = package_cache
             self._phases.append(PreparePlugin.delegate(self, raw_data=data))
 
         # Recommended packages
-        recommends = uniq(self.plan.discover.recommends())
+        recommends = self.recommended_packages()
         if recommends:
             data = dict(
                 how='install',
                 name='recommends',
                 summary='Install recommended packages',
                 order=tmt.utils.DEFAULT_PLUGIN_ORDER_RECOMMENDS,
-                package=[
-                    recommend.to_spec()
-                    for recommend in tmt.base.assert_simple_requirements(
-                        recommends,
-                        'After beakerlib processing, tests may have only simple requirements',
-                        self._logger)
-                    ],
+                package=recommends,
                 missing='skip')
+            data['package-cache'] = package_cache
             self._phases.append(PreparePlugin.delegate(self, raw_data=data))
 
-        # Implicit multihost setup
+    def _add_multihost_phase(self) -> None:
+        """ Add phase setting up guests for multihost testing """
         if self.plan.provision.is_multihost:
-            data = dict(
+            data: _RawPrepareStepData = dict(
                 how='multihost',
                 name='multihost',
                 summary='Setup guest for multihost testing',
@@ -246,19 +293,209 @@ class Prepare(tmt.steps.Step):
                 )
             self._phases.append(PreparePlugin.delegate(self, raw_data=data))
 
+    def _guest_copy(self, guest: Guest) -> Guest:
+        """
+        Create a guest copy and change its parent so that the operations
+        inside prepare plugins on the guest use the prepare step config
+        rather than provision step config.
+        """
+        guest_copy = copy.copy(guest)
+        guest_copy.inject_logger(
+            guest._logger.clone().apply_verbosity_options(**self._cli_options))
+        guest_copy.parent = self
+
+        return guest_copy
+
+    def _early_phases(self) -> List[PreparePlugin]:
+        """
+        Phases which may run on a guest before other guests are ready
+
+        Actions and phases restricted to particular guests by ``where``
+        are synchronization points, all guests need to be provisioned
+        before they start. Phases preceding the first synchronization
+        point may run on each guest as soon as it is provisioned. The
+        multihost setup needs to know all guests, it is postponed until
+        they are ready.
+        """
+        early_phases: List[PreparePlugin] = []
+
+        for phase in self.phases(classes=(Action, PreparePlugin)):
+            if not isinstance(phase, PreparePlugin) or phase.get('where'):
+                break
+
+            if phase.get('how') == 'multihost':
+                continue
+
+            early_phases.append(phase)
+
+        return early_phases
+
+    @staticmethod
+    def _referenced_files(value: Any, root: Path) -> Dict[str, str]:
+        """
+        Digests of files in the metadata tree referenced by phase data
+
+        Every word of string values, e.g. scripts or playbooks, which
+        is a relative path of a file in the tree is taken into account.
+        """
+        if isinstance(value, dict):
+            value = list(value.values())
+
+        if isinstance(value, list):
+            return {
+                name: digest
+                for item in value
+                for name, digest in Prepare._referenced_files(item, root).items()
+                }
+
+        if not isinstance(value, str):
+            return {}
+
+        try:
+            words = shlex.split(value)
+
+        except ValueError:
+            words = value.split()
+
+        digests: Dict[str, str] = {}
+
+        for word in words:
+            if '://' in word or Path(word).is_absolute():
+                continue
+
+            path = (root / word).resolve()
+            if root not in path.parents or not path.is_file():
+                continue
+
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as content:
+                for chunk in iter(lambda: content.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+
+            digests[str(path.relative_to(root))] = hasher.hexdigest()
+
+        return digests
+
+    def fingerprint(self, provision: 'tmt.steps.provision.ProvisionPlugin') -> str:
+        """
+        Fingerprint of the preparation of a guest
+
+        Covers data of the provision phase creating the guest, and data
+        of prepare phases applied to the guest in their order, including
+        packages required and recommended by tests, and content of
+        files in the metadata tree referenced by these phases, e.g.
+        scripts or playbooks. Guests with the same fingerprint end up
+        prepared the same way, once guests bind the fingerprint to the
+        base image they are started from, see
+        :py:meth:`tmt.steps.provision.Guest.bind_prepare_fingerprint`.
+        The multihost setup depends on other guests, it is not covered.
+        """
+        self._add_implicit_phases()
+
+        destinations = (provision.name, provision.get('role'))
+        phases: List[Dict[str, Any]] = []
+        root = Path(self.plan.node.root).resolve() if self.plan.node.root else None
+        files: Dict[str, str] = {}
+
+        for phase in self.phases(classes=PreparePlugin):
+            where = phase.get('where')
+            if where and not any(destination in destinations for destination in where):
+                continue
+
+            if phase.get('how') == 'multihost':
+                continue
+
+            phases.append(phase.data.to_serialized())
+            if root is not None:
+                files.update(self._referenced_files(phases[-1], root))
+
+        serialized = json.dumps({
+            'provision': provision.data.to_serialized(),
+            'prepare': phases,
+            'files': files
+            }, sort_keys=True, default=str)
+
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _is_prepared(guest: Guest, phase: tmt.steps.Phase) -> bool:
+        """ Guests restored from a prepared snapshot skip all but multihost setup """
+        return (
+            guest.prepared
+            and isinstance(phase, PreparePlugin)
+            and phase.get('how') != 'multihost')
+
+    def prepare_guest(self, guest: Guest) -> None:
+        """
+        Prepare a freshly provisioned guest
+
+        Run phases preceding the first synchronization point on the guest
+        without waiting for other guests to be provisioned. Remaining
+        phases are left for :py:meth:`go`.
+        """
+        if self.status() == 'done':
+            return
+
+        self._add_implicit_phases()
+
+        phases = [
+            phase for phase in self._early_phases()
+            if phase.enabled_on_guest(guest) and not self._is_prepared(guest, phase)
+            ]
+
+        # Label the output, other guests are still being provisioned
+        def _labeled(logger: tmt.log.Logger) -> tmt.log.Logger:
+            logger = logger.clone()
+            logger.labels = [*logger.labels, guest.multihost_name]
+            logger.labels_padding = guest._logger.labels_padding
+            return logger
+
+        guest_copy = self._guest_copy(guest)
+        self._sync_with_guests(
+            'push',
+            PushTask(guests=[guest_copy], logger=_labeled(self._logger)),
+            logger=_labeled(self._logger))
+
+        queue = PhaseQueue(
+            'prepare',
+            _labeled(self._logger.descend(logger_name=f'{self}.queue')),
+            max_workers=self.opt('max-workers'))
+
+        for phase in phases:
+            queue.enqueue(phase=phase, guests=[guest_copy], logger=_labeled(phase._logger))
+
+        for phase_outcome in queue.run():
+            if phase_outcome.exc:
+                phase_outcome.logger.fail(str(phase_outcome.exc))
+
+                # TODO: needs a better message...
+                raise tmt.utils.GeneralError('prepare step failed') from phase_outcome.exc
+
+            with self._lock:
+                self.preparations_applied += 1
+
+        with self._lock:
+            self._prepared_guests.append(guest.name)
+
+    def go(self) -> None:
+        """ Prepare the guests """
+        super().go()
+
+        # Nothing more to do if already done
+        if self.status() == 'done':
+            self.info('status', 'done', 'green', shift=1)
+            self.summary()
+            self.actions()
+            return
+
+        self._add_implicit_phases()
+        self._add_multihost_phase()
+
         # Prepare guests (including workdir sync)
         guest_copies: List[Guest] = []
 
         for guest in self.plan.provision.guests():
-            # Create a guest copy and change its parent so that the
-            # operations inside prepare plugins on the guest use the
-            # prepare step config rather than provision step config.
-            guest_copy = copy.copy(guest)
-            guest_copy.inject_logger(
-                guest._logger.clone().apply_verbosity_options(**self._cli_options))
-            guest_copy.parent = self
-
-            guest_copies.append(guest_copy)
+            guest_copies.append(self._guest_copy(guest))
 
         if guest_copies:
             self._sync_with_guests(
@@ -269,12 +506,34 @@ class Prepare(tmt.steps.Step):
             # To separate "push" from "prepare" queue visually
             self.info('')
 
-        queue = PhaseQueue('prepare', self._logger.descend(logger_name=f'{self}.queue'))
+        queue = PhaseQueue(
+            'prepare',
+            self._logger.descend(logger_name=f'{self}.queue'),
+            max_workers=self.opt('max-workers'),
+            pipeline=bool(self.opt('dag')))
+
+        # Skip early phases on guests which have been prepared already
+        early_phases = self._early_phases()
 
         for phase in self.phases(classes=(Action, PreparePlugin)):
+            guests = [guest for guest in guest_copies if phase.enabled_on_guest(guest)]
+
+            # Skip guests restored from a prepared snapshot
+            if guests:
+                guests = [guest for guest in guests if not self._is_prepared(guest, phase)]
+
+                if not guests:
+                    continue
+
+            if phase in early_phases:
+                guests = [guest for guest in guests if guest.name not in self._prepared_guests]
+
+                if not guests:
+                    continue
+
             queue.enqueue(
                 phase=phase,  # type: ignore[arg-type]
-                guests=[guest for guest in guest_copies if phase.enabled_on_guest(guest)]
+                guests=guests
                 )
 
         failed_phases: List[TaskOutcome[QueuedPhase]] = []
@@ -308,6 +567,10 @@ class Prepare(tmt.steps.Step):
             # To separate "prepare" from "pull" queue visually
             self.info('')
 
+        # Save snapshots of prepared guests, if requested
+        for guest in self.plan.provision.guests():
+            guest.save_snapshot()
+
         # Give a summary, update status and save
         self.summary()
         self.status('done')
@@ -1,8 +1,12 @@
+import contextlib
 import dataclasses
+import fcntl
+import os
 import re
 import shutil
 import sys
-from typing import List, Optional, Tuple, cast
+import tempfile
+from typing import Generator, List, Optional, Tuple, cast
 
 import fmf
 import fmf.utils
@@ -14,8 +18,8 @@ import tmt.options
 import tmt.steps
 import tmt.steps.prepare
 import tmt.utils
-from tmt.steps.provision import Guest, GuestPackageManager
-from tmt.utils import Command, Path, ShellScript, field
+from tmt.steps.provision import Guest, GuestPackageManager, GuestSsh
+from tmt.utils import WORKDIR_ROOT, Command, Path, ShellScript, field
 
 if sys.version_info >= (3, 8):
     from typing import Literal
@@ -25,6 +29,217 @@ else:
 
 COPR_URL = 'https://copr.fedorainfracloud.org/coprs'
 
+# Packages given by url and debuginfo packages
+REMOTE_PACKAGE_PATTERN = re.compile(r"^http(s)?://")
+DEBUGINFO_PACKAGE_PATTERN = re.compile(r"-debug(info|source)(\.|$)")
+
+
+def is_repository_package(package: str) -> bool:
+    """ Package is installed from a repository, not from a file or url """
+    return not (
+        REMOTE_PACKAGE_PATTERN.match(package)
+        or package.endswith('.rpm')
+        or DEBUGINFO_PACKAGE_PATTERN.search(package))
+
+# Directory used as the package manager cache on guests
+GUEST_PACKAGE_CACHE_ROOT = Path('/var/tmp/tmt/package-cache')
+
+# Environment variable limiting the total size of the package cache, in bytes
+PACKAGE_CACHE_SIZE_VARIABLE = 'TMT_PACKAGE_CACHE_SIZE'
+
+# Default limit of the total size of the package cache, in bytes
+DEFAULT_PACKAGE_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Options used to sync the cache, keep modification times to transfer
+# just new files
+PACKAGE_CACHE_RSYNC_OPTIONS = ["-s", "-r", "-t", "--links", "--safe-links"]
+
+
+def rpm_name(filename: str) -> str:
+    """ Name of the package stored in the given rpm file """
+    return filename[:-len('.rpm')].rsplit('-', 2)[0]
+
+
+def _disk_usage(path: Path) -> int:
+    """ Total size of files under the given path """
+    if not path.is_dir() or path.is_symlink():
+        return path.lstat().st_size
+
+    return sum(
+        child.lstat().st_size for child in path.glob('**/*')
+        if not child.is_dir() or child.is_symlink())
+
+
+class PackageCache:
+    """
+    Package manager cache shared by guests of all runs
+
+    Repository metadata and cached packages of the packages to be
+    installed are pushed to the guest before the installation, the
+    package manager is told to use them and keep downloaded packages,
+    and the cache is pulled back once the installation is done. Other
+    packages, e.g. dependencies, are downloaded by the guest on demand.
+    Packages downloaded by one guest are then available to all
+    following guests running the same distribution on the same
+    architecture. The package manager decides on its own whether
+    metadata of repositories need to be refreshed.
+
+    The total size of the cache, metadata included, is limited by the
+    ``TMT_PACKAGE_CACHE_SIZE`` environment variable, 10 GiB by default.
+    The oldest packages are removed first when the limit is exceeded,
+    then the oldest repository metadata.
+    """
+
+    def __init__(
+            self,
+            *,
+            guest: Guest,
+            path: Optional[Path] = None,
+            budget: Optional[int] = None,
+            logger: tmt.log.Logger) -> None:
+        self.guest = guest
+        self._logger = logger
+
+        # Packages downloaded by guests of all runs are kept under the
+        # workdir root, look it up when the cache is actually used
+        if path is None:
+            path = (Path(os.environ['TMT_WORKDIR_ROOT']) if os.getenv('TMT_WORKDIR_ROOT')
+                    else WORKDIR_ROOT) / 'package-cache'
+        self.path = path
+
+        if budget is None:
+            try:
+                budget = int(os.getenv(
+                    PACKAGE_CACHE_SIZE_VARIABLE, str(DEFAULT_PACKAGE_CACHE_SIZE)))
+
+            except ValueError:
+                raise tmt.utils.GeneralError(
+                    f"Invalid package cache size '{os.environ[PACKAGE_CACHE_SIZE_VARIABLE]}', "
+                    f"number of bytes expected.")
+
+        self.budget = budget
+
+        # Packages of different distributions and architectures are kept apart
+        self.key = re.sub(
+            r'[^\w.]+',
+            '-',
+            f'{guest.facts.distro or "unknown"}-{guest.facts.arch or "unknown"}')
+
+    @property
+    def local(self) -> Path:
+        """ Cache directory on the host """
+        return self.path / self.key
+
+    @property
+    def remote(self) -> Path:
+        """ Cache directory on the guest """
+        return GUEST_PACKAGE_CACHE_ROOT / self.key
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive: bool) -> Generator[None, None, None]:
+        """ Hold the cache lock, exclusively when changing the cache """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path / 'cache.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def push(self, packages: List[str]) -> None:
+        """
+        Copy repository metadata and cached packages to the guest
+
+        :param packages: names of packages to be installed, just their
+            cached packages are pushed.
+        """
+        self.local.mkdir(parents=True, exist_ok=True)
+
+        self._logger.debug(f"Push package cache '{self.local}' to the guest.", level=2)
+        with self._locked(exclusive=False):
+            cached = [
+                package.relative_to(self.local)
+                for package in self.local.glob('**/*.rpm')
+                if rpm_name(package.name) in packages
+                ]
+
+            try:
+                self.guest.execute(
+                    Command('mkdir', '-p', str(GUEST_PACKAGE_CACHE_ROOT)), silent=True)
+                self.guest.push(
+                    source=self.local,
+                    destination=GUEST_PACKAGE_CACHE_ROOT,
+                    options=[*PACKAGE_CACHE_RSYNC_OPTIONS, '--exclude=*.rpm'])
+
+                if cached:
+                    self._logger.debug(
+                        f"Push {len(cached)} cached package(s) to the guest.", level=2)
+                    with tempfile.NamedTemporaryFile('w', suffix='.files') as files_from:
+                        files_from.write(''.join(f'{package}\n' for package in cached))
+                        files_from.flush()
+                        self.guest.push(
+                            source=self.local,
+                            destination=self.remote,
+                            options=[
+                                *PACKAGE_CACHE_RSYNC_OPTIONS,
+                                f'--files-from={files_from.name}'])
+
+            # The cache is an optimization only, do not let it break the preparation
+            except tmt.utils.RunError as error:
+                self._logger.warn(f"Failed to push the package cache: {error}")
+
+    def pull(self) -> None:
+        """ Store packages and metadata downloaded by the guest in the cache """
+        self._logger.debug(f"Pull package cache '{self.remote}' from the guest.", level=2)
+        with self._locked(exclusive=True):
+            try:
+                self.guest.pull(
+                    source=self.remote,
+                    destination=self.path,
+                    options=PACKAGE_CACHE_RSYNC_OPTIONS)
+
+            except tmt.utils.RunError as error:
+                self._logger.warn(f"Failed to pull the package cache: {error}")
+
+            self._evict()
+
+    def packages(self) -> List[Path]:
+        """ Cached packages of all guests, the oldest first """
+        if not self.path.exists():
+            return []
+
+        return sorted(self.path.glob('**/*.rpm'), key=lambda package: package.stat().st_mtime)
+
+    def metadata(self) -> List[Path]:
+        """ Cached repository metadata of all guests, the oldest first """
+        if not self.path.exists():
+            return []
+
+        return sorted(
+            (entry for key in self.path.iterdir() if key.is_dir() for entry in key.iterdir()),
+            key=lambda entry: entry.lstat().st_mtime)
+
+    def _evict(self) -> List[Path]:
+        """ Remove the oldest packages, then metadata, until the cache fits the budget """
+        size = _disk_usage(self.path) if self.path.exists() else 0
+        removed: List[Path] = []
+
+        for kind, paths in (('package', self.packages), ('metadata', self.metadata)):
+            for path in paths():
+                if size <= self.budget:
+                    return removed
+
+                self._logger.debug(f"Evicting {kind} '{path.name}' from the cache.", level=3)
+                size -= _disk_usage(path)
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed.append(path)
+
+        return removed
+
 
 class InstallBase(tmt.utils.Common):
     """ Base class for installation implementations """
@@ -45,6 +260,10 @@ class InstallBase(tmt.utils.Common):
     directories: List[Path]
     exclude: List[str]
 
+    # Packages of following install phases, installed together with
+    # packages of this phase, see PrepareInstall.coalesced_packages()
+    coalesced_packages: List[str]
+
     local_packages: List[Path]
     remote_packages: List[str]
     debuginfo_packages: List[str]
@@ -57,10 +276,12 @@ class InstallBase(tmt.utils.Common):
             *,
             parent: tmt.steps.prepare.PreparePlugin,
             guest: Guest,
+            cache: Optional[PackageCache] = None,
             logger: tmt.log.Logger) -> None:
         """ Initialize installation data """
         super().__init__(logger=logger, parent=parent, relative_indent=0)
         self.guest = guest
+        self.cache = cache
 
         # Get package related data from the plugin
         assert self.parent is not None
@@ -68,6 +289,7 @@ class InstallBase(tmt.utils.Common):
         parent = cast(tmt.steps.prepare.PreparePlugin, self.parent)
 
         self.packages = parent.get("package", [])
+        self.coalesced_packages = []
         self.directories = cast(List[Path], parent.get("directory", []))
         self.exclude = parent.get("exclude", [])
 
@@ -94,11 +316,11 @@ class InstallBase(tmt.utils.Common):
 
         # Detect local, debuginfo and repository packages
         for package in self.packages:
-            if re.match(r"^http(s)?://", package):
+            if REMOTE_PACKAGE_PATTERN.match(package):
                 self.remote_packages.append(package)
             elif package.endswith(".rpm"):
                 self.local_packages.append(Path(package))
-            elif re.search(r"-debug(info|source)(\.|$)", package):
+            elif DEBUGINFO_PACKAGE_PATTERN.search(package):
                 # Strip the '-debuginfo' string from package name
                 # (installing with it doesn't work on RHEL7)
                 package = re.sub(r"-debuginfo((?=\.)|$)", "", package)
@@ -174,6 +396,38 @@ class InstallBase(tmt.utils.Common):
 
         return self.guest.execute(self.operation_script(subcommand, args))
 
+    def missing_packages(self, packages: List[str]) -> List[str]:
+        """
+        Find out which packages are not installed on the guest
+
+        All packages are checked by a single command which reports the
+        state of each package on a separate line. Besides package names,
+        provided capabilities, e.g. file paths, are recognized as well.
+
+        :param packages: packages to check.
+        :returns: packages which are not installed, in the original order.
+        """
+        script = ShellScript(
+            f'for package in {Command(*packages).to_script()}; do '
+            f'if rpm -q --whatprovides "$package" > /dev/null 2>&1; '
+            f'then echo "installed $package"; else echo "missing $package"; fi; done')
+
+        try:
+            output = self.guest.execute(script, silent=True)
+
+        except tmt.utils.RunError as error:
+            self.debug(f"Failed to check installed packages: {error}", level=2)
+            return packages
+
+        installed = set()
+        for line in (output.stdout or '').splitlines():
+            state, _, package = line.partition(' ')
+            if state == 'installed':
+                self.debug(f"Package '{package}' already installed.", level=2)
+                installed.add(package)
+
+        return [package for package in packages if package not in installed]
+
     def list_packages(self, packages: List[str], title: str) -> Command:
         """ Show package info and return package names """
 
@@ -300,6 +554,10 @@ class InstallDnf(InstallBase):
         for package in self.exclude:
             options += Command('--exclude', package)
 
+        # Download packages into the shared cache and keep them there
+        if self.cache is not None:
+            options += Command('--setopt=keepcache=1', f'--setopt=cachedir={self.cache.remote}')
+
         command = Command()
 
         if self.use_sudo:
@@ -339,13 +597,41 @@ class InstallDnf(InstallBase):
 
     def install_from_repository(self) -> None:
         """ Install packages from the repository """
-        packages = self.list_packages(self.repository_packages, title="package")
+        self.list_packages(self.repository_packages, title="package")
 
-        # Check and install
-        self.guest.execute(
-            ShellScript(f'rpm -q --whatprovides {packages.to_script()}')
-            | self.operation_script(Command('install'), packages)
-            )
+        # Install just packages which are not installed yet
+        missing = self.missing_packages(self.repository_packages + self.coalesced_packages)
+        if not missing:
+            self.debug("All packages are installed already.")
+            return
+
+        own = [package for package in missing if package in self.repository_packages]
+
+        # Install packages of following phases in the same transaction.
+        # They may be missing, their own phases take care of them, so the
+        # transaction must not fail because of them. Packages of this
+        # phase which did not make it are installed again, to report the
+        # failure properly.
+        if len(own) < len(missing):
+            self.verbose('coalesced', fmf.utils.listed(
+                len(missing) - len(own), 'package'), 'green')
+
+            try:
+                self.perform_operation(
+                    Command('install'),
+                    Command(*([] if self.skip_missing else ['--skip-broken']), *missing))
+
+            except tmt.utils.RunError as error:
+                self.debug(f"Coalesced installation failed: {error}")
+
+            own = self.missing_packages(own) if own else []
+
+        if own:
+            self.install_packages(own)
+
+    def install_packages(self, packages: List[str]) -> None:
+        """ Install packages, fail unless missing packages may be skipped """
+        self.perform_operation(Command('install'), Command(*packages))
 
     def install_debuginfo(self) -> None:
         """ Install debuginfo packages """
@@ -380,13 +666,13 @@ class InstallYum(InstallDnf):
     package_manager = "yum"
     copr_plugin = "yum-plugin-copr"
 
-    def install_from_repository(self) -> None:
-        """ Install packages from the repository """
-        packages = self.list_packages(self.repository_packages, title="package")
+    def install_packages(self, packages: List[str]) -> None:
+        """ Install packages, check they are present unless they may be skipped """
+        packages_command = Command(*packages)
 
         # Extra ignore/check for yum to workaround BZ#1920176
-        check = ShellScript(f'rpm -q --whatprovides {packages.to_script()}')
-        script = check | self.operation_script(Command('install'), packages)
+        check = ShellScript(f'rpm -q --whatprovides {packages_command.to_script()}')
+        script = self.operation_script(Command('install'), packages_command)
 
         if self.skip_missing:
             script |= ShellScript('true')
@@ -407,16 +693,11 @@ class InstallRpmOstree(InstallBase):
         """ Identify required and recommended packages """
         self.recommended_packages = []
         self.required_packages = []
-        for package in self.repository_packages:
-            try:
-                output = self.guest.execute(Command('rpm', '-q', package), silent=True)
-                assert output.stdout
-                self.debug(f"Package '{output.stdout.strip()}' already installed.")
-            except tmt.utils.RunError:
-                if self.skip_missing:
-                    self.recommended_packages.append(package)
-                else:
-                    self.required_packages.append(package)
+        for package in self.missing_packages(self.repository_packages):
+            if self.skip_missing:
+                self.recommended_packages.append(package)
+            else:
+                self.required_packages.append(package)
 
     def prepare_command(self) -> Tuple[Command, Command]:
         """ Prepare installation command for rpm-ostree"""
@@ -539,6 +820,13 @@ class PrepareInstallData(tmt.steps.prepare.PrepareStepData):
         help='Action on missing packages, fail (default) or skip.'
         )
 
+    package_cache: bool = field(
+        default=False,
+        option='--package-cache',
+        is_flag=True,
+        help='Share downloaded packages with other guests and runs.'
+        )
+
 
 @tmt.steps.provides_method('install')
 class PrepareInstall(tmt.steps.prepare.PreparePlugin):
@@ -574,6 +862,15 @@ class PrepareInstall(tmt.steps.prepare.PreparePlugin):
             directory: tmp/RPMS/noarch
             exclude: tmt-provision-virtual
 
+    Use 'package-cache' to keep packages downloaded by the guest on the
+    host and to share them with other guests of the same distribution
+    and architecture, in this and following runs:
+
+        prepare:
+            how: install
+            package: httpd
+            package-cache: true
+
     Use 'order' attribute to select in which order preparation should
     happen if there are multiple configs. Default order is '50'.
     Default order of required packages installation is '70'.
@@ -589,6 +886,48 @@ class PrepareInstall(tmt.steps.prepare.PreparePlugin):
 
     _data_class = PrepareInstallData
 
+    def coalesced_packages(self, guest: Guest) -> List[str]:
+        """
+        Packages of following install phases to be installed together
+
+        Install phases following this one on the guest are installed in
+        a single transaction, as long as they install packages from
+        repositories only, with the same settings. Once they run, their
+        packages are found installed already, each phase still reports
+        and checks its own packages.
+        """
+        phases = self.step.phases(classes=(tmt.steps.Action, tmt.steps.prepare.PreparePlugin))
+        if self not in phases:
+            return []
+
+        packages: List[str] = []
+
+        for phase in phases[phases.index(self) + 1:]:
+            if not phase.enabled_on_guest(guest):
+                continue
+
+            if not isinstance(phase, PrepareInstall):
+                break
+
+            # Repositories and excluded packages have to be the same
+            compatible = (
+                not phase.get('copr')
+                and not phase.get('directory')
+                and phase.get('exclude') == self.get('exclude')
+                and phase.get('package-cache') == self.get('package-cache'))
+            if not compatible:
+                break
+
+            phase_packages = [str(package) for package in phase.get('package', [])]
+            if not all(is_repository_package(package) for package in phase_packages):
+                break
+
+            packages.extend(
+                package for package in phase_packages
+                if package not in packages and package not in self.get('package', []))
+
+        return packages
+
     def go(
             self,
             *,
@@ -605,19 +944,40 @@ class PrepareInstall(tmt.steps.prepare.PreparePlugin):
         # Pick the right implementation
         # TODO: it'd be nice to use a "plugin registry" and make the implementations
         # discovered as any other plugins.
+        cache: Optional[PackageCache] = None
+
+        if self.get('package-cache'):
+            if isinstance(guest, GuestSsh) and guest.facts.package_manager in (
+                    GuestPackageManager.DNF, GuestPackageManager.YUM):
+                cache = PackageCache(guest=guest, logger=logger)
+
+            else:
+                self.warn('Package cache is not supported by the guest.')
+
         if guest.facts.package_manager == GuestPackageManager.RPM_OSTREE:
             installer: InstallBase = InstallRpmOstree(logger=logger, parent=self, guest=guest)
 
         elif guest.facts.package_manager == GuestPackageManager.DNF:
-            installer = InstallDnf(logger=logger, parent=self, guest=guest)
+            installer = InstallDnf(logger=logger, parent=self, guest=guest, cache=cache)
 
         elif guest.facts.package_manager == GuestPackageManager.YUM:
-            installer = InstallYum(logger=logger, parent=self, guest=guest)
+            installer = InstallYum(logger=logger, parent=self, guest=guest, cache=cache)
 
         else:
             raise tmt.utils.PrepareError(
                 f'Package manager "{guest.facts.package_manager}" is not supported.')
 
+        installer.coalesced_packages = self.coalesced_packages(guest)
+
+        if cache is not None:
+            cache.push(installer.repository_packages + installer.coalesced_packages)
+
         # Enable copr repositories and install packages
         installer.enable_copr()
-        installer.install()
+        try:
+            installer.install()
+
+        # Keep packages downloaded even by a failed installation
+        finally:
+            if cache is not None:
+                cache.pull()
@@ -3,16 +3,18 @@ import collections
 import dataclasses
 import datetime
 import enum
+import hashlib
+import json
 import os
 import random
 import re
 import shlex
+import socket
 import string
-import subprocess
-import tempfile
+import threading
 from shlex import quote
-from typing import (TYPE_CHECKING, Any, Dict, Generator, List, Optional, Tuple,
-                    Type, TypeVar, Union, cast, overload)
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Generator, List,
+                    Optional, Tuple, Type, TypeVar, Union, cast, overload)
 
 import click
 import fmf
@@ -22,10 +24,15 @@ import tmt.log
 import tmt.plugins
 import tmt.steps
 import tmt.utils
+from tmt.queue import Queue, Task, TaskOutcome
 from tmt.steps import Action
+from tmt.steps.provision.pool import POOL_CONNECT_TIMEOUT, GuestPool
+from tmt.steps.provision.ssh import SshMaster
 from tmt.utils import BaseLoggerFnType, Command, Path, ShellScript, field
 
 if TYPE_CHECKING:
+    from typing_extensions import Self
+
     import tmt.base
     import tmt.cli
 
@@ -34,9 +41,17 @@ if TYPE_CHECKING:
 CONNECTION_TIMEOUT = 5 * 60
 
 # When waiting for guest to recover from reboot, try re-connecting every
-# this many seconds.
-RECONNECT_WAIT_TICK = 5
-RECONNECT_WAIT_TICK_INCREASE = 1.0
+# this many seconds, waiting a bit longer after each failed attempt, but
+# never longer than the given maximum.
+RECONNECT_WAIT_TICK = 1
+RECONNECT_WAIT_TICK_INCREASE = 1.5
+RECONNECT_WAIT_TICK_MAX = 10
+
+# Timeout in seconds of the probe of the ssh port
+SSH_PORT_PROBE_TIMEOUT = 2
+
+# Default ssh port
+SSH_PORT = 22
 
 # Default rsync options
 DEFAULT_RSYNC_OPTIONS = [
@@ -45,6 +60,64 @@ DEFAULT_RSYNC_OPTIONS = [
 DEFAULT_RSYNC_PUSH_OPTIONS = ["-s", "-R", "-r", "-z", "--links", "--safe-links", "--delete"]
 DEFAULT_RSYNC_PULL_OPTIONS = ["-s", "-R", "-r", "-z", "--links", "--safe-links", "--protect-args"]
 
+# Options used to push just the files changed since the last workdir push
+DELTA_RSYNC_PUSH_OPTIONS = ["-s", "-R", "-z", "--links", "--safe-links", "--from0"]
+
+# Directory under the provision step workdir holding manifests of
+# pushed workdirs, removed together with guests by provision --force
+PUSH_MANIFEST_DIRNAME = '.push'
+
+# Manifest of a directory tree, type and properties of each path
+PushManifest = Dict[str, List[Any]]
+
+
+def tree_manifest(path: Path, exclude: Optional[Path] = None) -> PushManifest:
+    """
+    Describe all paths under the given directory
+
+    Directories are recorded just by their type, files by their size
+    and modification time, symlinks by their target.
+
+    :param exclude: directory to leave out, together with its content.
+    """
+    manifest: PushManifest = {}
+
+    def scan(directory: str) -> None:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if exclude is not None and entry.path == str(exclude):
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    manifest[entry.path] = ['d']
+                    scan(entry.path)
+
+                elif entry.is_symlink():
+                    manifest[entry.path] = ['l', os.readlink(entry.path)]
+
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    manifest[entry.path] = ['f', stat.st_size, stat.st_mtime_ns]
+
+    scan(str(path))
+    return manifest
+
+
+def manifest_changes(previous: PushManifest, current: PushManifest) -> Optional[List[str]]:
+    """
+    Find paths added or changed since the previous manifest
+
+    :returns: sorted list of new or changed paths, ``None`` if some
+        paths have been removed or changed their type, and the whole
+        tree has to be synced.
+    """
+    if any(
+            path not in current or current[path][0] != entry[0]
+            for path, entry in previous.items()):
+        return None
+
+    return sorted(path for path, entry in current.items() if previous.get(path) != entry)
+
 
 def format_guest_full_name(name: str, role: Optional[str]) -> str:
     """ Render guest's full name, i.e. name and its role """
@@ -69,6 +142,35 @@ class GuestPackageManager(enum.Enum):
 T = TypeVar('T')
 
 
+# Output of commands run by the composite facts probe, keyed by the
+# command. ``None`` marks commands which did not succeed.
+ProbeOutputs = Dict[str, Optional[tmt.utils.CommandOutput]]
+
+# Separator of command outputs in the output of the composite probe
+PROBE_SEPARATOR_PATTERN = re.compile(r'\n@@tmt-probe (\d+) (\d+)\n')
+
+# Commands and patterns used to discover facts, see GuestFacts._query()
+ARCH_PROBES = [(Command('arch'), r'(.+)')]
+DISTRO_PROBES = [
+    (Command('cat', '/etc/redhat-release'), r'(.*)'),
+    (Command('cat', '/etc/fedora-release'), r'(.*)')
+    ]
+KERNEL_RELEASE_PROBES = [(Command('uname', '-r'), r'(.+)')]
+
+# Commands and package managers they detect, see GuestFacts._probe()
+PACKAGE_MANAGER_PROBES = [
+    (Command('stat', '/run/ostree-booted'), GuestPackageManager.RPM_OSTREE),
+    (Command('rpm', '-q', 'dnf'), GuestPackageManager.DNF),
+    (Command('rpm', '-q', 'yum'), GuestPackageManager.YUM),
+    # And, one day, we'd follow up on this with...
+    # (Command('dpkg', '-l', 'apt'), 'apt')
+    ]
+
+OS_RELEASE_PATH = Path('/etc/os-release')
+LSB_RELEASE_PATH = Path('/etc/lsb-release')
+FILESYSTEMS_PATH = Path('/proc/filesystems')
+
+
 @dataclasses.dataclass
 class GuestFacts(tmt.utils.SerializableContainer):
     """
@@ -103,7 +205,8 @@ class GuestFacts(tmt.utils.SerializableContainer):
     def _execute(
             self,
             guest: 'Guest',
-            command: Command) -> Optional[tmt.utils.CommandOutput]:
+            command: Union[Command, ShellScript],
+            outputs: Optional[ProbeOutputs] = None) -> Optional[tmt.utils.CommandOutput]:
         """
         Run a command on the given guest.
 
@@ -111,12 +214,17 @@ class GuestFacts(tmt.utils.SerializableContainer):
         detect a common issue with guest access. Facts are the first info tmt
         fetches from the guest, and would raise the error as soon as possible.
 
+        :param outputs: outputs collected by the composite probe, the
+            command is not run again if its output is available.
         :returns: command output if the command quit with a zero exit code,
             ``None`` otherwise.
         :raises tmt.units.GeneralError: when logging into the guest fails
             because of a username mismatch.
         """
 
+        if outputs is not None and str(command) in outputs:
+            return outputs[str(command)]
+
         try:
             return guest.execute(command, silent=True)
 
@@ -126,7 +234,55 @@ class GuestFacts(tmt.utils.SerializableContainer):
 
         return None
 
-    def _fetch_keyval_file(self, guest: 'Guest', filepath: Path) -> Dict[str, str]:
+    def _probe_all(self, guest: 'Guest', commands: List[Command]) -> Optional[ProbeOutputs]:
+        """
+        Run all given commands on the guest at once.
+
+        Commands are joined into a single script, each followed by a
+        separator carrying its exit code, so that facts are collected in
+        a single round trip to the guest.
+
+        :returns: outputs of commands, ``None`` if the script failed or
+            its output could not be parsed.
+        """
+
+        script = ShellScript('\n'.join(
+            f"{command.to_script()} 2>/dev/null; printf '\\n@@tmt-probe {index} %d\\n' $?"
+            for index, command in enumerate(commands)))
+
+        output = self._execute(guest, script)
+
+        if output is None or output.stdout is None:
+            return None
+
+        # Chunks alternate between command output and separator fields
+        chunks = PROBE_SEPARATOR_PATTERN.split(output.stdout)
+
+        if len(chunks) != 3 * len(commands) + 1:
+            guest.debug('probe', 'Composite probe produced no usable output.')
+            return None
+
+        outputs: ProbeOutputs = {}
+
+        for index, command in enumerate(commands):
+            stdout, position, returncode = chunks[3 * index:3 * index + 3]
+
+            if int(position) != index:
+                guest.debug('probe', 'Composite probe produced no usable output.')
+                return None
+
+            if int(returncode) == 0:
+                outputs[str(command)] = tmt.utils.CommandOutput(stdout, None)
+            else:
+                outputs[str(command)] = None
+
+        return outputs
+
+    def _fetch_keyval_file(
+            self,
+            guest: 'Guest',
+            filepath: Path,
+            outputs: Optional[ProbeOutputs] = None) -> Dict[str, str]:
         """
         Load key/value pairs from a file on the given guest.
 
@@ -151,7 +307,7 @@ class GuestFacts(tmt.utils.SerializableContainer):
 
         content: Dict[str, str] = {}
 
-        output = self._execute(guest, Command('cat', str(filepath)))
+        output = self._execute(guest, Command('cat', str(filepath)), outputs)
 
         if not output or not output.stdout:
             return content
@@ -187,19 +343,21 @@ class GuestFacts(tmt.utils.SerializableContainer):
     def _probe(
             self,
             guest: 'Guest',
-            probes: List[Tuple[Command, T]]) -> Optional[T]:
+            probes: List[Tuple[Command, T]],
+            outputs: Optional[ProbeOutputs] = None) -> Optional[T]:
         """
         Find a first successfull command.
 
         :param guest: the guest to run commands on.
         :param probes: list of command/mark pairs.
+        :param outputs: outputs collected by the composite probe.
         :returns: "mark" corresponding to the first command to quit with
             a zero exit code.
         :raises tmt.utils.GeneralError: when no command succeeded.
         """
 
         for command, outcome in probes:
-            if self._execute(guest, command):
+            if self._execute(guest, command, outputs):
                 return outcome
 
         return None
@@ -207,19 +365,21 @@ class GuestFacts(tmt.utils.SerializableContainer):
     def _query(
             self,
             guest: 'Guest',
-            probes: List[Tuple[Command, str]]) -> Optional[str]:
+            probes: List[Tuple[Command, str]],
+            outputs: Optional[ProbeOutputs] = None) -> Optional[str]:
         """
         Find a first successfull command, and extract info from its output.
 
         :param guest: the guest to run commands on.
         :param probes: list of command/pattenr pairs.
+        :param outputs: outputs collected by the composite probe.
         :returns: substring extracted by the first matching pattern.
         :raises tmt.utils.GeneralError: when no command succeeded, or when no
             pattern matched.
         """
 
         for command, pattern in probes:
-            output = self._execute(guest, command)
+            output = self._execute(guest, command, outputs)
 
             if not output or not output.stdout:
                 guest.debug('query', f"Command '{str(command)}' produced no usable output.")
@@ -235,14 +395,16 @@ class GuestFacts(tmt.utils.SerializableContainer):
 
         return None
 
-    def _query_arch(self, guest: 'Guest') -> Optional[str]:
-        return self._query(
-            guest,
-            [
-                (Command('arch'), r'(.+)')
-                ])
+    def _query_arch(
+            self,
+            guest: 'Guest',
+            outputs: Optional[ProbeOutputs] = None) -> Optional[str]:
+        return self._query(guest, ARCH_PROBES, outputs)
 
-    def _query_distro(self, guest: 'Guest') -> Optional[str]:
+    def _query_distro(
+            self,
+            guest: 'Guest',
+            outputs: Optional[ProbeOutputs] = None) -> Optional[str]:
         # Try some low-hanging fruits first. We already might have the answer,
         # provided by some standardized locations.
         if 'PRETTY_NAME' in self.os_release_content:
@@ -252,37 +414,29 @@ class GuestFacts(tmt.utils.SerializableContainer):
             return self.lsb_release_content['DISTRIB_DESCRIPTION']
 
         # Nope, inspect more files.
-        return self._query(
-            guest,
-            [
-                (Command('cat', '/etc/redhat-release'), r'(.*)'),
-                (Command('cat', '/etc/fedora-release'), r'(.*)')
-                ])
-
-    def _query_kernel_release(self, guest: 'Guest') -> Optional[str]:
-        return self._query(
-            guest,
-            [
-                (Command('uname', '-r'), r'(.+)')
-                ])
-
-    def _query_package_manager(self, guest: 'Guest') -> Optional[GuestPackageManager]:
-        return self._probe(
-            guest,
-            [
-                (Command('stat', '/run/ostree-booted'), GuestPackageManager.RPM_OSTREE),
-                (Command('rpm', '-q', 'dnf'), GuestPackageManager.DNF),
-                (Command('rpm', '-q', 'yum'), GuestPackageManager.YUM),
-                # And, one day, we'd follow up on this with...
-                # (Command('dpkg', '-l', 'apt'), 'apt')
-                ])
-
-    def _query_has_selinux(self, guest: 'Guest') -> Optional[bool]:
+        return self._query(guest, DISTRO_PROBES, outputs)
+
+    def _query_kernel_release(
+            self,
+            guest: 'Guest',
+            outputs: Optional[ProbeOutputs] = None) -> Optional[str]:
+        return self._query(guest, KERNEL_RELEASE_PROBES, outputs)
+
+    def _query_package_manager(
+            self,
+            guest: 'Guest',
+            outputs: Optional[ProbeOutputs] = None) -> Optional[GuestPackageManager]:
+        return self._probe(guest, PACKAGE_MANAGER_PROBES, outputs)
+
+    def _query_has_selinux(
+            self,
+            guest: 'Guest',
+            outputs: Optional[ProbeOutputs] = None) -> Optional[bool]:
         """
         For detection ``/proc/filesystems`` is used, see ``man 5 filesystems`` for details.
         """
 
-        output = self._execute(guest, Command('cat', '/proc/filesystems'))
+        output = self._execute(guest, Command('cat', str(FILESYSTEMS_PATH)), outputs)
 
         if output is None or output.stdout is None:
             return None
@@ -290,16 +444,32 @@ class GuestFacts(tmt.utils.SerializableContainer):
         return 'selinux' in output.stdout
 
     def sync(self, guest: 'Guest') -> None:
-        """ Update stored facts to reflect the given guest """
+        """
+        Update stored facts to reflect the given guest
 
-        self.os_release_content = self._fetch_keyval_file(guest, Path('/etc/os-release'))
-        self.lsb_release_content = self._fetch_keyval_file(guest, Path('/etc/lsb-release'))
+        All commands needed to discover facts are run at once by a
+        composite probe. Facts are then extracted from their outputs,
+        commands are run one by one only when the probe fails.
+        """
 
-        self.arch = self._query_arch(guest)
-        self.distro = self._query_distro(guest)
-        self.kernel_release = self._query_kernel_release(guest)
-        self.package_manager = self._query_package_manager(guest)
-        self.has_selinux = self._query_has_selinux(guest)
+        outputs = self._probe_all(guest, [
+            Command('cat', str(OS_RELEASE_PATH)),
+            Command('cat', str(LSB_RELEASE_PATH)),
+            *(command for command, _ in ARCH_PROBES),
+            *(command for command, _ in DISTRO_PROBES),
+            *(command for command, _ in KERNEL_RELEASE_PROBES),
+            *(command for command, _ in PACKAGE_MANAGER_PROBES),
+            Command('cat', str(FILESYSTEMS_PATH))
+            ])
+
+        self.os_release_content = self._fetch_keyval_file(guest, OS_RELEASE_PATH, outputs)
+        self.lsb_release_content = self._fetch_keyval_file(guest, LSB_RELEASE_PATH, outputs)
+
+        self.arch = self._query_arch(guest, outputs)
+        self.distro = self._query_distro(guest, outputs)
+        self.kernel_release = self._query_kernel_release(guest, outputs)
+        self.package_manager = self._query_package_manager(guest, outputs)
+        self.has_selinux = self._query_has_selinux(guest, outputs)
 
         self.in_sync = True
 
@@ -316,6 +486,15 @@ class GuestData(tmt.utils.SerializableContainer):
     role: Optional[str] = None
     # hostname or ip address
     guest: Optional[str] = None
+    # key of the pool of warm guests the guest belongs to
+    pool_key: Optional[str] = None
+    # directory of the pool entry the guest has been checked out with
+    pool_entry: Optional[str] = None
+    # fingerprint of the guest preparation, a snapshot of the prepared
+    # guest is saved under it
+    prepare_fingerprint: Optional[str] = None
+    # guest has been restored from a snapshot taken once it was prepared
+    prepared: bool = False
 
     facts: GuestFacts = field(
         default_factory=GuestFacts,
@@ -347,6 +526,10 @@ class Guest(tmt.utils.Common):
 
     role: Optional[str]
     guest: Optional[str]
+    pool_key: Optional[str]
+    pool_entry: Optional[str]
+    prepare_fingerprint: Optional[str]
+    prepared: bool
 
     # Flag to indicate localhost guest, requires special handling
     localhost = False
@@ -675,6 +858,17 @@ class Guest(tmt.utils.Common):
 
         raise NotImplementedError()
 
+    def is_reachable(self) -> bool:
+        """
+        Check whether the guest may accept connections
+
+        A cheap check performed before every attempt to log in when
+        waiting for the guest, e.g. after a reboot. The default
+        implementation cannot tell, the guest is always considered
+        reachable.
+        """
+        return True
+
     def reconnect(
             self,
             timeout: Optional[int] = None,
@@ -694,6 +888,10 @@ class Guest(tmt.utils.Common):
         self.debug("Wait for a connection to the guest.")
 
         def try_whoami() -> None:
+            # Do not bother logging in until the guest may accept connections
+            if not self.is_reachable():
+                raise tmt.utils.WaitingIncomplete()
+
             try:
                 self.execute(Command('whoami'), silent=True)
 
@@ -706,7 +904,8 @@ class Guest(tmt.utils.Common):
                 try_whoami,
                 datetime.timedelta(seconds=timeout),
                 tick=tick,
-                tick_increase=tick_increase)
+                tick_increase=tick_increase,
+                tick_max=RECONNECT_WAIT_TICK_MAX)
 
         except tmt.utils.WaitingTimedOutError:
             self.debug("Connection to guest failed after reboot.")
@@ -723,6 +922,80 @@ class Guest(tmt.utils.Common):
         """
         self.debug(f"Doing nothing to remove guest '{self.guest}'.")
 
+    def reset(self) -> bool:
+        """
+        Reset the guest so that it can be used by another run
+
+        Revert everything the run has done to the guest, including
+        changes made by preparation and tests. Return ``True`` if the
+        guest has been reset and may be returned to the pool of warm
+        guests, guests which cannot be reset are never pooled.
+        """
+        return False
+
+    def _pool_files(self) -> List[Path]:
+        """ Local files the guest needs as long as it lives in the pool """
+        return []
+
+    def _restore_pool_files(self, path: Path) -> None:
+        """ Point the guest to its files stored in the given pool entry """
+
+    def return_to_pool(self) -> bool:
+        """
+        Return the guest to the pool of warm guests
+
+        Only guests provisioned with the pool enabled are returned.
+        Return ``True`` if the guest has been returned to the pool,
+        otherwise it is up to the caller to stop and remove it.
+        """
+        if self.pool_key is None or self.opt('dry'):
+            return False
+
+        pool = GuestPool(logger=self._logger)
+        path = Path(self.pool_entry) if self.pool_entry else None
+
+        if not self.reset():
+            self.warn("Failed to reset the guest, not returning it to the pool.")
+            if path is not None:
+                pool.discard(path)
+            return False
+
+        data = self.save()
+        data.pool_key = None
+        data.pool_entry = None
+        data.prepare_fingerprint = None
+        data.prepared = False
+        pool.checkin(self.pool_key, data.to_serialized(), path=path, files=self._pool_files())
+        self.info('guest', 'returned to the pool', 'green')
+        return True
+
+    def bind_prepare_fingerprint(self, image: str) -> None:
+        """
+        Tie the fingerprint of the preparation to the resolved base image
+
+        Image names like ``fedora`` point to different images over time,
+        guests call this once they know which exact image they start
+        from, before looking for a snapshot of a prepared guest.
+
+        :param image: identifier of the image content, e.g. its digest.
+        """
+        if not self.prepare_fingerprint:
+            return
+
+        self.debug(f"Bind the preparation fingerprint to image '{image}'.", level=3)
+        self.prepare_fingerprint = hashlib.sha256(
+            f'{self.prepare_fingerprint}:{image}'.encode('utf-8')).hexdigest()
+
+    def save_snapshot(self) -> None:
+        """
+        Save the prepared guest for later use
+
+        Called once the prepare step is finished. Guests which support
+        snapshots save their state if asked to, e.g. under their
+        :py:attr:`prepare_fingerprint`, there is nothing to do by
+        default.
+        """
+
     def _check_rsync(self) -> CheckRsyncOutcome:
         """
         Make sure that rsync is installed on the guest
@@ -817,26 +1090,29 @@ class GuestSsh(Guest):
     password: Optional[str]
     ssh_option: List[str]
 
-    # Master ssh connection process and socket path
-    _ssh_master_process: Optional['subprocess.Popen[bytes]'] = None
-    _ssh_socket_path: Optional[Path] = None
+    # Master ssh connection shared by all commands
+    _ssh_master: SshMaster
+
+    # Whether the ssh port can be probed directly, see is_reachable()
+    _ssh_port_probe: bool = True
 
     def _ssh_guest(self) -> str:
         """ Return user@guest """
         return f'{self.user}@{self.guest}'
 
+    def __init__(self,
+                 *,
+                 data: GuestData,
+                 name: Optional[str] = None,
+                 parent: Optional[tmt.utils.Common] = None,
+                 logger: tmt.log.Logger) -> None:
+        self._ssh_master = SshMaster(parent=self)
+
+        super().__init__(data=data, name=name, parent=parent, logger=logger)
+
     def _ssh_socket(self) -> Path:
         """ Prepare path to the master connection socket """
-        if not self._ssh_socket_path:
-            # Use '/run/user/uid' if it exists, '/tmp' otherwise
-            run_dir = Path(f"/run/user/{os.getuid()}")
-            if run_dir.is_dir():
-                socket_dir = run_dir / "tmt"
-            else:
-                socket_dir = Path("/tmp")
-            socket_dir.mkdir(exist_ok=True)
-            self._ssh_socket_path = Path(tempfile.mktemp(dir=socket_dir))
-        return self._ssh_socket_path
+        return self._ssh_master.socket
 
     def _ssh_options(self) -> Command:
         """ Return common ssh options (list or joined) """
@@ -869,25 +1145,21 @@ class GuestSsh(Guest):
 
     def _ssh_master_connection(self, command: Command) -> None:
         """ Check/create the master ssh connection """
-        if self._ssh_master_process:
-            return
-
         # Do not modify the original command...
-        ssh_master_command = command + self._ssh_options() + Command("-MNnT", self._ssh_guest())
-        self.debug(f"Create the master ssh connection: {ssh_master_command}")
-        self._ssh_master_process = subprocess.Popen(
-            ssh_master_command.to_popen(),
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL)
+        self._ssh_master.connect(
+            command + self._ssh_options() + Command("-MNnT", self._ssh_guest()))
 
-    def _ssh_command(self) -> Command:
-        """ Prepare an ssh command line for execution """
-        command = Command(
+    def _ssh_base_command(self) -> Command:
+        """ Prepare the ssh executable, with sshpass if needed """
+        return Command(
             *(["sshpass", "-p", self.password] if self.password else []),
             "ssh"
             )
 
+    def _ssh_command(self) -> Command:
+        """ Prepare an ssh command line for execution """
+        command = self._ssh_base_command()
+
         # Check the master connection
         self._ssh_master_connection(command)
 
@@ -911,6 +1183,9 @@ class GuestSsh(Guest):
         if extra_args:
             ansible_command += self._ansible_extra_args(extra_args)
 
+        # Let ansible use the master connection as well
+        self._ssh_master_connection(self._ssh_base_command())
+
         ansible_command += Command(
             '--ssh-common-args', self._ssh_options().to_element(),
             '-i', f'{self._ssh_guest()},',
@@ -932,6 +1207,73 @@ class GuestSsh(Guest):
         # Enough for now, ssh connection can be created later
         return self.guest is not None
 
+    def _probe_ssh_port(self) -> Optional[bool]:
+        """
+        Check whether sshd on the guest answers with its banner
+
+        Just a connection being accepted is not enough, e.g. forwarded
+        ports accept connections even when nothing listens on the other
+        side. Hence the probe waits for the greeting of the ssh server.
+
+        :returns: ``True`` if sshd answers, ``False`` if not, ``None``
+            if the probe cannot tell, e.g. when the guest name is not
+            known to the resolver and is left to the ssh configuration.
+        """
+        if self.guest is None:
+            return False
+
+        try:
+            with socket.create_connection(
+                    (self.guest, self.port or SSH_PORT),
+                    timeout=SSH_PORT_PROBE_TIMEOUT) as connection:
+                return connection.recv(4) == b'SSH-'
+
+        except socket.gaierror:
+            return None
+
+        except OSError:
+            return False
+
+    def _check_ssh_port_probe(self) -> None:
+        """
+        Stop probing the ssh port if it cannot be probed directly
+
+        E.g. a proxy set in the ssh configuration makes the port look
+        closed even though logging in works. Checked once, if the port
+        does not answer while the guest is up, just keep trying to log
+        in instead.
+        """
+        if not self._ssh_port_probe or self._probe_ssh_port() is not False:
+            return
+
+        try:
+            self.execute(Command('whoami'), silent=True)
+
+        except tmt.utils.RunError:
+            return
+
+        self.debug("Cannot probe the ssh port of the guest directly.", level=3)
+        self._ssh_port_probe = False
+
+    def reconnect(
+            self,
+            timeout: Optional[int] = None,
+            tick: float = RECONNECT_WAIT_TICK,
+            tick_increase: float = RECONNECT_WAIT_TICK_INCREASE
+            ) -> bool:
+        """ Ensure the connection to the guest is working """
+        self._check_ssh_port_probe()
+        return super().reconnect(timeout=timeout, tick=tick, tick_increase=tick_increase)
+
+    def is_reachable(self) -> bool:
+        """ Check whether sshd on the guest answers, if it can be probed """
+        # Connections going through a proxy cannot be probed directly
+        if not self._ssh_port_probe or any(
+                option.lower().startswith('proxy') for option in self.ssh_option):
+            return True
+
+        return self._probe_ssh_port() is not False
+
     def execute(self,
                 command: Union[tmt.utils.Command, tmt.utils.ShellScript],
                 cwd: Optional[Path] = None,
@@ -1023,14 +1365,21 @@ class GuestSsh(Guest):
 
         Set 'superuser' if rsync command has to run as root or passwordless
         sudo on the Guest (e.g. pushing to r/o destination)
+
+        When the whole workdir is pushed with default options, a manifest
+        of pushed files is kept, and following pushes send just files
+        added or changed since. The whole workdir is synced again when
+        some files have been removed.
         """
         # Abort if guest is unavailable
         if self.guest is None:
             if not self.opt('dry'):
                 raise tmt.utils.GeneralError('The guest is not available.')
 
+        manifest: Optional[PushManifest] = None
+        files_from: Optional[Path] = None
+
         # Prepare options and the push command
-        options = options or DEFAULT_RSYNC_PUSH_OPTIONS
         if destination is None:
             destination = Path("/")
         if source is None:
@@ -1041,9 +1390,31 @@ class GuestSsh(Guest):
 
             source = parent.plan.workdir
             self.debug(f"Push workdir to guest '{self.guest}'.")
+
+            manifest_path = self._push_manifest_path()
+            if options is None and manifest_path is not None and not self.opt('dry'):
+                manifest = tree_manifest(source, exclude=manifest_path.parent)
+                changes = None
+
+                if manifest_path.exists():
+                    changes = manifest_changes(
+                        json.loads(manifest_path.read_text()), manifest)
+
+                if changes == []:
+                    self.debug("The workdir on the guest is up to date.", level=2)
+                    return
+
+                if changes is not None:
+                    self.debug(f"Push {len(changes)} changed path(s).", level=2)
+                    files_from = manifest_path.with_suffix('.files')
+                    files_from.write_text(''.join(f'{path}\0' for path in changes))
+                    options = DELTA_RSYNC_PUSH_OPTIONS
+
         else:
             self.debug(f"Copy '{source}' to '{destination}' on the guest.")
 
+        options = options or DEFAULT_RSYNC_PUSH_OPTIONS
+
         def rsync() -> None:
             """ Run the rsync command """
             # In closure, mypy has hard times to reason about the state of used variables.
@@ -1055,6 +1426,18 @@ class GuestSsh(Guest):
             if superuser and self.user != 'root':
                 cmd += ['--rsync-path', 'sudo rsync']
 
+            # Push just the listed files, paths are absolute
+            if files_from is not None:
+                self.run(Command(
+                    *cmd,
+                    *options,
+                    f"--files-from={files_from}",
+                    "-e", self._ssh_command().to_element(),
+                    "/",
+                    f"{self._ssh_guest()}:/"
+                    ))
+                return
+
             self.run(Command(
                 *cmd,
                 *options,
@@ -1078,6 +1461,26 @@ class GuestSsh(Guest):
                     f"that login as '{self.user}' to the guest does not work.")
                 raise
 
+        # Remember what has been pushed
+        if manifest is not None:
+            manifest_path = self._push_manifest_path()
+            assert manifest_path is not None  # narrow type
+            manifest_path.write_text(json.dumps(manifest))
+
+    def _push_manifest_path(self) -> Optional[Path]:
+        """ Path to the manifest of the workdir pushed to the guest """
+        # FIXME: cast() - https://github.com/teemtee/tmt/issues/1372
+        parent = cast(Provision, self.parent)
+
+        if parent.workdir is None:
+            return None
+
+        # Kept by the step which created the guest, so a guest started
+        # anew does not inherit the manifest of its predecessor
+        path = parent.workdir / PUSH_MANIFEST_DIRNAME / f'{self.safe_name}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
     def pull(self,
              source: Optional[Path] = None,
              destination: Optional[Path] = None,
@@ -1097,8 +1500,8 @@ class GuestSsh(Guest):
             if not self.opt('dry'):
                 raise tmt.utils.GeneralError('The guest is not available.')
 
-        # Prepare options and the pull command
-        options = options or DEFAULT_RSYNC_PULL_OPTIONS
+        # Prepare options and the pull command, do not modify the defaults
+        options = list(options or DEFAULT_RSYNC_PULL_OPTIONS)
         if extend_options is not None:
             options.extend(extend_options)
         if destination is None:
@@ -1154,31 +1557,37 @@ class GuestSsh(Guest):
         necessary to store the instance status to disk.
         """
 
-        # Close the master ssh connection
-        if self._ssh_master_process:
-            self.debug("Close the master ssh connection.", level=3)
-            try:
-                self._ssh_master_process.terminate()
-                self._ssh_master_process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                pass
+        self._ssh_master.report()
+        self._ssh_master_close()
 
-        # Remove the ssh socket
-        if self._ssh_socket_path and self._ssh_socket_path.exists():
-            self.debug(
-                f"Remove ssh socket '{self._ssh_socket_path}'.", level=3)
-            try:
-                self._ssh_socket_path.unlink()
-            except OSError as error:
-                self.debug(f"Failed to remove the socket: {error}", level=3)
+    def _ssh_master_close(self) -> None:
+        """ Close the master ssh connection and remove its socket """
+        self._ssh_master.close()
+
+    def _pool_files(self) -> List[Path]:
+        """ Private keys are needed to log in to the guest """
+        return [Path(key) for key in self.key]
+
+    def _restore_pool_files(self, path: Path) -> None:
+        """ Use private keys stored in the pool entry """
+        self.key = [path / Path(key).name for key in self.key]
+
+    def return_to_pool(self) -> bool:
+        """ Return the guest to the pool, close the master connection """
+        if not super().return_to_pool():
+            return False
+
+        self._ssh_master.report()
+        self._ssh_master_close()
+        return True
 
     def reboot(
             self,
             hard: bool = False,
             command: Optional[Union[Command, ShellScript]] = None,
             timeout: Optional[int] = None,
-            tick: float = tmt.utils.DEFAULT_WAIT_TICK,
-            tick_increase: float = tmt.utils.DEFAULT_WAIT_TICK_INCREASE) -> bool:
+            tick: float = RECONNECT_WAIT_TICK,
+            tick_increase: float = RECONNECT_WAIT_TICK_INCREASE) -> bool:
         """
         Reboot the guest, return True if reconnect was successful
 
@@ -1213,6 +1622,9 @@ class GuestSsh(Guest):
 
         current_boot_time = get_boot_time()
 
+        # The guest is up now, find out whether its ssh port can be probed
+        self._check_ssh_port_probe()
+
         try:
             self.execute(command)
         except tmt.utils.RunError as error:
@@ -1224,9 +1636,18 @@ class GuestSsh(Guest):
             else:
                 raise
 
+        # The master connection may hang until the server alive check
+        # notices the guest is gone, do not use it anymore. A new one is
+        # created once sshd answers again.
+        self._ssh_master_close()
+
         # Wait until we get new boot time, connection will drop and will be
         # unreachable for some time
         def check_boot_time() -> None:
+            # Do not spawn ssh until sshd answers
+            if not self.is_reachable():
+                raise tmt.utils.WaitingIncomplete()
+
             try:
                 new_boot_time = get_boot_time()
 
@@ -1234,7 +1655,9 @@ class GuestSsh(Guest):
                     # Different boot time and we are reconnected
                     return
 
-                # Same boot time, reboot didn't happen yet, retrying
+                # Same boot time, reboot didn't happen yet, retrying. Do
+                # not keep the master connection to the old system.
+                self._ssh_master_close()
                 raise tmt.utils.WaitingIncomplete()
 
             except tmt.utils.RunError:
@@ -1249,7 +1672,8 @@ class GuestSsh(Guest):
                 check_boot_time,
                 datetime.timedelta(seconds=timeout),
                 tick=tick,
-                tick_increase=tick_increase)
+                tick_increase=tick_increase,
+                tick_max=RECONNECT_WAIT_TICK_MAX)
 
         except tmt.utils.WaitingTimedOutError:
             self.debug("Connection to guest failed after reboot.")
@@ -1329,6 +1753,10 @@ class ProvisionPlugin(tmt.steps.GuestlessPlugin):
     # TODO: Generics would provide a better type, https://github.com/teemtee/tmt/issues/1437
     _guest: Optional[Guest] = None
 
+    # Guest data keys which make guests different, used to match guests
+    # checked out from the pool of warm guests.
+    _pool_keys: List[str] = []
+
     @classmethod
     def base_command(
             cls,
@@ -1384,6 +1812,68 @@ class ProvisionPlugin(tmt.steps.GuestlessPlugin):
             guest.wake()
             self._guest = guest
 
+    def prepare_fingerprint(self) -> str:
+        """ Fingerprint of the preparation of the guest """
+        # FIXME: cast() - https://github.com/teemtee/tmt/issues/1372
+        return cast(Provision, self.step).plan.prepare.fingerprint(self)
+
+    def pool_key(self, data: GuestData) -> str:
+        """ Key matching guests described by the data in the pool """
+        return GuestPool.key(
+            how=self._guest_class.__name__,
+            **{key: getattr(data, key) for key in self._pool_keys})
+
+    def checkout_guest(self, data: GuestData) -> Optional[Guest]:
+        """
+        Check out a warm guest described by the data from the pool
+
+        Guests which have been idle for too long, abandoned guests left
+        checked out by runs which are gone, or guests which cannot be
+        connected to are removed. Return ``None`` if there is no usable
+        guest available.
+        """
+        pool = GuestPool(logger=self._logger)
+        key = self.pool_key(data)
+
+        while True:
+            entry = pool.checkout(key)
+            if entry is None:
+                self.debug('No warm guest available in the pool.')
+                return None
+
+            guest_data = cast(
+                GuestData,
+                tmt.utils.SerializableContainer.unserialize(entry.guest, self._logger))
+            guest_data.role = data.role
+            guest_data.pool_key = key
+            guest_data.pool_entry = str(entry.path)
+
+            guest = self._guest_class(
+                logger=self._logger,
+                data=guest_data,
+                name=self.name,
+                parent=self.step)
+            guest._restore_pool_files(entry.path)
+
+            try:
+                guest.wake()
+                usable = (
+                    not entry.expired
+                    and guest.is_ready
+                    and guest.reconnect(timeout=POOL_CONNECT_TIMEOUT))
+                if usable:
+                    self.info('guest', f"checked out from the pool ({entry.id})", 'green')
+                    return guest
+
+                self.debug(f"Guest '{entry.id}' is not usable, removing it.")
+                guest.stop()
+                guest.remove()
+
+            except tmt.utils.GeneralError as error:
+                self.warn(f"Failed to clean up pooled guest '{entry.id}': {error}")
+
+            pool.discard(entry.path)
+
     def guest(self) -> Optional[Guest]:
         """
         Return provisioned guest
@@ -1419,6 +1909,87 @@ class ProvisionPlugin(tmt.steps.GuestlessPlugin):
         return True
 
 
+@dataclasses.dataclass
+class ProvisionTask(Task):
+    """ Task provisioning guests of one or more provision phases at the same time """
+
+    #: Provision phases to run, each phase brings up its own guest.
+    phases: List[ProvisionPlugin]
+
+    #: If set, each guest is passed to this callback as soon as it is
+    #: provisioned.
+    on_guest_ready: Optional[Callable[[Guest], None]] = None
+
+    @property
+    def name(self) -> str:
+        return 'provision'
+
+    @property
+    def guest_ids(self) -> List[str]:
+        return [phase.name for phase in self.phases]
+
+    def units(self) -> List[Optional[str]]:
+        return [phase.name for phase in self.phases]
+
+    def unit_logger(self, name: str, logger: tmt.log.Logger) -> tmt.log.Logger:
+        # Keep the indentation of the phase output
+        return next(phase for phase in self.phases if phase.name == name)._logger.clone()
+
+    def run_unit(
+            self,
+            name: Optional[str],
+            loggers: Dict[str, tmt.log.Logger]) -> TaskOutcome['Self']:
+        phase = next(phase for phase in self.phases if phase.name == name)
+        step = cast(Provision, phase.step)
+
+        multiple_guests = len(self.phases) > 1
+
+        # Let the phase, and the guest it creates, use the labeled logger
+        # while the guest is being provisioned.
+        old_logger = phase._logger
+        new_logger = loggers[phase.name]
+
+        phase.inject_logger(new_logger)
+
+        if multiple_guests:
+            new_logger.info('started', color='cyan')
+
+        guest: Optional[Guest] = None
+
+        try:
+            guest = step._provision(phase)
+
+            if guest is not None and self.on_guest_ready is not None:
+                self.on_guest_ready(guest)
+
+        except Exception as exc:
+            outcome = TaskOutcome(
+                task=self,
+                logger=new_logger,
+                guest=guest,
+                exc=exc)
+
+        else:
+            outcome = TaskOutcome(
+                task=self,
+                logger=new_logger,
+                guest=guest,
+                exc=None)
+
+        finally:
+            if multiple_guests:
+                new_logger.info('finished', color='cyan')
+
+            # Don't forget to restore the original logger.
+            phase.inject_logger(old_logger)
+
+            guest = phase.guest()
+            if guest is not None:
+                guest.inject_logger(old_logger)
+
+        return outcome
+
+
 class Provision(tmt.steps.Step):
     """ Provision an environment for testing or use localhost. """
 
@@ -1440,6 +2011,7 @@ class Provision(tmt.steps.Step):
 
         # List of provisioned guests and loaded guest data
         self._guests: List[Guest] = []
+        self._guests_lock = threading.Lock()
         self._guest_data: Dict[str, GuestData] = {}
         self.is_multihost = False
 
@@ -1521,8 +2093,67 @@ class Provision(tmt.steps.Step):
             if not guest.name.startswith(tmt.utils.DEFAULT_NAME):
                 self.verbose(guest.name, color='red', shift=2)
 
-    def go(self) -> None:
-        """ Provision all guests"""
+    def _provision(self, phase: ProvisionPlugin) -> Optional[Guest]:
+        """ Run a single provision phase, return the guest if it came up """
+        try:
+            phase.go()
+
+            guest = phase.guest()
+            if guest:
+                guest.details()
+
+        except (tmt.utils.RunError, tmt.utils.ProvisionError) as error:
+            phase._logger.fail(str(error))
+            raise
+
+        finally:
+            guest = phase.guest()
+            if guest and (guest.is_ready or self.opt('dry')):
+                with self._guests_lock:
+                    self._guests.append(guest)
+
+        return guest
+
+    def _provision_phases(
+            self,
+            phases: List[ProvisionPlugin],
+            on_guest_ready: Optional[Callable[[Guest], None]] = None) -> None:
+        """
+        Provision guests of given phases at the same time.
+
+        All phases are given a chance to finish, guests which came up are
+        recorded even if other phases fail. The first failure is raised
+        once all phases are done.
+        """
+        queue: Queue[ProvisionTask] = Queue(
+            'provision',
+            self._logger.descend(logger_name=f'{self}.queue'),
+            max_workers=self.opt('max-workers'))
+
+        queue.enqueue_task(ProvisionTask(
+            guests=[],
+            logger=self._logger,
+            phases=phases,
+            on_guest_ready=on_guest_ready))
+
+        failed_outcomes = [outcome for outcome in queue.run() if outcome.exc]
+
+        self.info('')
+
+        if failed_outcomes:
+            assert failed_outcomes[0].exc is not None  # narrow type
+            raise failed_outcomes[0].exc
+
+    def go(self, *, on_guest_ready: Optional[Callable[[Guest], None]] = None) -> None:
+        """
+        Provision all guests
+
+        Guests of consecutive provision phases are provisioned at the same
+        time, actions wait for all preceding phases to finish.
+
+        :param on_guest_ready: if set, each guest is passed to this
+            callback as soon as it is provisioned.
+        """
         super().go()
 
         # Nothing more to do if already done
@@ -1537,28 +2168,19 @@ class Provision(tmt.steps.Step):
         save = True
         self.is_multihost = sum(isinstance(phase, ProvisionPlugin) for phase in self.phases()) > 1
         try:
-            for phase in self.phases(classes=(Action, ProvisionPlugin)):
-                try:
-                    if isinstance(phase, Action):
-                        phase.go()
-
-                    elif isinstance(phase, ProvisionPlugin):
-                        phase.go()
-
-                        guest = phase.guest()
-                        if guest:
-                            guest.details()
-
-                    if self.is_multihost:
-                        self.info('')
-                except (tmt.utils.RunError, tmt.utils.ProvisionError) as error:
-                    self.fail(str(error))
-                    raise
-                finally:
-                    if isinstance(phase, ProvisionPlugin):
-                        guest = phase.guest()
-                        if guest and (guest.is_ready or self.opt('dry')):
-                            self._guests.append(guest)
+            pending: List[ProvisionPlugin] = []
+
+            for phase in [*self.phases(classes=(Action, ProvisionPlugin)), None]:
+                if isinstance(phase, ProvisionPlugin):
+                    pending.append(phase)
+                    continue
+
+                if pending:
+                    self._provision_phases(pending, on_guest_ready)
+                    pending = []
+
+                if isinstance(phase, Action):
+                    phase.go()
 
             # Give a summary, update status and save
             self.summary()
@@ -1571,6 +2193,12 @@ class Provision(tmt.steps.Step):
             save = False
             raise error
         finally:
+            # Keep guests in the order of their phases
+            guest_order = [phase.name for phase in self.phases(classes=ProvisionPlugin)]
+            self._guests.sort(
+                key=lambda guest: guest_order.index(guest.name)
+                if guest.name in guest_order else len(guest_order))
+
             if save:
                 self.save()
 
@@ -0,0 +1,330 @@
+"""
+Content-addressed cache of guest images
+
+Images are stored under their sha256 digest, the same content downloaded
+from different urls is stored just once. Names under which provision
+plugins expect to find images are symlinks pointing to the content. The
+cache is kept under a byte budget, least recently used images are removed
+first when the budget is exceeded.
+
+Interrupted downloads are resumed, and concurrent downloads of the same
+url are serialized by a lock file: the first process downloads the image,
+the others wait for it and then just use the result.
+
+Images backing files which are still in use, e.g. disks of running or
+pooled guests and saved snapshots, are pinned and never evicted.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import urllib.parse
+from typing import Generator, List, Optional
+
+import requests
+
+import tmt.log
+import tmt.utils
+from tmt.utils import Path, retry_session
+
+# Environment variable limiting the total size of cached images, in bytes
+IMAGE_CACHE_SIZE_VARIABLE = 'TMT_IMAGE_CACHE_SIZE'
+
+# Digest algorithm used to address the content
+IMAGE_CACHE_DIGEST = 'sha256'
+
+# Size of chunks read when downloading and hashing images
+IMAGE_CACHE_CHUNK_SIZE = 1024 * 1024
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    """
+    Cache of guest images addressed by their content
+
+    :param path: directory holding the content, partial downloads and
+        lock files.
+    :param links: directory where images are linked under their names.
+    :param budget: maximum total size of cached images in bytes, read
+        from the ``TMT_IMAGE_CACHE_SIZE`` environment variable by default.
+        The cache is not limited if not set.
+    """
+
+    def __init__(
+            self,
+            *,
+            path: Path,
+            links: Path,
+            budget: Optional[int] = None,
+            logger: tmt.log.Logger) -> None:
+        self.path = path
+        self.links = links
+        self._logger = logger
+
+        if budget is None and os.getenv(IMAGE_CACHE_SIZE_VARIABLE):
+            try:
+                budget = int(os.environ[IMAGE_CACHE_SIZE_VARIABLE])
+
+            except ValueError:
+                raise tmt.utils.GeneralError(
+                    f"Invalid image cache size '{os.environ[IMAGE_CACHE_SIZE_VARIABLE]}', "
+                    f"number of bytes expected.")
+
+        self.budget = budget
+
+    @property
+    def blobs(self) -> Path:
+        """ Directory holding images under their digests """
+        return self.path / 'blobs' / IMAGE_CACHE_DIGEST
+
+    @property
+    def partial(self) -> Path:
+        """ Directory holding unfinished downloads """
+        return self.path / 'partial'
+
+    @property
+    def locks(self) -> Path:
+        """ Directory holding lock files """
+        return self.path / 'locks'
+
+    @property
+    def pins(self) -> Path:
+        """ Directory holding references to files backed by images """
+        return self.path / 'pins'
+
+    @contextlib.contextmanager
+    def _locked(self, name: str) -> Generator[None, None, None]:
+        """ Hold the lock of the given name """
+        self.locks.mkdir(parents=True, exist_ok=True)
+
+        with open(self.locks / f'{name}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _expected_digest(checksum: Optional[str]) -> Optional[str]:
+        """ Extract the digest from ``sha256:<digest>`` or plain ``<digest>`` """
+        if checksum is None:
+            return None
+
+        algorithm, _, digest = checksum.rpartition(':')
+        if algorithm and algorithm != IMAGE_CACHE_DIGEST:
+            raise tmt.utils.GeneralError(
+                f"Unsupported checksum '{checksum}', only {IMAGE_CACHE_DIGEST} is supported.")
+
+        return digest.lower()
+
+    def _linked_digest(self, link: Path) -> Optional[str]:
+        """ Digest of the content a link points to, ``None`` if not cached """
+        if not link.is_symlink() or not link.exists():
+            return None
+
+        target = Path(os.readlink(link))
+        if target.parent != self.blobs:
+            return None
+
+        return target.name
+
+    def _download(self, url: str, digest: Optional[str]) -> Path:
+        """
+        Download the url into the cache, return path to the content
+
+        Partial downloads left behind by previous attempts are resumed
+        when the server supports range requests.
+        """
+        self.partial.mkdir(parents=True, exist_ok=True)
+        partial = self.partial / _digest(url)
+
+        hasher = hashlib.sha256()
+        offset = 0
+
+        if partial.exists():
+            with open(partial, 'rb') as content:
+                for chunk in iter(lambda: content.read(IMAGE_CACHE_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    offset += len(chunk)
+
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        try:
+            with retry_session() as session:
+                response = session.get(url, headers=headers, stream=True)
+
+                # Requested range is beyond the end, the download is complete
+                if response.status_code == 416 and offset:
+                    pass
+
+                else:
+                    response.raise_for_status()
+
+                    if offset and response.status_code == 206:
+                        self._logger.debug(
+                            f"Resuming download of '{url}' at {offset} bytes.", level=2)
+                        mode = 'ab'
+
+                    else:
+                        hasher = hashlib.sha256()
+                        mode = 'wb'
+
+                    with open(partial, mode) as content:
+                        for chunk in response.iter_content(chunk_size=IMAGE_CACHE_CHUNK_SIZE):
+                            content.write(chunk)
+                            hasher.update(chunk)
+
+        except (requests.RequestException, OSError) as error:
+            raise tmt.utils.GeneralError(f"Failed to download image '{url}'.") from error
+
+        actual = hasher.hexdigest()
+        if digest is not None and actual != digest:
+            partial.unlink()
+            raise tmt.utils.GeneralError(
+                f"Checksum of image '{url}' does not match, "
+                f"expected '{digest}', got '{actual}'.")
+
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        blob = self.blobs / actual
+
+        # The same content may have been downloaded from another url
+        if blob.exists():
+            self._logger.debug(f"Image '{url}' is cached already as '{actual}'.", level=2)
+            partial.unlink()
+
+        else:
+            partial.replace(blob)
+
+        return blob
+
+    def fetch(self, url: str, name: str, checksum: Optional[str] = None) -> Path:
+        """
+        Make sure the image is cached, return path to its link
+
+        :param url: where to download the image from.
+        :param name: name under which the image should be linked.
+        :param checksum: expected digest of the image, either plain or
+            prefixed by the algorithm, e.g. ``sha256:<digest>``.
+        """
+        link = self.links / name
+        digest = self._expected_digest(checksum)
+
+        with self._locked(_digest(url)):
+            linked = self._linked_digest(link)
+
+            if linked is not None and digest in (None, linked):
+                self._logger.debug(f"Using cached image '{linked}' for '{url}'.", level=2)
+                blob = self.blobs / linked
+
+            else:
+                blob = self._download(url, digest)
+
+                with self._locked('cache'):
+                    self.links.mkdir(parents=True, exist_ok=True)
+                    if link.is_symlink() or link.exists():
+                        link.unlink()
+                    link.symlink_to(blob)
+
+            # Mark the image as recently used
+            os.utime(blob)
+
+        self.evict(keep=blob)
+        return link
+
+    def digest(self, name: str) -> Optional[str]:
+        """ Digest of the image linked under the name, ``None`` if not cached """
+        return self._linked_digest(self.links / name)
+
+    def pin(self, name: str, holder: Path) -> None:
+        """
+        Keep the image linked under the name as long as the holder exists
+
+        :param name: name under which the image is linked.
+        :param holder: file using the image, e.g. a disk overlay backed
+            by the image. Once the file is removed, the pin is dropped.
+        """
+        digest = self._linked_digest(self.links / name)
+        if digest is None:
+            return
+
+        with self._locked('cache'):
+            pins = self.pins / digest
+            pins.mkdir(parents=True, exist_ok=True)
+            (pins / _digest(str(holder.absolute()))).write_text(str(holder.absolute()))
+
+        self._logger.debug(f"Pinned image '{digest}' for '{holder}'.", level=3)
+
+    def _is_pinned(self, blob: Path) -> bool:
+        """ Check whether files backed by the image still exist. Lock must be held. """
+        pins = self.pins / blob.name
+        if not pins.exists():
+            return False
+
+        pinned = False
+        for pin in pins.iterdir():
+            if Path(pin.read_text()).exists():
+                pinned = True
+
+            # The holder is gone, drop its stale pin
+            else:
+                pin.unlink()
+
+        return pinned
+
+    def entries(self) -> List[Path]:
+        """ Cached images, the least recently used first """
+        if not self.blobs.exists():
+            return []
+
+        return sorted(self.blobs.iterdir(), key=lambda blob: blob.stat().st_mtime)
+
+    def size(self) -> int:
+        """ Total size of cached images """
+        return sum(blob.stat().st_size for blob in self.entries())
+
+    def evict(self, keep: Optional[Path] = None) -> List[Path]:
+        """
+        Remove least recently used images until the cache fits the budget
+
+        :param keep: image which must not be removed, e.g. the one just
+            fetched. Pinned images are never removed either.
+        :returns: removed images.
+        """
+        if self.budget is None:
+            return []
+
+        removed: List[Path] = []
+
+        with self._locked('cache'):
+            size = self.size()
+
+            for blob in self.entries():
+                if size <= self.budget:
+                    break
+
+                if blob == keep or self._is_pinned(blob):
+                    continue
+
+                self._logger.debug(f"Evicting image '{blob.name}' from the cache.", level=2)
+                size -= blob.stat().st_size
+                blob.unlink()
+                shutil.rmtree(self.pins / blob.name, ignore_errors=True)
+                removed.append(blob)
+
+            # Drop links pointing to evicted images
+            if removed and self.links.exists():
+                for link in self.links.iterdir():
+                    if link.is_symlink() and not link.exists():
+                        link.unlink()
+
+        return removed
+
+
+def image_name(url: str) -> str:
+    """ Name of the image file in the given url """
+    return Path(urllib.parse.urlparse(url).path).name
@@ -1,7 +1,10 @@
 import dataclasses
+import hashlib
+import json
 import os
+import tempfile
 from shlex import quote
-from typing import Any, List, Optional, Union
+from typing import Any, List, Optional, Union, cast
 
 import click
 
@@ -19,6 +22,12 @@ CONNECTION_TIMEOUT = 60
 DEFAULT_IMAGE = "fedora"
 DEFAULT_USER = "root"
 
+# Repository of images committed from prepared containers
+PREPARED_IMAGE_REPOSITORY = "localhost/tmt/prepared"
+
+# Repository of images with packages required by tests installed
+LAYERED_IMAGE_REPOSITORY = "tmt/layered"
+
 
 @dataclasses.dataclass
 class PodmanGuestData(tmt.steps.provision.GuestData):
@@ -31,7 +40,9 @@ class PodmanGuestData(tmt.steps.provision.GuestData):
 
 @dataclasses.dataclass
 class ProvisionPodmanData(PodmanGuestData, tmt.steps.provision.ProvisionStepData):
-    pass
+    reuse_prepared: bool = False
+    layered: bool = False
+    registry: Optional[str] = None
 
 
 class GuestContainer(tmt.Guest):
@@ -70,6 +81,7 @@ class GuestContainer(tmt.Guest):
             return
         # Check if the image is available
         assert self.image is not None
+        image = self.image
 
         try:
             self.podman(
@@ -87,6 +99,26 @@ class GuestContainer(tmt.Guest):
                 message=f"Pull image '{self.image}'."
                 )
 
+        # Use the image of a container prepared the same way from the
+        # very same base image, if there is one
+        if self.prepare_fingerprint:
+            image_id, _ = self.podman(
+                Command('image', 'inspect', '--format', '{{.Id}}', self.image),
+                message=f"Get id of container image '{self.image}'."
+                )
+            assert image_id is not None  # narrow type
+            self.bind_prepare_fingerprint(image_id.strip())
+            try:
+                self.podman(
+                    Command('image', 'exists', self._prepared_image),
+                    message=f"Check for prepared image '{self._prepared_image}'."
+                    )
+                self.info('snapshot', 'restoring the prepared guest', 'green')
+                image = self._prepared_image
+                self.prepared = True
+            except tmt.utils.RunError:
+                pass
+
         # Mount the whole plan directory in the container
         workdir = self.parent.plan.workdir
 
@@ -106,9 +138,27 @@ class GuestContainer(tmt.Guest):
             '-v', f'{workdir}:{workdir}:z',
             '-itd',
             '--user', self.user,
-            self.image
+            image
             ))
 
+    @property
+    def _prepared_image(self) -> str:
+        """ Image committed from the container once prepared """
+        return f'{PREPARED_IMAGE_REPOSITORY}:{self.prepare_fingerprint}'
+
+    def save_snapshot(self) -> None:
+        """ Commit the prepared container as an image for later guests """
+        if not self.prepare_fingerprint or self.prepared or not self.container:
+            return
+        if self.opt('dry'):
+            return
+
+        self.info('snapshot', self._prepared_image, 'green')
+        self.podman(
+            Command('commit', '-q', self.container, self._prepared_image),
+            message=f"Commit prepared container '{self.container}'."
+            )
+
     def reboot(self, hard: bool = False,
                command: Optional[Union[Command, ShellScript]] = None,
                timeout: Optional[int] = None) -> bool:
@@ -262,6 +312,16 @@ class ProvisionPodman(tmt.steps.provision.ProvisionPlugin):
 
     In order to run the container with different user as the default 'root',
     use 'user: USER'.
+
+    Use 'layered: true' to start from an image with packages required
+    and recommended by tests installed already. The image is built on
+    top of the base image once and reused by later runs. Set 'registry'
+    to share layered images through a registry instead of keeping them
+    in the local storage only.
+
+    Use 'reuse-prepared: true' to commit the container as an image once
+    it is prepared, and to start the next container with the same
+    provision and prepare data from the image, skipping preparation.
     """
 
     _data_class = ProvisionPodmanData
@@ -285,7 +345,16 @@ class ProvisionPodman(tmt.steps.provision.ProvisionPlugin):
                 help='Force pulling a fresh container image.'),
             click.option(
                 '-u', '--user', metavar='USER',
-                help='User to use for all container operations.')
+                help='User to use for all container operations.'),
+            click.option(
+                '--layered', is_flag=True,
+                help='Start from an image with packages required by tests installed.'),
+            click.option(
+                '--registry', metavar='REGISTRY',
+                help='Registry to share layered images through, local storage by default.'),
+            click.option(
+                '--reuse-prepared', is_flag=True,
+                help='Use an image of a container prepared the same way, commit one if missing.')
             ] + super().options(how)
 
     def default(self, option: str, default: Any = None) -> Any:
@@ -311,6 +380,15 @@ class ProvisionPodman(tmt.steps.provision.ProvisionPlugin):
 
         data = PodmanGuestData(**data_from_options)
 
+        # Start from an image with required packages installed
+        if self.get('layered') and not self.opt('dry'):
+            data.image = self._layered_image(data.image, force_pull=data.force_pull)
+            data.force_pull = False
+
+        # Look for a container prepared the same way
+        if self.get('reuse-prepared') and not self.opt('dry'):
+            data.prepare_fingerprint = self.prepare_fingerprint()
+
         # Create a new GuestTestcloud instance and start it
         self._guest = GuestContainer(
             logger=self._logger,
@@ -319,6 +397,106 @@ class ProvisionPodman(tmt.steps.provision.ProvisionPlugin):
             parent=self.step)
         self._guest.start()
 
+    def _podman(self, command: Command, message: str) -> tmt.utils.CommandOutput:
+        """ Run given command via podman """
+        return self.run(Command('podman') + command, message=message)
+
+    def _layered_image(self, image: str, force_pull: bool = False) -> str:
+        """
+        Image with packages required by tests installed on top of the given one
+
+        The image is tagged by a hash of the base image id and lists of
+        packages. An existing image is reused from local storage or from
+        the registry, a new one is built and pushed to the registry. If
+        the build fails, the base image is used.
+        """
+        # FIXME: cast() - https://github.com/teemtee/tmt/issues/1372
+        prepare = cast(tmt.steps.provision.Provision, self.step).plan.prepare
+        requires = prepare.required_packages()
+        recommends = prepare.recommended_packages()
+
+        if not requires and not recommends:
+            return image
+
+        # Make sure the base image is available to get its id
+        needs_pull = force_pull
+        if not needs_pull:
+            try:
+                self._podman(
+                    Command('image', 'exists', image),
+                    message=f"Check for container image '{image}'.")
+            except tmt.utils.RunError:
+                needs_pull = True
+
+        if needs_pull:
+            self._podman(Command('pull', '-q', image), message=f"Pull image '{image}'.")
+
+        image_id = self._podman(
+            Command('image', 'inspect', '--format', '{{.Id}}', image),
+            message=f"Inspect image '{image}'.").stdout
+        assert image_id is not None  # narrow type
+
+        digest = hashlib.sha256(json.dumps({
+            'image': image_id.strip(),
+            'requires': sorted(requires),
+            'recommends': sorted(recommends)
+            }).encode('utf-8')).hexdigest()
+
+        registry = self.get('registry') or 'localhost'
+        layered_image = f'{registry}/{LAYERED_IMAGE_REPOSITORY}:{digest}'
+        self.info('layer', layered_image, 'green')
+
+        try:
+            self._podman(
+                Command('image', 'exists', layered_image),
+                message=f"Check for layered image '{layered_image}'.")
+            return layered_image
+        except tmt.utils.RunError:
+            pass
+
+        if self.get('registry'):
+            try:
+                self._podman(
+                    Command('pull', '-q', layered_image),
+                    message=f"Pull layered image '{layered_image}'.")
+                return layered_image
+            except tmt.utils.RunError:
+                self.debug(f"Layered image '{layered_image}' not found in the registry.")
+
+        self.info('progress', 'building layered image...', 'cyan')
+        script = ['if command -v dnf >/dev/null; then pm=dnf; else pm=yum; fi']
+        if requires:
+            script.append(f'$pm install -y {" ".join(map(quote, requires))}')
+        if recommends:
+            script.append(
+                f'{{ $pm install -y --skip-broken {" ".join(map(quote, recommends))} || true; }}')
+        script.append('$pm clean all')
+        containerfile = f'FROM {image}\nRUN {" && ".join(script)}\n'
+
+        # Packages not installable at build time, e.g. provided by repos
+        # enabled by prepare phases, are left to the prepare step
+        with tempfile.TemporaryDirectory() as context:
+            (Path(context) / 'Containerfile').write_text(containerfile)
+            try:
+                self._podman(
+                    Command('build', '-q', '-t', layered_image, context),
+                    message=f"Build layered image '{layered_image}'.")
+            except tmt.utils.RunError as error:
+                self.warn(
+                    f"Failed to build layered image '{layered_image}', "
+                    f"using image '{image}' instead: {error}")
+                return image
+
+        if self.get('registry'):
+            try:
+                self._podman(
+                    Command('push', '-q', layered_image),
+                    message=f"Push layered image '{layered_image}'.")
+            except tmt.utils.RunError as error:
+                self.warn(f"Failed to push layered image '{layered_image}': {error}")
+
+        return layered_image
+
     def guest(self) -> Optional[GuestContainer]:
         """ Return the provisioned guest """
         return self._guest
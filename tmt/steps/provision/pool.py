@@ -0,0 +1,277 @@
+"""
+Pool of warm guests shared by runs
+
+Instead of removing a guest once a run is finished, provision plugins may
+return it to the pool, and a following run asking for the same kind of
+guest may check it out instead of provisioning a new one. The pool is a
+plain directory, each pooled guest has its own subdirectory containing
+the ``entry.yaml`` file with guest data, plus any files the guest needs,
+e.g. ssh keys. Access to the pool is serialized by a file lock, so the
+pool is safe to use from concurrent runs.
+"""
+
+import contextlib
+import dataclasses
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Generator, List, Optional
+
+import tmt.log
+import tmt.utils
+from tmt.utils import WORKDIR_ROOT, Path
+
+# Directory holding pooled guests
+POOL_ROOT = (
+    Path(os.environ['TMT_WORKDIR_ROOT']) if os.getenv('TMT_WORKDIR_ROOT') else WORKDIR_ROOT
+    ) / 'pool'
+
+# File used to lock the whole pool
+POOL_LOCK_FILENAME = 'pool.lock'
+
+# File describing a single pooled guest
+POOL_ENTRY_FILENAME = 'entry.yaml'
+
+# Guests idle for longer than this many seconds are not handed out again
+POOL_MAX_IDLE = 24 * 60 * 60
+
+# Guests checked out for longer than this many seconds are considered
+# abandoned, even if the run which checked them out is still alive
+POOL_MAX_BUSY = 7 * 24 * 60 * 60
+
+# Seconds to wait for a connection to a guest checked out from the pool
+POOL_CONNECT_TIMEOUT = 60
+
+# States of pool entries
+STATE_IDLE = 'idle'
+STATE_BUSY = 'busy'
+
+
+@dataclasses.dataclass
+class PoolEntry:
+    """ A single guest stored in the pool """
+
+    #: Directory holding the entry.
+    path: Path
+
+    #: Key describing the kind of guest, see :py:meth:`GuestPool.key`.
+    key: str
+
+    #: Either idle, waiting in the pool, or busy, checked out by a run.
+    state: str
+
+    #: Time of the last state change.
+    updated: str
+
+    #: Serialized guest data.
+    guest: Dict[str, Any]
+
+    #: Pid of the process which checked out the guest.
+    owner: Optional[int] = None
+
+    #: The guest has been idle or busy for too long and should not be
+    #: used anymore, set by :py:meth:`GuestPool.checkout`.
+    expired: bool = False
+
+    @property
+    def id(self) -> str:
+        return self.path.name
+
+    @property
+    def idle_time(self) -> float:
+        """ Number of seconds since the last state change """
+        updated = datetime.datetime.fromisoformat(self.updated)
+        return (datetime.datetime.now(datetime.timezone.utc) - updated).total_seconds()
+
+    @property
+    def is_abandoned(self) -> bool:
+        """ Busy guest whose owner is gone or which is checked out for too long """
+        if self.state != STATE_BUSY:
+            return False
+
+        if self.idle_time > POOL_MAX_BUSY:
+            return True
+
+        if self.owner is None:
+            return False
+
+        try:
+            os.kill(self.owner, 0)
+
+        except ProcessLookupError:
+            return True
+
+        # The process exists, it just belongs to another user
+        except PermissionError:
+            pass
+
+        return False
+
+    @classmethod
+    def load(cls, path: Path) -> 'PoolEntry':
+        data = tmt.utils.yaml_to_dict((path / POOL_ENTRY_FILENAME).read_text())
+        return PoolEntry(
+            path=path,
+            key=data['key'],
+            state=data['state'],
+            updated=data['updated'],
+            guest=data['guest'],
+            owner=data.get('owner'))
+
+    def save(self) -> None:
+        """ Update the entry file, replace the old one atomically """
+        self.updated = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        entry_path = self.path / POOL_ENTRY_FILENAME
+        new_entry_path = self.path / f'{POOL_ENTRY_FILENAME}.new'
+        new_entry_path.write_text(tmt.utils.dict_to_yaml({
+            'key': self.key,
+            'state': self.state,
+            'updated': self.updated,
+            'guest': self.guest,
+            'owner': self.owner
+            }))
+        new_entry_path.replace(entry_path)
+
+
+class GuestPool:
+    """ Warm guests waiting in a directory for the next run """
+
+    def __init__(self, *, path: Path = POOL_ROOT, logger: tmt.log.Logger) -> None:
+        self.path = path
+        self._logger = logger
+
+    @staticmethod
+    def key(**properties: Any) -> str:
+        """
+        Create a key identifying a kind of guest
+
+        Guests are matched by the key, it should be created from all
+        properties which make guests different, like the provision
+        method, image, architecture or hardware.
+        """
+        serialized = json.dumps(properties, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    @contextlib.contextmanager
+    def _locked(self) -> Generator[None, None, None]:
+        """ Hold the pool lock """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path / POOL_LOCK_FILENAME, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _entries(self) -> List[PoolEntry]:
+        """ Load all entries, the oldest first. Lock must be held. """
+        entries: List[PoolEntry] = []
+
+        for path in self.path.iterdir():
+            if not (path / POOL_ENTRY_FILENAME).exists():
+                continue
+
+            try:
+                entries.append(PoolEntry.load(path))
+
+            except (OSError, KeyError, tmt.utils.GeneralError) as error:
+                self._logger.warn(f"Ignoring broken pool entry '{path}': {error}")
+
+        return sorted(entries, key=lambda entry: entry.updated)
+
+    def entries(self) -> List[PoolEntry]:
+        """ List all pooled guests, the oldest first """
+        if not self.path.exists():
+            return []
+
+        with self._locked():
+            return self._entries()
+
+    def checkout(self, key: str) -> Optional[PoolEntry]:
+        """
+        Take an idle guest of the given kind out of the pool
+
+        The guest which has been waiting for the longest time is picked.
+        Guests idle for longer than :py:data:`POOL_MAX_IDLE` are checked
+        out too, as well as abandoned busy guests, whose owner process
+        is gone or which have been checked out for longer than
+        :py:data:`POOL_MAX_BUSY`. Such entries are marked as expired and
+        it is up to the caller to discard them.
+
+        :returns: the entry of the guest, ``None`` if there is no guest
+            of the given kind available.
+        """
+        if not self.path.exists():
+            return None
+
+        with self._locked():
+            for entry in self._entries():
+                if entry.key != key:
+                    continue
+
+                if entry.state == STATE_IDLE:
+                    entry.expired = entry.idle_time > POOL_MAX_IDLE
+
+                elif entry.is_abandoned:
+                    self._logger.debug(
+                        f"Reclaiming abandoned guest '{entry.id}' from the pool.", level=2)
+                    entry.expired = True
+
+                else:
+                    continue
+
+                entry.state = STATE_BUSY
+                entry.owner = os.getpid()
+                entry.save()
+
+                self._logger.debug(f"Checked out guest '{entry.id}' from the pool.", level=2)
+                return entry
+
+        return None
+
+    def checkin(
+            self,
+            key: str,
+            guest: Dict[str, Any],
+            *,
+            path: Optional[Path] = None,
+            files: Optional[List[Path]] = None) -> PoolEntry:
+        """
+        Return a guest to the pool
+
+        :param key: key describing the kind of guest.
+        :param guest: serialized guest data.
+        :param path: directory of the entry the guest has been checked
+            out with, a new entry is created for freshly provisioned
+            guests.
+        :param files: files to be kept together with the guest, as long as
+            it lives in the pool. Files are stored in the entry directory
+            under their original names.
+        :returns: the entry of the guest.
+        """
+        with self._locked():
+            if path is None or not (path / POOL_ENTRY_FILENAME).exists():
+                path = Path(tempfile.mkdtemp(prefix='guest-', dir=self.path))
+
+            for source in files or []:
+                if source.parent != path:
+                    shutil.copy2(source, path / source.name)
+
+            entry = PoolEntry(path=path, key=key, state=STATE_IDLE, updated='', guest=guest)
+            entry.save()
+
+        self._logger.debug(f"Returned guest '{entry.id}' to the pool.", level=2)
+        return entry
+
+    def discard(self, path: Path) -> None:
+        """ Forget a guest, it is not usable anymore """
+        with self._locked():
+            shutil.rmtree(path, ignore_errors=True)
+
+        self._logger.debug(f"Discarded guest '{path.name}' from the pool.", level=2)
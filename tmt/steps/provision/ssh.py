@@ -0,0 +1,160 @@
+"""
+Master ssh connection shared by commands run against a guest
+
+Every guest reachable over ssh has a single master connection, and all
+ssh commands, rsync transfers and ansible runs are multiplexed over its
+socket instead of connecting to the guest again. The master is checked
+before each use, and when it is gone, e.g. because the guest has been
+rebooted, a new one is established transparently.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import tmt.utils
+from tmt.utils import Command, Path
+
+# Seconds to wait for the socket of a new master connection to appear
+SSH_MASTER_SOCKET_TIMEOUT = 5
+
+# How often to check whether the socket has appeared
+SSH_MASTER_SOCKET_TICK = 0.05
+
+# Seconds to wait for the master process to terminate
+SSH_MASTER_CLOSE_TIMEOUT = 3
+
+
+class SshMaster:
+    """
+    Multiplexed master connection to a single guest
+
+    :param parent: owner of the connection, used for logging.
+    """
+
+    def __init__(self, *, parent: tmt.utils.Common) -> None:
+        self.parent = parent
+
+        self.process: Optional['subprocess.Popen[bytes]'] = None
+        self._socket_path: Optional[Path] = None
+        self._socket_ready = False
+        self._lock = threading.Lock()
+
+        #: Number of master connections established.
+        self.established = 0
+
+        #: Number of commands which used an already running master.
+        self.reused = 0
+
+    @property
+    def socket(self) -> Path:
+        """ Path to the master connection socket """
+        if not self._socket_path:
+            # Use '/run/user/uid' if it exists, '/tmp' otherwise
+            run_dir = Path(f"/run/user/{os.getuid()}")
+            if run_dir.is_dir():
+                socket_dir = run_dir / "tmt"
+            else:
+                socket_dir = Path("/tmp")
+            socket_dir.mkdir(exist_ok=True)
+            self._socket_path = Path(tempfile.mktemp(dir=socket_dir))
+        return self._socket_path
+
+    @property
+    def is_alive(self) -> bool:
+        """ Master process is running and its socket has not been removed """
+        if self.process is None or self.process.poll() is not None:
+            return False
+
+        if self.socket.exists():
+            self._socket_ready = True
+            return True
+
+        # The master may be still logging in, unless the socket is gone
+        return not self._socket_ready
+
+    def _wait_for_socket(self) -> None:
+        """ Give the new master a moment to log in and create its socket """
+        assert self.process is not None  # narrow type
+
+        deadline = time.monotonic() + SSH_MASTER_SOCKET_TIMEOUT
+
+        while time.monotonic() < deadline:
+            if self.socket.exists():
+                self._socket_ready = True
+                return
+
+            # Failed to connect, commands will connect on their own
+            if self.process.poll() is not None:
+                self.parent.debug(
+                    f"The master ssh connection failed with exit code "
+                    f"{self.process.returncode}.", level=3)
+                return
+
+            time.sleep(SSH_MASTER_SOCKET_TICK)
+
+        self.parent.debug("The master ssh connection is not ready yet.", level=3)
+
+    def connect(self, command: Command) -> None:
+        """
+        Make sure a healthy master connection is running
+
+        :param command: command establishing the master connection.
+        """
+        with self._lock:
+            if self.is_alive:
+                self.reused += 1
+                return
+
+            # The connection is gone, e.g. the guest has been rebooted
+            if self.process is not None:
+                self.parent.debug(
+                    "The master ssh connection is closed, create a new one.", level=3)
+                self._close()
+
+            self.parent.debug(f"Create the master ssh connection: {command}")
+            self.process = subprocess.Popen(
+                command.to_popen(),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+            self.established += 1
+
+            self._wait_for_socket()
+
+    def _close(self) -> None:
+        """ Terminate the master process and remove its socket """
+        if self.process is not None:
+            self.parent.debug("Close the master ssh connection.", level=3)
+            try:
+                self.process.terminate()
+                self.process.wait(timeout=SSH_MASTER_CLOSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                pass
+            self.process = None
+
+        self._socket_ready = False
+
+        if self._socket_path and self._socket_path.exists():
+            self.parent.debug(f"Remove ssh socket '{self._socket_path}'.", level=3)
+            try:
+                self._socket_path.unlink()
+            except OSError as error:
+                self.parent.debug(f"Failed to remove the socket: {error}", level=3)
+
+    def close(self) -> None:
+        """ Close the master connection """
+        with self._lock:
+            self._close()
+
+    def report(self) -> None:
+        """ Log how many times the connection has been established and reused """
+        if not self.established:
+            return
+
+        self.parent.debug(
+            f"The master ssh connection has been established {self.established} "
+            f"time(s) and reused by {self.reused} command(s).", level=2)
@@ -5,6 +5,7 @@ import datetime
 import os
 import platform
 import re
+import shutil
 import time
 import types
 from typing import TYPE_CHECKING, List, Optional, Union
@@ -18,6 +19,7 @@ import tmt
 import tmt.steps
 import tmt.steps.provision
 import tmt.utils
+from tmt.steps.provision.images import ImageCache, image_name
 from tmt.utils import (WORKDIR_ROOT, Command, Path, ProvisionError,
                        ShellScript, retry_session)
 
@@ -52,6 +54,8 @@ TESTCLOUD_DATA = (
     Path(os.environ['TMT_WORKDIR_ROOT']) if os.getenv('TMT_WORKDIR_ROOT') else WORKDIR_ROOT
     ) / 'testcloud'
 TESTCLOUD_IMAGES = TESTCLOUD_DATA / 'images'
+TESTCLOUD_CACHE = TESTCLOUD_DATA / 'cache'
+TESTCLOUD_SNAPSHOTS = TESTCLOUD_DATA / 'snapshots'
 
 # Userdata for cloud-init
 USER_DATA = """#cloud-config
@@ -198,13 +202,16 @@ class TestcloudGuestData(tmt.steps.provision.GuestSshData):
     arch: str = DEFAULT_ARCH
 
     image_url: Optional[str] = None
+    image_checksum: Optional[str] = None
     instance_name: Optional[str] = None
     list_local_images: bool = False
+    snapshot: Optional[str] = None
 
 
 @dataclasses.dataclass
 class ProvisionTestcloudData(TestcloudGuestData, tmt.steps.provision.ProvisionStepData):
-    pass
+    pool: bool = False
+    reuse_prepared: bool = False
 
 
 class GuestTestcloud(tmt.GuestSsh):
@@ -219,17 +226,20 @@ class GuestTestcloud(tmt.GuestSsh):
         disk ....... disk size for vm
         connection . either session (default) or system, to be passed to qemu
         arch ....... architecture for the VM, host arch is the default
+        snapshot ... save the disk of the prepared guest to this path
     """
 
     _data_class = TestcloudGuestData
 
     image: str
     image_url: Optional[str]
+    image_checksum: Optional[str]
     instance_name: Optional[str]
     memory: int
     disk: str
     connection: str
     arch: str
+    snapshot: Optional[str]
 
     # Not to be saved, recreated from image_url/instance_name/... every
     # time guest is instantiated.
@@ -389,6 +399,14 @@ class GuestTestcloud(tmt.GuestSsh):
             self.image_url = self._guess_image_url(self.image_url)
             self.debug(f"Guessed image url: '{self.image_url}'", level=3)
 
+        # Remote qcow2 images are downloaded into the content-addressed
+        # cache, testcloud then finds them prepared under their names
+        if self._is_cached_image:
+            if not (TESTCLOUD_IMAGES / image_name(self.image_url)).exists():
+                self.info('progress', 'downloading...', 'cyan')
+            self._image_cache.fetch(
+                self.image_url, image_name(self.image_url), checksum=self.image_checksum)
+
         # Initialize and prepare testcloud image
         assert testcloud is not None
         self._image = testcloud.image.Image(self.image_url)
@@ -396,7 +414,9 @@ class GuestTestcloud(tmt.GuestSsh):
         if not Path(self._image.local_path).exists():
             self.info('progress', 'downloading...', 'cyan')
         try:
-            self._image.prepare()
+            # Link local images instead of copying them, instance disks
+            # are just overlays backed by the read-only base image
+            self._image.prepare(copy=False)
         except FileNotFoundError as error:
             raise ProvisionError(
                 f"Image '{self._image.local_path}' not found.") from error
@@ -409,6 +429,22 @@ class GuestTestcloud(tmt.GuestSsh):
             raise ProvisionError(
                 f"Failed to prepare image '{self.image_url}'.") from error
 
+        # Boot the snapshot of a guest prepared the same way, if there is
+        # one, its disk is an overlay of the base image prepared above
+        if self.prepare_fingerprint:
+            digest = self._image_cache.digest(image_name(self.image_url)) \
+                if self._is_cached_image else None
+            if digest is None:
+                stat = Path(self._image.local_path).stat()
+                digest = f'{self._image.local_path}:{stat.st_size}:{stat.st_mtime_ns}'
+            self.bind_prepare_fingerprint(digest)
+            snapshot = TESTCLOUD_SNAPSHOTS / f'{self.prepare_fingerprint}.qcow2'
+            if snapshot.exists():
+                self.info('snapshot', 'restoring the prepared guest', 'green')
+                self._image = testcloud.image.Image(f'file://{snapshot}')
+                self._image.prepare(copy=False)
+                self.prepared = True
+
         # Prepare hostname (get rid of possible unwanted characters)
         hostname = re.sub(r"[^a-zA-Z0-9\-]+", "-", self.name.lower()).strip("-")
 
@@ -423,7 +459,7 @@ class GuestTestcloud(tmt.GuestSsh):
         self.verbose('name', self.instance_name, 'green')
 
         # Decide if we want to multiply timeouts when emulating an architecture
-        time_coeff = NON_KVM_TIMEOUT_COEF if not self._instance.kvm else 1
+        time_coeff = self._time_coeff()
 
         # Decide which networking setup to use
         # Autodetect works with libguestfs python bindings
@@ -455,6 +491,8 @@ class GuestTestcloud(tmt.GuestSsh):
         assert libvirt is not None
         try:
             self._instance.prepare()
+            self._pin_image(Path(self._instance.local_disk))
+            self._save_clean_disk()
             self._instance.spawn_vm()
             self._instance.start(DEFAULT_BOOT_TIMEOUT * time_coeff)
         except (testcloud.exceptions.TestcloudInstanceError,
@@ -481,6 +519,154 @@ class GuestTestcloud(tmt.GuestSsh):
                 f"for non-kvm instance...")
             time.sleep(NON_KVM_ADDITIONAL_WAIT)
 
+    @property
+    def _image_cache(self) -> ImageCache:
+        return ImageCache(path=TESTCLOUD_CACHE, links=TESTCLOUD_IMAGES, logger=self._logger)
+
+    @property
+    def _is_cached_image(self) -> bool:
+        """ Remote qcow2 images are stored in the image cache """
+        return self.image_url is not None and re.match(
+            r'^https?://.*\.qcow2$', self.image_url) is not None
+
+    def _pin_image(self, holder: Path) -> None:
+        """ Keep the cached base image as long as the holder is backed by it """
+        if self._is_cached_image:
+            assert self.image_url is not None  # narrow type
+            self._image_cache.pin(image_name(self.image_url), holder)
+
+    @property
+    def _clean_disk(self) -> Optional[Path]:
+        """ Copy of the instance disk as it was before the first boot """
+        if self._instance is None:
+            return None
+        disk = Path(self._instance.local_disk)
+        return disk.with_name(f'{disk.stem}-clean{disk.suffix}')
+
+    def _save_clean_disk(self) -> None:
+        """
+        Keep the fresh instance disk to reset the guest for the pool
+
+        Guests booted from a prepared snapshot are not clean, there is
+        nothing to revert them to.
+        """
+        clean_disk = self._clean_disk
+        if self.pool_key is None or self.prepared or clean_disk is None:
+            return
+
+        assert self._instance is not None  # narrow type
+        try:
+            shutil.copyfile(self._instance.local_disk, clean_disk)
+        except OSError as error:
+            self.warn(f"Failed to save the clean disk, guest will not be pooled: {error}")
+            return
+        self._pin_image(clean_disk)
+
+    def reset(self) -> bool:
+        """
+        Revert the guest to the state it was in before the first boot
+
+        The guest is shut down, its disk replaced with the copy saved
+        before the first boot, and started again. Everything done by
+        preparation and tests is gone.
+        """
+        clean_disk = self._clean_disk
+        if self._instance is None or clean_disk is None or not clean_disk.exists():
+            self.debug('No clean disk to revert the guest to.')
+            return False
+
+        self.debug(f"Reset guest '{self.guest}' to its clean disk.")
+        self._shut_down()
+        try:
+            shutil.copyfile(clean_disk, self._instance.local_disk)
+        except OSError as error:
+            self.warn(f"Failed to revert the guest disk: {error}")
+            return False
+        self._boot_again()
+        return True
+
+    def _shut_down(self) -> None:
+        """ Shut the guest down and wait until it is off """
+        try:
+            self.execute(Command('shutdown', '-h', 'now'))
+        except tmt.utils.RunError as error:
+            # The connection is closed by the guest going down
+            if error.returncode != 255:
+                raise
+
+        def check_shut_down() -> None:
+            if self.is_ready:
+                raise tmt.utils.WaitingIncomplete()
+
+        try:
+            tmt.utils.wait(
+                self,
+                check_shut_down,
+                datetime.timedelta(seconds=DEFAULT_BOOT_TIMEOUT * self._time_coeff()),
+                tick=1)
+        except tmt.utils.WaitingTimedOutError:
+            raise ProvisionError('Failed to shut down the guest.')
+        self._ssh_master_close()
+
+    def _boot_again(self) -> None:
+        """ Start the guest which has been shut down and connect to it """
+        assert self._instance is not None  # narrow type
+        assert testcloud is not None
+        assert libvirt is not None
+        time_coeff = self._time_coeff()
+        try:
+            self._instance.start(DEFAULT_BOOT_TIMEOUT * time_coeff)
+        except (testcloud.exceptions.TestcloudInstanceError,
+                libvirt.libvirtError) as error:
+            raise ProvisionError(f'Failed to start testcloud instance ({error}).')
+
+        if not self.reconnect(timeout=DEFAULT_CONNECT_TIMEOUT * time_coeff, tick=1):
+            raise ProvisionError(
+                f"Failed to connect in {DEFAULT_CONNECT_TIMEOUT * time_coeff}s.")
+
+    def _time_coeff(self) -> int:
+        """ Multiply timeouts when emulating an architecture """
+        return NON_KVM_TIMEOUT_COEF if self._instance and not self._instance.kvm else 1
+
+    def save_snapshot(self) -> None:
+        """
+        Save the disk of the prepared guest
+
+        The instance disk is a small overlay holding just the changes
+        made to the base image. It is saved to the path given by the
+        'snapshot' key, and under the fingerprint of the preparation
+        for later guests prepared the same way. The guest is shut down
+        for the disk to be consistent and started again once the
+        snapshot is saved.
+        """
+        if self._instance is None or self.opt('dry'):
+            return
+
+        snapshots: List[Path] = []
+        if self.snapshot:
+            snapshots.append(Path(self.snapshot).expanduser().absolute())
+        if self.prepare_fingerprint and not self.prepared:
+            snapshots.append(TESTCLOUD_SNAPSHOTS / f'{self.prepare_fingerprint}.qcow2')
+        if not snapshots:
+            return
+
+        for snapshot in snapshots:
+            self.info('snapshot', str(snapshot), 'green')
+
+        self._shut_down()
+
+        for snapshot in snapshots:
+            snapshot.parent.mkdir(parents=True, exist_ok=True)
+            new_snapshot = snapshot.with_name(f'{snapshot.name}.new')
+            try:
+                shutil.copyfile(self._instance.local_disk, new_snapshot)
+                new_snapshot.replace(snapshot)
+            except OSError as error:
+                raise ProvisionError(f"Failed to save snapshot '{snapshot}': {error}")
+            self._pin_image(snapshot)
+
+        self._boot_again()
+
     def stop(self) -> None:
         """ Stop provisioned guest """
         super().stop()
@@ -568,11 +754,48 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
 
     In addition to the qcow2 format, vagrant boxes can be used as well,
     testcloud will take care of unpacking the image for you.
+
+    Downloaded qcow2 images are cached by their content, use the
+    'image-checksum' option to verify the download. Set the
+    TMT_IMAGE_CACHE_SIZE environment variable to limit the total size
+    of cached images in bytes, least recently used images are removed
+    once the limit is exceeded.
+
+    Use the 'snapshot' option to save the disk of the guest once it
+    is prepared. The snapshot is a small overlay of the base image, use
+    it as the image of later guests to skip their preparation:
+
+        provision:
+            how: virtual
+            image: fedora
+            snapshot: /var/tmp/images/fedora-prepared.qcow2
+
+    Enable the 'reuse-prepared' option to save a snapshot of the guest
+    once it is prepared, and to boot the snapshot instead of the base
+    image next time a guest with the same provision and prepare data
+    is requested. Preparation of the restored guest is skipped:
+
+        provision:
+            how: virtual
+            image: fedora
+            reuse-prepared: true
+
+    Enable the 'pool' option to keep the guest running once the plan
+    is finished, and to reuse it in the next run asking for the same
+    image, architecture, memory and disk size. The guest is reverted
+    to its state before the first boot when returned to the pool:
+
+        provision:
+            how: virtual
+            image: fedora
+            pool: true
     """
 
     _data_class = ProvisionTestcloudData
     _guest_class = GuestTestcloud
 
+    _pool_keys = ['image', 'arch', 'memory', 'disk', 'connection', 'user', 'key']
+
     # Guest instance
     _guest = None
 
@@ -584,6 +807,9 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
                 '-i', '--image', metavar='IMAGE',
                 help='Select image to be used. Provide a short name, '
                      'full path to a local file or a complete url.'),
+            click.option(
+                '--image-checksum', metavar='CHECKSUM',
+                help='Expected sha256 checksum of the downloaded image.'),
             click.option(
                 '-m', '--memory', metavar='MEMORY', type=int,
                 help='Set available memory in MB, 2048 MB by default.'),
@@ -607,6 +833,15 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
             click.option(
                 '--list-local-images', is_flag=True,
                 help="List locally available images."),
+            click.option(
+                '--snapshot', metavar='PATH',
+                help="Save the disk of the prepared guest to be used as an image later."),
+            click.option(
+                '--reuse-prepared', is_flag=True,
+                help="Boot a snapshot of a guest prepared the same way, save one if missing."),
+            click.option(
+                '--pool', is_flag=True,
+                help="Reuse a warm guest from the pool, return the guest there when done."),
             ] + super().options(how)
 
     def go(self) -> None:
@@ -655,6 +890,17 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
             elif value is not None:
                 self.info(key, value, 'green')
 
+        # Try a warm guest from the pool first
+        if self.get('pool') and not self.opt('dry'):
+            self._guest = self.checkout_guest(data)
+            if self._guest is not None:
+                return
+            data.pool_key = self.pool_key(data)
+
+        # Look for a guest prepared the same way
+        if self.get('reuse-prepared') and not self.opt('dry'):
+            data.prepare_fingerprint = self.prepare_fingerprint()
+
         # Create a new GuestTestcloud instance and start it
         self._guest = GuestTestcloud(
             logger=self._logger,
@@ -683,6 +929,18 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
                 f"Directory '{TESTCLOUD_IMAGES}' does not exist.", shift=2)
             return True
         successful = True
+        for directory in (TESTCLOUD_CACHE, TESTCLOUD_SNAPSHOTS):
+            if not directory.exists():
+                continue
+            if dry:
+                clean.verbose(f"Would remove '{directory}'.", shift=2)
+            else:
+                clean.verbose(f"Removing '{directory}'.", shift=2)
+                try:
+                    shutil.rmtree(directory)
+                except OSError:
+                    clean.fail(f"Failed to remove '{directory}'.", shift=2)
+                    successful = False
         for image in TESTCLOUD_IMAGES.iterdir():
             if dry:
                 clean.verbose(f"Would remove '{image}'.", shift=2)
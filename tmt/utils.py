@@ -5,13 +5,16 @@ import contextlib
 import copy
 import dataclasses
 import datetime
+import fcntl
 import functools
+import hashlib
 import io
 import json
 import os
 import pathlib
 import pprint
 import re
+import selectors
 import shlex
 import shutil
 import signal
@@ -19,6 +22,7 @@ import subprocess
 import sys
 import tempfile
 import textwrap
+import threading
 import time
 import unicodedata
 import urllib.parse
@@ -108,6 +112,21 @@ log = fmf.utils.Logging('tmt').logger
 WORKDIR_ROOT = Path('/var/tmp/tmt')
 WORKDIR_MAX = 1000
 
+# Environment variables controlling the git mirror cache
+GIT_CACHE_VARIABLE = 'TMT_GIT_CACHE'
+GIT_CACHE_DISABLE_VARIABLE = 'TMT_NO_GIT_CACHE'
+GIT_CACHE_SIZE_VARIABLE = 'TMT_GIT_CACHE_SIZE'
+GIT_CACHE_MAX_AGE_VARIABLE = 'TMT_GIT_CACHE_MAX_AGE'
+
+# Mirrors not used for this many seconds are removed from the cache
+GIT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Default limit of the total size of git mirrors, in bytes
+GIT_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+# Refs fetched into git mirrors, refs like pull requests are left out
+GIT_MIRROR_REFSPECS = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
+
 # Maximum number of lines of stdout/stderr to show upon errors
 OUTPUT_LINES = 100
 # Default output width
@@ -132,6 +151,13 @@ PROCESS_TIMEOUT = 124
 # Default select.select(timeout) in seconds
 DEFAULT_SELECT_TIMEOUT = 5
 
+# Maximal size of output chunks read from command pipes at once
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# Only this many bytes of the end of command output are kept in memory and
+# reported, complete output can be streamed into a file
+OUTPUT_TAIL_SIZE = 1024 * 1024
+
 # Default shell and options to be set for all shell scripts
 DEFAULT_SHELL = "/bin/bash"
 SHELL_OPTIONS = 'set -eo pipefail'
@@ -248,67 +274,100 @@ class Config:
                 f"Unable to save last run '{self.path}'.\n{error}")
 
 
-# TODO: `StreamLogger` is a dedicated thread fillowing given stream, passing their content to
-# tmt's logging methods. Thread is needed because of some amount of blocking involved in the
-# process, but it has a side effect of `NO_COLOR` envvar being ignored. When tmt spots `NO_COLOR`
-# envvar, it flips a `color` flag in its Click context. But since contexts are thread-local,
-# thread powering `StreamLogger` is not aware of this change, and all Click methods it calls
-# - namely `echo` and `style` in depths of logging code - would still apply colors depending on
-# tty setup.
-#
-# Passing Click context from the main thread to `StreamLogger` instances to replace their context
-# is one way to solve it, another might be logging being more explicit and transparent, e.g. with
-# https://github.com/teemtee/tmt/issues/1565.
-class StreamLogger(Thread):
+class StreamReader:
     """
-    Reading pipes of running process in threads.
+    Collect and log output of a running process read from one of its pipes.
 
-    Code based on:
-    https://github.com/packit/packit/blob/main/packit/utils/logging.py#L10
+    Only the last :py:data:`OUTPUT_TAIL_SIZE` bytes of output are kept in
+    memory and reported as the output. If ``output_file`` is given, the
+    complete output is appended to this file as it arrives. Complete
+    lines are passed to the given logger. Streams are read by
+    :py:class:`OutputPump`.
     """
 
     def __init__(
             self,
             log_header: str,
             *,
-            stream: Optional[IO[bytes]] = None,
             logger: Optional[BaseLoggerFnType] = None,
-            click_context: Optional[click.Context] = None) -> None:
-        super().__init__(daemon=True)
-
-        self.stream = stream
-        self.output: List[str] = []
+            click_context: Optional[click.Context] = None,
+            output_file: Optional[Path] = None) -> None:
         self.log_header = log_header
         self.logger = logger
         self.click_context = click_context
+        self.output_file = output_file
 
-    def run(self) -> None:
-        if self.stream is None:
-            return
+        self.output: Optional[IO[bytes]] = None
+        if output_file is not None:
+            try:
+                self.output = open(output_file, 'ab')
+            except OSError as error:
+                raise FileError(f"Failed to write '{output_file}'.\n{error}")
+
+        self.done = threading.Event()
+        #: Exception raised while processing the output in the pump thread.
+        self.error: Optional[Exception] = None
+        self._partial_line = b''
+        self._tail = bytearray()
+        self._truncated = False
 
+    def _log(self, line: bytes) -> None:
         if self.logger is None:
             return
 
+        # Logging happens in the pump thread, click context of the thread which
+        # started the command must be used, e.g. to respect `NO_COLOR` envvar.
         if self.click_context is not None:
             click.globals.push_context(self.click_context)
 
-        for _line in self.stream:
-            line = _line.decode('utf-8', errors='replace')
-            if line != '':
-                self.logger(
-                    self.log_header,
-                    line.rstrip('\n'),
-                    'yellow',
-                    level=3)
-            self.output.append(line)
+        try:
+            self.logger(
+                self.log_header,
+                line.decode('utf-8', errors='replace').rstrip('\n'),
+                'yellow',
+                level=3)
+
+        finally:
+            if self.click_context is not None:
+                click.globals.pop_context()
+
+    def feed(self, chunk: bytes) -> None:
+        """ Process a chunk of output """
+        if self.output is not None:
+            self.output.write(chunk)
+            self.output.flush()
+
+        self._tail += chunk
+        if len(self._tail) > OUTPUT_TAIL_SIZE:
+            del self._tail[:-OUTPUT_TAIL_SIZE]
+            self._truncated = True
+
+        *lines, self._partial_line = (self._partial_line + chunk).split(b'\n')
+        for line in lines:
+            self._log(line)
+
+    def close(self) -> None:
+        """ Process the end of output """
+        if self._partial_line:
+            self._log(self._partial_line)
+            self._partial_line = b''
+
+        if self.output is not None:
+            self.output.close()
+
+        self.done.set()
 
     def get_output(self) -> Optional[str]:
-        return "".join(self.output)
+        tail = bytes(self._tail)
+        # Do not start in the middle of a line if the beginning is gone
+        if self._truncated and b'\n' in tail:
+            tail = tail.split(b'\n', 1)[1]
+        return tail.decode('utf-8', errors='replace')
 
 
-class UnusedStreamLogger(StreamLogger):
+class UnusedStreamReader(StreamReader):
     """
-    Special variant of :py:class:`StreamLogger` that records no data.
+    Special variant of :py:class:`StreamReader` that records no data.
 
     It is designed to make the implementation of merged streams easier in
     :py:meth:`Command.run`. Instance of this class is created to log ``stderr``
@@ -318,14 +377,98 @@ class UnusedStreamLogger(StreamLogger):
 
     def __init__(self, log_header: str) -> None:
         super().__init__(log_header)
-
-    def run(self) -> None:
-        pass
+        self.done.set()
 
     def get_output(self) -> Optional[str]:
         return None
 
 
+class OutputPump:
+    """
+    Read output of all running processes in a single thread.
+
+    Instead of spawning reader threads for each process, pipes of all
+    processes started by :py:meth:`Command.run` are watched by a single
+    selector, and their output is handed over to corresponding
+    :py:class:`StreamReader` instances.
+    """
+
+    _instance: Optional['OutputPump'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+
+        # A pipe used to interrupt waiting when a new stream is added
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+        self._thread = Thread(target=self._run, name='output-pump', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls) -> 'OutputPump':
+        """ Return the pump shared by all commands, start it if needed """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = OutputPump()
+
+            return cls._instance
+
+    def add(self, stream: IO[bytes], reader: StreamReader) -> None:
+        """ Start reading the given stream """
+        with self._lock:
+            self._selector.register(stream.fileno(), selectors.EVENT_READ, (stream, reader))
+
+        os.write(self._wakeup_write, b'.')
+
+    def _run(self) -> None:
+        while True:
+            for key, _ in self._selector.select():
+                # Just a wakeup, new stream has been added
+                if key.data is None:
+                    with contextlib.suppress(BlockingIOError):
+                        os.read(self._wakeup_read, 4096)
+                    continue
+
+                stream, reader = key.data
+
+                try:
+                    chunk = os.read(key.fd, OUTPUT_CHUNK_SIZE)
+
+                except OSError:
+                    chunk = b''
+
+                if chunk:
+                    # Failing reader must not stop the pump, the error is
+                    # raised later in the thread which started the command
+                    try:
+                        reader.feed(chunk)
+                        continue
+
+                    except Exception as error:
+                        reader.error = error
+
+                self._finish(key.fd, stream, reader)
+
+    def _finish(self, fd: int, stream: IO[bytes], reader: StreamReader) -> None:
+        """ Stop reading the stream, let the reader know no more output comes """
+        with self._lock:
+            self._selector.unregister(fd)
+
+        try:
+            stream.close()
+            reader.close()
+
+        except Exception as error:
+            reader.error = reader.error or error
+
+        finally:
+            reader.done.set()
+
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #  Common
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -445,6 +588,7 @@ class Command:
             join: bool = False,
             interactive: bool = False,
             timeout: Optional[int] = None,
+            output_file: Optional[Path] = None,
             # Logging
             message: Optional[str] = None,
             friendly_command: Optional[str] = None,
@@ -468,6 +612,9 @@ class Command:
             interaction with user.
         :param timeout: if set, command would be interrupted, if still running,
             after this many seconds.
+        :param output_file: if set, complete command output would be appended
+            to this file as it arrives. Only the last
+            :py:data:`OUTPUT_TAIL_SIZE` bytes of output are returned.
         :param message: if set, it would be logged for more friendly logging.
         :param friendly_command: if set, it would be logged instead of the
             command itself, to improve visibility of the command in logging output.
@@ -558,25 +705,27 @@ class Command:
         except FileNotFoundError as exc:
             raise RunError(f"File '{exc.filename}' not found.", self, 127, caller=caller) from exc
 
-        # Create and start stream loggers
-        stdout_logger = StreamLogger(
+        # Create stream readers, let the shared pump feed them
+        assert process.stdout is not None  # narrow type
+        pump = OutputPump.get()
+
+        stdout_logger = StreamReader(
             'out',
-            stream=process.stdout,
             logger=output_logger,
-            click_context=click.get_current_context(silent=True))
+            click_context=click.get_current_context(silent=True),
+            output_file=output_file)
+        pump.add(process.stdout, stdout_logger)
 
         if join:
-            stderr_logger: StreamLogger = UnusedStreamLogger('err')
+            stderr_logger: StreamReader = UnusedStreamReader('err')
 
         else:
-            stderr_logger = StreamLogger(
+            assert process.stderr is not None  # narrow type
+            stderr_logger = StreamReader(
                 'err',
-                stream=process.stderr,
                 logger=output_logger,
                 click_context=click.get_current_context(silent=True))
-
-        stdout_logger.start()
-        stderr_logger.start()
+            pump.add(process.stderr, stderr_logger)
 
         # A bit of logging helpers for debugging duration behavior
         start_timestamp = time.monotonic()
@@ -603,12 +752,17 @@ class Command:
 
         log_event('waiting for stream readers')
 
-        stdout_logger.join()
+        stdout_logger.done.wait()
         log_event('stdout reader done')
 
-        stderr_logger.join()
+        stderr_logger.done.wait()
         log_event('stderr reader done')
 
+        # Report problems which occurred while processing the output
+        for reader in (stdout_logger, stderr_logger):
+            if reader.error is not None:
+                raise reader.error
+
         # Handle the exit code, return output
         if process.returncode != 0:
             logger.debug(f"Command returned '{process.returncode}'.", level=3)
@@ -1019,7 +1173,8 @@ class Common(_CommonBase):
             interactive: bool = False,
             join: bool = False,
             log: Optional[BaseLoggerFnType] = None,
-            timeout: Optional[int] = None) -> CommandOutput:
+            timeout: Optional[int] = None,
+            output_file: Optional[Path] = None) -> CommandOutput:
         """
         Run command, give message, handle errors
 
@@ -1031,6 +1186,9 @@ class Common(_CommonBase):
         A user friendly command string 'friendly_command' will be shown,
         if provided, at the beginning of the command output.
 
+        Output can be streamed into 'output_file' instead of being kept
+        in memory, only its tail is returned then.
+
         Returns named tuple CommandOutput.
         """
 
@@ -1051,6 +1209,7 @@ class Common(_CommonBase):
             join=join,
             log=log,
             timeout=timeout,
+            output_file=output_file,
             caller=self,
             logger=self._logger
             )
@@ -3580,6 +3739,228 @@ def get_distgit_handler_names() -> List[str]:
     return [i.usage_name for i in DistGitHandler.__subclasses__()]
 
 
+def _cache_limit(variable: str, default: Optional[int] = None) -> Optional[int]:
+    """ Read a numeric cache limit from the environment """
+    value = os.getenv(variable)
+    if not value:
+        return default
+
+    try:
+        return int(value)
+
+    except ValueError:
+        raise GeneralError(f"Invalid value '{value}' of '{variable}', number expected.")
+
+
+class GitMirrorCache:
+    """
+    Bare mirrors of remote git repositories shared by runs
+
+    Each repository is mirrored just once, under the digest of its url,
+    and the mirror is updated by ``git fetch`` whenever the repository
+    is cloned again. Clones borrow objects from the mirror, only objects
+    missing in the mirror are downloaded. Access to each mirror is
+    serialized by a lock file, so the cache is safe to use from
+    concurrent runs.
+
+    Just branches and tags are mirrored, other refs, e.g. pull requests
+    of forges, would make mirrors needlessly big.
+
+    :param path: directory holding mirrors and their lock files, read
+        from the ``TMT_GIT_CACHE`` environment variable, ``~/.cache/tmt/git``
+        by default.
+    :param budget: maximum total size of mirrors in bytes, read from the
+        ``TMT_GIT_CACHE_SIZE`` environment variable, 5 GiB by default.
+    :param max_age: mirrors not used for this many seconds are removed,
+        read from the ``TMT_GIT_CACHE_MAX_AGE`` environment variable,
+        30 days by default.
+    """
+
+    def __init__(
+            self,
+            *,
+            path: Optional[Path] = None,
+            budget: Optional[int] = None,
+            max_age: Optional[int] = None,
+            logger: tmt.log.Logger) -> None:
+        if path is None and os.getenv(GIT_CACHE_VARIABLE):
+            path = Path(os.environ[GIT_CACHE_VARIABLE])
+
+        # Home directory is not known in some environments, e.g. when
+        # running as an arbitrary user in a container, look it up just
+        # when the cache is actually used
+        if path is None:
+            path = Path(os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache') / 'tmt' / 'git'
+
+        self.path = path
+        self.budget = budget if budget is not None else _cache_limit(
+            GIT_CACHE_SIZE_VARIABLE, GIT_CACHE_SIZE)
+        self.max_age = max_age if max_age is not None else _cache_limit(
+            GIT_CACHE_MAX_AGE_VARIABLE, GIT_CACHE_MAX_AGE)
+        self._logger = logger
+
+    @staticmethod
+    def enabled() -> bool:
+        """ Mirrors are used unless disabled by ``TMT_NO_GIT_CACHE`` """
+        return not os.getenv(GIT_CACHE_DISABLE_VARIABLE)
+
+    @staticmethod
+    def is_remote(url: str) -> bool:
+        """ Check whether the url points to a remote repository worth mirroring """
+        if url.startswith('file://'):
+            return False
+
+        return '://' in url or re.match(r'^[\w.-]+@[\w.-]+:', url) is not None
+
+    def mirror(self, url: str) -> Path:
+        """ Path to the mirror of the given url """
+        return self.path / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.git"
+
+    def entries(self) -> List[Path]:
+        """ Cached mirrors, the least recently used first """
+        if not self.path.exists():
+            return []
+
+        return sorted(
+            (entry for entry in self.path.iterdir() if entry.suffix == '.git'),
+            key=lambda entry: entry.stat().st_mtime)
+
+    @staticmethod
+    def _size(mirror: Path) -> int:
+        """ Total size of files in the mirror """
+        return sum(
+            (Path(root) / filename).lstat().st_size
+            for root, _, filenames in os.walk(mirror)
+            for filename in filenames)
+
+    @contextlib.contextmanager
+    def _locked(self, name: str, *, blocking: bool = True) -> Generator[bool, None, None]:
+        """ Hold the lock of the given name, report whether it has been acquired """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path / f'{name}.lock', 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _update(
+            self,
+            url: str,
+            mirror: Path,
+            common: Common,
+            env: Optional[EnvironmentType] = None,
+            create: bool = True) -> bool:
+        """ Create or update the mirror, return ``False`` if not usable. Lock must be held. """
+        fetch = Command('git', 'fetch', '--prune', url, *GIT_MIRROR_REFSPECS)
+
+        if mirror.exists():
+            common.debug(f"Update git mirror '{mirror}' of '{url}'.", level=3)
+            try:
+                common.run(fetch, cwd=mirror, env=env)
+
+            # Objects of an outdated mirror are still worth borrowing
+            except RunError as error:
+                common.debug(f"Failed to update git mirror of '{url}': {error}", level=3)
+
+            return True
+
+        if not create:
+            return False
+
+        common.debug(f"Create git mirror '{mirror}' of '{url}'.", level=3)
+        new_mirror = mirror.with_suffix('.new')
+        shutil.rmtree(new_mirror, ignore_errors=True)
+        try:
+            common.run(Command('git', 'init', '-q', '--bare', str(new_mirror)), env=env)
+            common.run(fetch, cwd=new_mirror, env=env)
+
+        except RunError as error:
+            common.debug(f"Failed to mirror '{url}': {error}", level=3)
+            shutil.rmtree(new_mirror, ignore_errors=True)
+            return False
+
+        new_mirror.rename(mirror)
+        return True
+
+    @contextlib.contextmanager
+    def borrow(
+            self,
+            url: str,
+            common: Common,
+            env: Optional[EnvironmentType] = None,
+            create: bool = True) -> Generator[Optional[Path], None, None]:
+        """
+        Provide an up-to-date mirror of the url
+
+        The mirror is locked while in use, and must not be referenced
+        once the context is left, clones have to be dissociated from it.
+
+        :param url: url of the repository.
+        :param common: used to run git commands for appropriate logging.
+        :param env: environment of git commands.
+        :param create: if not set, just an existing mirror is provided.
+        :yields: path to the mirror, ``None`` if the repository could
+            not be mirrored or is not mirrored yet and should not be.
+        """
+        mirror = self.mirror(url)
+
+        with self._locked(mirror.stem):
+            if not self._update(url, mirror, common, env=env, create=create):
+                yield None
+                return
+
+            # Mark the mirror as recently used
+            os.utime(mirror)
+            yield mirror
+
+        self.evict(keep=mirror)
+
+    def evict(self, keep: Optional[Path] = None) -> List[Path]:
+        """
+        Remove mirrors which are too old or do not fit the budget
+
+        Mirrors not used for longer than the maximum age are removed
+        first, then the least recently used ones until the cache fits
+        the budget. Mirrors in use by other runs are skipped.
+
+        :param keep: mirror which must not be removed, e.g. the one just
+            used.
+        :returns: removed mirrors.
+        """
+        removed: List[Path] = []
+
+        with self._locked('cache'):
+            entries = self.entries()
+            sizes = {entry: self._size(entry) for entry in entries} if self.budget else {}
+            size = sum(sizes.values())
+            now = time.time()
+
+            for entry in entries:
+                expired = self.max_age is not None and now - entry.stat().st_mtime > self.max_age
+                oversized = self.budget is not None and size > self.budget
+                if entry == keep or not (expired or oversized):
+                    continue
+
+                with self._locked(entry.stem, blocking=False) as acquired:
+                    if not acquired:
+                        continue
+
+                    self._logger.debug(f"Evicting git mirror '{entry.name}'.", level=2)
+                    shutil.rmtree(entry, ignore_errors=True)
+                    size -= sizes.get(entry, 0)
+                    removed.append(entry)
+
+        return removed
+
+
 def git_clone(
         url: str,
         destination: Path,
@@ -3593,9 +3974,36 @@ def git_clone(
     For shallow=True attempt to clone repository using --depth=1 option first.
     If not successful attempt to clone whole repo.
 
+    Remote repositories are mirrored in the :py:class:`GitMirrorCache`,
+    clones borrow objects from the mirror and are dissociated from it
+    afterwards. Shallow clones are not needed then, the whole history
+    is available locally. Shallow clones do not create new mirrors
+    though, a full mirror would take longer to download.
+
     Common instance is used to run the command for appropriate logging.
     Environment is updated by 'env' dictionary.
     """
+    if GitMirrorCache.enabled() and GitMirrorCache.is_remote(url):
+        try:
+            cache = GitMirrorCache(logger=common._logger)
+            with cache.borrow(url, common, env=env, create=not shallow) as mirror:
+                if mirror is not None:
+                    try:
+                        return common.run(
+                            Command(
+                                'git', 'clone',
+                                '--reference', str(mirror), '--dissociate',
+                                url, str(destination)
+                                ), env=env)
+                    except RunError as error:
+                        common.debug(
+                            f"Failed to clone '{url}' using the mirror: {error}", level=3)
+
+        # The cache may be not writable, e.g. in a sandbox, or the home
+        # directory may be unknown
+        except (OSError, KeyError, RuntimeError) as error:
+            common.debug(f"Git mirror cache is not available: {error}", level=3)
+
     depth = ['--depth=1'] if shallow else []
     try:
         return common.run(
@@ -3609,7 +4017,7 @@ def git_clone(
             # Do not retry if shallow was not used
             raise
         # Git server might not support shallow cloning, try again
-        return git_clone(url, destination, common, env, shallow=False)
+        return common.run(Command('git', 'clone', url, str(destination)), env=env)
 
 
 # ignore[type-arg]: base class is a generic class, but we cannot list its parameter type, because
@@ -3995,7 +4403,8 @@ def wait(
         check: WaitCheckType[T],
         timeout: datetime.timedelta,
         tick: float = DEFAULT_WAIT_TICK,
-        tick_increase: float = DEFAULT_WAIT_TICK_INCREASE
+        tick_increase: float = DEFAULT_WAIT_TICK_INCREASE,
+        tick_max: Optional[float] = None
         ) -> T:
     """
     Wait for a condition to become true.
@@ -4021,6 +4430,7 @@ def wait(
     :param tick: how many seconds to wait between two consecutive calls of
         ``check``.
     :param tick_increase: a multiplier applied to ``tick`` after every attempt.
+    :param tick_max: if set, ``tick`` never grows beyond this many seconds.
     :returns: value returned by ``check`` reporting success.
     :raises GeneralError: when ``tick`` is not a positive integer.
     :raises WaitingTimedOutError: when time quota has been consumed.
@@ -4087,6 +4497,9 @@ def wait(
 
             tick *= tick_increase
 
+            if tick_max is not None:
+                tick = min(tick, tick_max)
+
             continue
 
 